@@ -31,6 +31,7 @@ def process_agent_response(agent_response: dict, user_query: str, session_id: st
         message_id=message_id,
         session_id=session_id,
         intent=intent,
+        intent_source=agent_response.get("intent_source", "llm"),
         role = 'user',
         content = user_query,
         rewrited_query=rewrited_query,
@@ -81,3 +82,9 @@ def get_agent_service() -> RecipeAgentService:
     return agent_service
 
 
+def get_optional_agent_service() -> Optional[RecipeAgentService]:
+    """
+    获取 Agent 服务,未初始化时返回 None(调用方退回数据库查询)
+    """
+    from .main import agent_service
+    return agent_service
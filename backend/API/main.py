@@ -5,6 +5,7 @@ from fastapi.responses import StreamingResponse, JSONResponse
 from contextlib import asynccontextmanager
 import uuid
 import logging
+import signal
 from typing import Optional
 from ..logging_config import setup_logging
 from ..config import Settings
@@ -27,12 +28,17 @@ async def lifespan(app: FastAPI):
         settings = Settings()
         # 初始化数据库管理器（同步操作）
         db_manager = DatabaseManager(database_url=settings.DB_URL)
+        # 已有数据库补充新增的列
+        db_manager.ensure_chat_message_columns()
         # 启动时探活数据库连接，便于尽早发现配置或服务问题
         logger.info("数据库管理器初始化成功")
         
         # 初始化Agent服务
         agent_service = RecipeAgentService(db_manager=db_manager)
         logger.info("Agent服务初始化成功")
+        # kill -HUP <pid> 触发索引热加载(与 POST /api/admin/reload 等价)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda signum, frame: agent_service and agent_service.reload_index(background=True))
         
         logger.info("应用启动完成")
         yield
@@ -66,9 +72,10 @@ app.add_middleware(
 )
 
 # 延迟导入路由以避免循环导入
-from .routes import chat, surf
+from .routes import chat, surf, admin
 app.include_router(chat.router, prefix="/api")
 app.include_router(surf.router, prefix="/api")
+app.include_router(admin.router, prefix="/api")
 
 
 
@@ -86,7 +93,11 @@ async def health_check():
     return {
         "status": "healthy",
         "agent_service": agent_service is not None,
-        "db_manager": db_manager is not None
+        "db_manager": db_manager is not None,
+        "index_generation": agent_service.generation if agent_service else None,
+        "cache_stats": agent_service.get_cache_stats() if agent_service else {},
+        "retrieval_stats": agent_service.get_retrieval_stats() if agent_service else {},
+        "memory_stats": agent_service.get_memory_stats() if agent_service else {}
     }
 
 
@@ -0,0 +1,35 @@
+import secrets
+from fastapi import APIRouter, Depends, Header, HTTPException
+from typing import Optional
+from ..schema import ApiResponse
+from ..dependency import get_agent_service, create_api_response, create_error_response
+from ...modules.agent_service import RecipeAgentService
+from ...config import Settings
+
+
+def verify_admin_token(x_admin_token: Optional[str] = Header(default=None)):
+    """校验请求头中的管理令牌;未配置 ADMIN_TOKEN 时管理接口不可用"""
+    admin_token = Settings().ADMIN_TOKEN
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="管理接口未启用,请配置 ADMIN_TOKEN")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=403, detail="管理令牌无效")
+
+
+router = APIRouter(prefix="/admin", tags=["管理API"], dependencies=[Depends(verify_admin_token)])
+
+
+@router.post("/reload", response_model=ApiResponse, description="后台加载新一代索引并无缝切换")
+async def reload_index(agent_service: RecipeAgentService = Depends(get_agent_service)):
+    """
+    触发索引热加载: 新一代索引在后台线程中构建,完成后原子切换,进行中的请求不受影响
+    """
+    if not agent_service.reload_index(background=True):
+        return create_error_response(message="已有索引热加载任务在运行", code=409, error_type="ReloadInProgress")
+    return create_api_response(data=agent_service.get_reload_status(), message="索引热加载已开始")
+
+
+@router.get("/reload/status", response_model=ApiResponse, description="获取索引热加载状态")
+async def reload_status(agent_service: RecipeAgentService = Depends(get_agent_service)):
+    """获取热加载状态和当前索引代数"""
+    return create_api_response(data=agent_service.get_reload_status())
@@ -33,7 +33,7 @@ async def chat_query(
     user_query, user_filters = request.message, request.filters
     
     try:
-        agent_response = agent_service.query(user_query, user_filters, streaming=True)
+        agent_response = await agent_service.aquery(user_query, user_filters, streaming=True)
         yield_answer, user_chatmessage,recipes = process_agent_response(agent_response, user_query, session_id, message_id)
         # 先保存用户消息
         db_manager.save_chat_message(user_chatmessage, db_session)
@@ -51,6 +51,7 @@ async def chat_query(
                     session_id=session_id,
                     message_id=message_id + 1,  # AI 消息 ID
                     intent = user_chatmessage.intent,
+                    intent_source = user_chatmessage.intent_source,
                     rewrited_query=user_chatmessage.rewrited_query,
                     sources=recipes,
                     role="assistant",
@@ -6,32 +6,44 @@ from ..schema import (
     RecipeListResponse,
     RecipeDetail
 )
-from ..dependency import get_db_manager, create_api_response, create_error_response
+from ..dependency import get_db_manager, get_optional_agent_service, create_api_response, create_error_response
 
 
 router = APIRouter(prefix="/surf", tags=["浏览API"])
 
 @router.get("/recipes", response_model=ApiResponse, description='获取菜谱列表')
-async def get_recipe_list(query: RecipeListQuery = Depends(), db_manager=Depends(get_db_manager)):
+async def get_recipe_list(query: RecipeListQuery = Depends(), db_manager=Depends(get_db_manager),
+                          agent_service=Depends(get_optional_agent_service)):
     """
     获取菜谱列表，支持按分类和难度过滤
+    Agent 服务就绪时由内存分面索引过滤、计数和分页，只用一条 IN 查询取当前页的菜谱ID；
+    Agent 服务未就绪，或当前页有菜谱尚未入库（分面索引的计数与数据库不一致）时查询数据库
     """
     try:
         # 提取查询参数  
         category = query.category
-        difficulty = query.difficulty
+        difficulty = query.difficulty.value if query.difficulty else None
         page = query.page
         page_size = query.page_size
         # 根据参数获取对应的食谱列表（同步方法，无需 await）
-        total, recipes = db_manager.select_recipes(page, page_size, category, difficulty)
+        listed = None
+        if agent_service is not None:
+            total, recipes = agent_service.rag_engine.document_processor.list_recipes(page, page_size, category, difficulty)
+            recipe_ids = db_manager.select_recipe_ids_by_parent_ids([recipe.parent_id for recipe in recipes])
+            # 详情接口按数据库ID查询;有菜谱尚未入库时总数和分页都以数据库为准
+            if all(recipe.parent_id in recipe_ids for recipe in recipes):
+                listed = [(recipe_ids[recipe.parent_id], recipe) for recipe in recipes]
+        if listed is None:
+            total, recipes = db_manager.select_recipes(page, page_size, category, difficulty)
+            listed = [(recipe.id, recipe) for recipe in recipes]
         recipes_previews_list = [
             RecipePreview(
-                id=recipe.id,
+                id=recipe_id,
                 name=recipe.name,
                 category=recipe.category,
                 difficulty=recipe.difficulty,
                 preview=recipe.content[:100] + "..." if len(recipe.content) > 100 else recipe.content
-            ) for recipe in recipes
+            ) for recipe_id, recipe in listed
         ]
         response_data = RecipeListResponse(
             total=total,
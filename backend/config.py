@@ -27,7 +27,87 @@ class Settings(BaseSettings):
     CHUNKS_PATH: str = os.getenv("CHUNKS_PATH", "chunks")
     PARENT_CHILD_MAP_PATH: str = os.getenv("PARENT_CHILD_MAP_PATH", "parent_child_map")
     INDEX_PATH: str = os.getenv("INDEX_PATH", "index")
+    MANIFEST_PATH: str = os.getenv("MANIFEST_PATH", "manifest.json")
+    INCREMENTAL_INDEX: bool = os.getenv("INCREMENTAL_INDEX", "true").lower() == "true"
+    # 批量入库命令行(python -m backend.ingest): 进程数(0表示全部CPU核)、每个检查点分段的文件数、检查点目录
+    INGEST_NUM_WORKERS: int = int(os.getenv("INGEST_NUM_WORKERS", "0"))
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+    INGEST_CHECKPOINT_PATH: str = os.getenv("INGEST_CHECKPOINT_PATH", "ingest_checkpoint")
     EMBEDDING_MODEL_NAME: str = os.getenv("EMBEDDING_MODEL_NAME", "NONE")
+    EMBEDDING_DEVICE: str = os.getenv("EMBEDDING_DEVICE", "cpu")
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    EMBEDDING_NUM_WORKERS: int = int(os.getenv("EMBEDDING_NUM_WORKERS", "0"))
+    EMBEDDING_CACHE_PATH: str = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache")
+    QUERY_EMBEDDING_CACHE_SIZE: int = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+    QUERY_EMBEDDING_CACHE_TTL: int = int(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+    # 向量索引类型: flat / hnsw / ivf_pq / ivf_sq8
+    ANN_INDEX_TYPE: str = os.getenv("ANN_INDEX_TYPE", "flat")
+    ANN_PCA_DIM: int = int(os.getenv("ANN_PCA_DIM", "0"))
+    ANN_TRUNCATE_DIM: int = int(os.getenv("ANN_TRUNCATE_DIM", "0"))
+    ANN_HNSW_M: int = int(os.getenv("ANN_HNSW_M", "32"))
+    ANN_HNSW_EF_CONSTRUCTION: int = int(os.getenv("ANN_HNSW_EF_CONSTRUCTION", "200"))
+    ANN_HNSW_EF_SEARCH: int = int(os.getenv("ANN_HNSW_EF_SEARCH", "64"))
+    ANN_IVF_NLIST: int = int(os.getenv("ANN_IVF_NLIST", "64"))
+    ANN_IVF_NPROBE: int = int(os.getenv("ANN_IVF_NPROBE", "8"))
+    ANN_PQ_M: int = int(os.getenv("ANN_PQ_M", "16"))
+    # 分词器: 菜谱词典与前缀词典缓存目录; 是否只保留语料中出现过的默认词典词(加载更快)
+    TOKENIZER_CACHE_PATH: str = os.getenv("TOKENIZER_CACHE_PATH", "tokenizer")
+    TOKENIZER_TRIM_DICT: bool = os.getenv("TOKENIZER_TRIM_DICT", "true").lower() == "true"
+    # BM25参数
+    BM25_K1: float = float(os.getenv("BM25_K1", "1.5"))
+    BM25_B: float = float(os.getenv("BM25_B", "0.75"))
+    # 混合检索: 各检索分支共享的线程池大小、等待分支结果的截止时间(毫秒,0表示等待全部分支)
+    RETRIEVAL_MAX_WORKERS: int = int(os.getenv("RETRIEVAL_MAX_WORKERS", "4"))
+    RETRIEVAL_DEADLINE_MS: int = int(os.getenv("RETRIEVAL_DEADLINE_MS", "2000"))
+    # 检索结果融合: 方法(rrf / minmax / zscore)、分支权重(如 "vector:1.0,bm25:0.8")、RRF平滑参数
+    FUSION_METHOD: str = os.getenv("FUSION_METHOD", "rrf")
+    FUSION_WEIGHTS: str = os.getenv("FUSION_WEIGHTS", "")
+    FUSION_RRF_K: int = int(os.getenv("FUSION_RRF_K", "60"))
+    # 重排合批: 是否跨请求合批、每批最大 pair 数、收到首个请求后的最长等待(毫秒)
+    RERANK_BATCHING: bool = os.getenv("RERANK_BATCHING", "true").lower() == "true"
+    RERANK_MAX_BATCH: int = int(os.getenv("RERANK_MAX_BATCH", "32"))
+    RERANK_MAX_WAIT_MS: float = float(os.getenv("RERANK_MAX_WAIT_MS", "5"))
+    # 重排分数缓存: 条数与过期秒数(0表示不过期),索引代数变化时清空
+    RERANK_CACHE_SIZE: int = int(os.getenv("RERANK_CACHE_SIZE", "10000"))
+    RERANK_CACHE_TTL: int = int(os.getenv("RERANK_CACHE_TTL", "3600"))
+    # 召回-重排级联: 是否启用、召回候选数N、送入重排的前M条、最终返回数、判定断崖的分数差、至少保留条数、每次请求的检索延迟预算(毫秒)
+    RERANK_CASCADE: bool = os.getenv("RERANK_CASCADE", "true").lower() == "true"
+    CASCADE_RECALL_K: int = int(os.getenv("CASCADE_RECALL_K", "20"))
+    CASCADE_RERANK_K: int = int(os.getenv("CASCADE_RERANK_K", "10"))
+    CASCADE_FINAL_K: int = int(os.getenv("CASCADE_FINAL_K", "6"))
+    CASCADE_SCORE_GAP: float = float(os.getenv("CASCADE_SCORE_GAP", "0.3"))
+    CASCADE_MIN_KEEP: int = int(os.getenv("CASCADE_MIN_KEEP", "2"))
+    CASCADE_BUDGET_MS: int = int(os.getenv("CASCADE_BUDGET_MS", "1500"))
+    # 原料组合查询("我只有X、Y可以做什么"): 是否走原料倒排索引、返回菜谱数、排序方式(missing 缺少原料数 / coverage 原料覆盖率)
+    INGREDIENT_SEARCH_ENABLED: bool = os.getenv("INGREDIENT_SEARCH_ENABLED", "true").lower() == "true"
+    INGREDIENT_TOP_K: int = int(os.getenv("INGREDIENT_TOP_K", "5"))
+    INGREDIENT_RANK_BY: str = os.getenv("INGREDIENT_RANK_BY", "missing")
+    # 回溯父文档时使用进程内父菜谱存储(启动和热加载时构建),关闭时每次批量查询数据库
+    PARENT_STORE_ENABLED: bool = os.getenv("PARENT_STORE_ENABLED", "true").lower() == "true"
+    # 父文档和子块使用索引的共享子块存储视图;关闭时常驻为 Document 列表(旧布局,用于内存对比)
+    SHARED_CHUNK_STORE: bool = os.getenv("SHARED_CHUNK_STORE", "true").lower() == "true"
+    # 存储目录保留的代数(当前代与上一代供仍在服务的旧引擎读取),更早的代在切换后删除
+    STORE_KEEP_GENERATIONS: int = int(os.getenv("STORE_KEEP_GENERATIONS", "2"))
+    # 构建提示词上下文时使用结构化菜谱记录(原料、用量、步骤),关闭时使用Markdown原文
+    CONTEXT_FROM_RECORDS: bool = os.getenv("CONTEXT_FROM_RECORDS", "true").lower() == "true"
+    # 查询分析: 重写、意图识别和过滤条件抽取合并为一次大模型调用(解析失败时退回两次调用)、是否把问题中抽取的分类/难度用于检索过滤
+    QUERY_ANALYSIS_COMBINED: bool = os.getenv("QUERY_ANALYSIS_COMBINED", "true").lower() == "true"
+    QUERY_ANALYSIS_FILTERS: bool = os.getenv("QUERY_ANALYSIS_FILTERS", "true").lower() == "true"
+    # 本地意图分类: 是否启用、最近质心直接采用所需的相似度差、每个意图的最少样本数、训练样本上限、直接采用问题抽样交给大模型复核的比例、统计日志间隔、直接采用时是否同时跳过查询重写
+    INTENT_CLASSIFIER_ENABLED: bool = os.getenv("INTENT_CLASSIFIER_ENABLED", "true").lower() == "true"
+    INTENT_CENTROID_MARGIN: float = float(os.getenv("INTENT_CENTROID_MARGIN", "0.1"))
+    INTENT_MIN_EXAMPLES: int = int(os.getenv("INTENT_MIN_EXAMPLES", "20"))
+    INTENT_TRAINING_LIMIT: int = int(os.getenv("INTENT_TRAINING_LIMIT", "5000"))
+    INTENT_SHADOW_RATE: float = float(os.getenv("INTENT_SHADOW_RATE", "0.05"))
+    INTENT_LOG_EVERY: int = int(os.getenv("INTENT_LOG_EVERY", "100"))
+    INTENT_SKIP_REWRITE: bool = os.getenv("INTENT_SKIP_REWRITE", "false").lower() == "true"
+    # 语义结果缓存: 是否启用、条数、过期秒数(0表示不过期)、命中所需的最低余弦相似度
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+    SEMANTIC_CACHE_SIZE: int = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+    SEMANTIC_CACHE_TTL: int = int(os.getenv("SEMANTIC_CACHE_TTL", "1800"))
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+    # 管理接口令牌, /api/admin 接口需要携带 X-Admin-Token 请求头;为空时管理接口不可用
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
     MODEL_NAME: str = os.getenv("MODEL_NAME", "NONE")
     DEEPSEEK_API_KEY: str = os.getenv("DEEPSEEK_API_KEY", "NONE")
     DB_URL: str = os.getenv("DB_URL", "None")
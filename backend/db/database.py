@@ -2,19 +2,28 @@
 SQLAlchemy 数据库模型定义
 包含菜谱管理、聊天会话、聊天消息和文档块的数据表
 """
+import logging
 from langchain_core.documents import Document
 from sqlalchemy import (
     create_engine, Column, Integer, String, Text, 
-    Enum, TIMESTAMP, JSON, ForeignKey, Index
+    Enum, TIMESTAMP, JSON, ForeignKey, Index,
+    Table, bindparam, delete, insert, select, update, inspect, or_, text
 )
-from typing import List
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from typing import Any, Dict, List, Tuple
 from typing import Optional
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker,Mapped, mapped_column,Session
 from sqlalchemy.sql import func
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 Base = declarative_base()
 
+DIFFICULTY_VALUES = {'非常简单', '简单', '中等', '困难', '非常困难', '未知'}
+
 
 class Recipe(Base):
     """菜谱表"""
@@ -72,6 +81,7 @@ class ChatMessage(Base):
     )
     content:Mapped[str] = mapped_column(Text, nullable=False, comment='消息内容')
     intent:Mapped[Optional[str]] = mapped_column(String(50), comment='意图（list/detail/general）')
+    intent_source:Mapped[Optional[str]] = mapped_column(String(20), comment='意图来源（llm/local/ingredient，为空表示大模型）')
     rewrited_query:Mapped[Optional[str]] = mapped_column(Text, comment='重写后的查询')
     sources:Mapped[Optional[List[str]]] = mapped_column(JSON, comment='引用的菜谱来源')
     created_at:Mapped[datetime] = mapped_column(
@@ -146,7 +156,19 @@ class DatabaseManager:
     def create_all_tables(self):
         """创建所有表"""
         Base.metadata.create_all(self.engine)
+        self.ensure_chat_message_columns()
         print("所有表创建成功！")
+
+    def ensure_chat_message_columns(self) -> None:
+        """为已有的 chat_messages 表补充后来新增的 intent_source 列"""
+        try:
+            columns = {column["name"] for column in inspect(self.engine).get_columns(ChatMessage.__tablename__)}
+            if columns and "intent_source" not in columns:
+                with self.engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {ChatMessage.__tablename__} ADD COLUMN intent_source VARCHAR(20)"))
+                logger.info("chat_messages 表已添加 intent_source 列")
+        except Exception as e:
+            logger.error(f"检查 chat_messages 表结构失败: {e}")
     
     def drop_all_tables(self):
         """删除所有表（谨慎使用）"""
@@ -172,22 +194,34 @@ class DatabaseManager:
         print("数据库连接已断开！")
 
 
+    @staticmethod
+    def recipe_row(doc: Document) -> Dict[str, Any]:
+        """父文档 -> recipes 表的一行"""
+        # 规范化难度，确保在枚举集合内或为 None
+        raw_difficulty = doc.metadata.get('difficulty')
+        return {
+            'name': doc.metadata.get('name', 'Unnamed Recipe'),
+            'category': doc.metadata.get('category', 'Uncategorized'),
+            'difficulty': raw_difficulty if raw_difficulty in DIFFICULTY_VALUES else None,
+            'content': doc.page_content,
+            'file_path': doc.metadata.get('source', ''),
+            'parent_id': doc.metadata.get('parent_id', ''),
+        }
+
+    @staticmethod
+    def chunk_row(chunk: Document) -> Dict[str, Any]:
+        """子块 -> document_chunks 表的一行"""
+        return {
+            'chunk_id': chunk.metadata.get('chunk_id', ''),
+            'parent_id': chunk.metadata.get('parent_id', ''),
+            'content': chunk.page_content,
+            'chunk_index': chunk.metadata.get('chunk_index', 0),
+        }
+
     def save_document_to_db(self,doc:Document,session:Session)->None:
         """将文档保存到数据库"""
         try:
-            # 规范化难度，确保在枚举集合内或为 None
-            raw_difficulty = doc.metadata.get('difficulty')
-            difficulty = raw_difficulty if raw_difficulty in {'非常简单','简单','中等','困难','非常困难','未知'} else None
-
-            recipe = Recipe(
-                name=doc.metadata.get('name','Unnamed Recipe'),
-                category=doc.metadata.get('category','Uncategorized'),
-                difficulty=difficulty,
-                content=doc.page_content,
-                file_path=doc.metadata.get('source',''),
-                parent_id=doc.metadata.get('parent_id','')
-            )
-            session.add(recipe)
+            session.add(Recipe(**self.recipe_row(doc)))
             session.commit()
         except Exception as e:
             session.rollback()
@@ -196,18 +230,181 @@ class DatabaseManager:
     def save_chunk_to_db(self,chunk:Document,session:Session)->None:
         """将文档块保存到数据库"""
         try:
-            chunk_obj = DocumentChunk(
-                chunk_id=chunk.metadata.get('chunk_id',''),
-                parent_id=chunk.metadata.get('parent_id',''),
-                content=chunk.page_content,
-                chunk_index=chunk.metadata.get('chunk_index',0)
-            )
-            session.add(chunk_obj)
+            session.add(DocumentChunk(**self.chunk_row(chunk)))
             session.commit()
         except Exception as e:
             session.rollback()
             print(f"保存文档块到数据库失败: {e}")
 
+    # ==================== 批量写入 ====================
+
+    # 每条 IN 查询 / executemany 语句包含的最大行数
+    BULK_BATCH_SIZE = 500
+
+    def upsert_recipes(self, documents: List[Document], session: Session) -> Dict[str, int]:
+        """
+        批量写入菜谱(按 parent_id 插入或更新),单个事务
+        Returns:
+            {"inserted", "updated", "unchanged", "skipped"} 行数;skipped 为与其他菜谱重名而跳过的行
+        """
+        return self._in_transaction(session, lambda: self._upsert_recipes(session, documents))
+
+    def upsert_chunks(self, chunks: List[Document], session: Session) -> Dict[str, int]:
+        """
+        批量写入文档块(按 chunk_id 插入或更新),单个事务
+        Returns:
+            {"inserted", "updated", "unchanged", "skipped"} 行数;skipped 为所属菜谱不在库中而跳过的行
+        """
+        return self._in_transaction(session, lambda: self._upsert_chunks(session, chunks))
+
+    def upsert_documents(self, documents: List[Document], chunks: List[Document], session: Session,
+                         commit: bool = True) -> Dict[str, Dict[str, int]]:
+        """
+        在同一个事务中批量写入菜谱及其文档块,并删除这些菜谱下已不存在的旧文档块
+        重复执行结果不变,可用于全量入库和增量同步
+        Args:
+            commit: 是否提交事务;为False时由调用方与同一事务中的其他写入一起提交或回滚
+        Returns:
+            {"recipes": 菜谱行数统计, "chunks": 文档块行数统计(含 deleted)}
+        """
+        def run() -> Dict[str, Dict[str, int]]:
+            recipe_counts = self._upsert_recipes(session, documents)
+            chunk_counts = self._upsert_chunks(session, chunks)
+            keep = {chunk.metadata.get('chunk_id') for chunk in chunks}
+            chunk_counts['deleted'] = self._prune_chunks(session, [doc.metadata.get('parent_id', '') for doc in documents], keep)
+            return {'recipes': recipe_counts, 'chunks': chunk_counts}
+        return self._in_transaction(session, run) if commit else run()
+
+    @staticmethod
+    def _in_transaction(session: Session, func):
+        """执行批量写入并提交,失败时回滚并抛出异常"""
+        try:
+            result = func()
+            session.commit()
+            return result
+        except Exception as e:
+            session.rollback()
+            logger.error(f"批量写入数据库失败: {e}")
+            raise
+
+    def _upsert_recipes(self, session: Session, documents: List[Document]) -> Dict[str, int]:
+        rows = [self.recipe_row(doc) for doc in documents]
+        # name 也有唯一约束: 与库中其他 parent_id 或本批中靠前的行重名的菜谱跳过
+        owners = dict(self._select_columns(session, Recipe.__table__, 'name', ['parent_id'], [row['name'] for row in rows]))
+        accepted, skipped = [], []
+        for row in rows:
+            owner = owners.setdefault(row['name'], (row['parent_id'],))[0]
+            (accepted if owner == row['parent_id'] else skipped).append(row)
+        if skipped:
+            logger.warning(f"{len(skipped)}个菜谱与已有菜谱重名,已跳过: {[row['file_path'] for row in skipped[:10]]}")
+        counts = self._upsert_rows(session, Recipe.__table__, 'parent_id', accepted)
+        counts['skipped'] = len(skipped)
+        return counts
+
+    def _upsert_chunks(self, session: Session, chunks: List[Document]) -> Dict[str, int]:
+        rows = [self.chunk_row(chunk) for chunk in chunks if chunk.metadata.get('doc_type') == 'child']
+        # 外键约束: 只写入所属菜谱已在库中的文档块(同一事务中刚写入的菜谱可见)
+        parents = {key for key, _ in self._select_columns(session, Recipe.__table__, 'parent_id', [], [row['parent_id'] for row in rows])}
+        accepted = [row for row in rows if row['parent_id'] in parents]
+        counts = self._upsert_rows(session, DocumentChunk.__table__, 'chunk_id', accepted)
+        counts['skipped'] = len(rows) - len(accepted)
+        return counts
+
+    def _prune_chunks(self, session: Session, parent_ids: List[str], keep_chunk_ids: set) -> int:
+        """删除给定菜谱下不在 keep_chunk_ids 中的文档块,返回删除行数"""
+        table = DocumentChunk.__table__
+        stale = [chunk_id for chunk_id, _ in self._select_columns(session, table, 'chunk_id', [], parent_ids, filter_column='parent_id')
+                 if chunk_id not in keep_chunk_ids]
+        for start in range(0, len(stale), self.BULK_BATCH_SIZE):
+            session.execute(delete(table).where(table.c.chunk_id.in_(stale[start:start + self.BULK_BATCH_SIZE])))
+        return len(stale)
+
+    def _select_columns(self, session: Session, table: Table, key: str, columns: List[str], values: List[Any],
+                        filter_column: str = None) -> List[tuple]:
+        """分批按 filter_column(默认为 key)IN values 查询,返回 [(key, (columns...))]"""
+        filter_column = filter_column or key
+        values = list(dict.fromkeys(values))
+        result = []
+        for start in range(0, len(values), self.BULK_BATCH_SIZE):
+            statement = select(table.c[key], *[table.c[column] for column in columns]).where(
+                table.c[filter_column].in_(values[start:start + self.BULK_BATCH_SIZE])
+            )
+            result.extend((row[0], tuple(row[1:])) for row in session.execute(statement))
+        return result
+
+    def _upsert_rows(self, session: Session, table: Table, key: str, rows: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        按唯一键批量插入或更新
+        先查询已有行,内容完全相同的行不再写入;其余行用方言对应的
+        ON CONFLICT DO UPDATE / ON DUPLICATE KEY UPDATE 以 executemany 写入
+        """
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+        if not rows:
+            return counts
+        # 同一批中重复的键只保留最后一次
+        rows = list({row[key]: row for row in rows}.values())
+        columns = [column for column in rows[0] if column != key]
+        existing = dict(self._select_columns(session, table, key, columns, [row[key] for row in rows]))
+        inserts, updates = [], []
+        for row in rows:
+            old = existing.get(row[key])
+            if old is None:
+                inserts.append(row)
+            elif old != tuple(row[column] for column in columns):
+                updates.append(row)
+        counts['inserted'], counts['updated'] = len(inserts), len(updates)
+        counts['unchanged'] = len(rows) - len(inserts) - len(updates)
+
+        dialect = session.get_bind().dialect.name
+        changed = inserts + updates
+        if dialect in ('sqlite', 'postgresql'):
+            statement = (sqlite_insert if dialect == 'sqlite' else postgresql_insert)(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c[key]],
+                set_={column: statement.excluded[column] for column in columns}
+            )
+            self._executemany(session, statement, changed)
+        elif dialect in ('mysql', 'mariadb'):
+            statement = mysql_insert(table)
+            statement = statement.on_duplicate_key_update({column: statement.inserted[column] for column in columns})
+            self._executemany(session, statement, changed)
+        else:
+            # 其他方言: 分别批量插入和按键批量更新
+            self._executemany(session, insert(table), inserts)
+            statement = update(table).where(table.c[key] == bindparam('b_key')).values(
+                {column: bindparam(f'b_{column}') for column in columns}
+            )
+            self._executemany(session, statement, [
+                {'b_key': row[key], **{f'b_{column}': row[column] for column in columns}} for row in updates
+            ])
+        return counts
+
+    def _executemany(self, session: Session, statement, rows: List[Dict[str, Any]]) -> None:
+        for start in range(0, len(rows), self.BULK_BATCH_SIZE):
+            session.execute(statement, rows[start:start + self.BULK_BATCH_SIZE])
+
+    def delete_recipes_by_parent_ids(self,parent_ids:List[str],session:Session)->int:
+        """
+        按parent_id删除菜谱及其文档块（增量索引时用于清理修改或删除的菜谱）
+        不提交事务,由调用方与后续写入一起提交或回滚
+        Raises:
+            删除失败时抛出数据库异常
+        """
+        try:
+            num_deleted = 0
+            for start in range(0, len(parent_ids), self.BULK_BATCH_SIZE):
+                batch = parent_ids[start:start + self.BULK_BATCH_SIZE]
+                session.query(DocumentChunk).filter(DocumentChunk.parent_id.in_(batch)).delete(synchronize_session=False)
+                num_deleted += session.query(Recipe).filter(Recipe.parent_id.in_(batch)).delete(synchronize_session=False)
+            return num_deleted
+        except Exception as e:
+            logger.error(f"删除菜谱失败: {e}")
+            raise
+
+    def select_all_parent_ids(self, session: Session) -> List[str]:
+        """库中所有菜谱的parent_id,用于清理源文件已删除的菜谱;只读一列,查询失败时抛出数据库异常"""
+        return [parent_id for (parent_id,) in session.query(Recipe.parent_id).filter(Recipe.parent_id.isnot(None))]
+
     def select_parent_by_id(self,parent_id:str)->Optional[Recipe]:
         """通过parent_id查询菜谱"""
         try:
@@ -219,6 +416,55 @@ class DatabaseManager:
             print(f"查询菜谱失败: {e}")
             return None
         
+    def select_parents_by_ids(self, parent_ids: List[str]) -> Dict[str, Recipe]:
+        """通过一次 IN 查询批量获取菜谱,返回 parent_id -> 菜谱;超过 BULK_BATCH_SIZE 时分批查询"""
+        result = {}
+        try:
+            session = self.get_session()
+            try:
+                for start in range(0, len(parent_ids), self.BULK_BATCH_SIZE):
+                    batch = parent_ids[start:start + self.BULK_BATCH_SIZE]
+                    for recipe in session.query(Recipe).filter(Recipe.parent_id.in_(batch)):
+                        result[recipe.parent_id] = recipe
+            finally:
+                session.close()
+        except Exception as e:
+            logger.error(f"批量查询菜谱失败: {e}")
+        return result
+
+    def select_recipe_ids_by_parent_ids(self, parent_ids: List[str]) -> Dict[str, int]:
+        """一次 IN 查询获取菜谱主键,返回 parent_id -> id;只读两列,不加载正文"""
+        result = {}
+        try:
+            session = self.get_session()
+            try:
+                for start in range(0, len(parent_ids), self.BULK_BATCH_SIZE):
+                    batch = parent_ids[start:start + self.BULK_BATCH_SIZE]
+                    for parent_id, recipe_id in session.query(Recipe.parent_id, Recipe.id).filter(Recipe.parent_id.in_(batch)):
+                        result[parent_id] = recipe_id
+            finally:
+                session.close()
+        except Exception as e:
+            logger.error(f"批量查询菜谱ID失败: {e}")
+        return result
+
+    def select_intent_examples(self, limit: int) -> List[Tuple[str, str]]:
+        """最近由大模型标注意图的用户问题,用于训练本地意图分类器(不含本地分类器自己的预测);只读两列"""
+        try:
+            session = self.get_session()
+            try:
+                rows = session.query(ChatMessage.content, ChatMessage.intent).filter(
+                    ChatMessage.role == 'user',
+                    ChatMessage.intent.in_(('list', 'detail', 'general')),
+                    or_(ChatMessage.intent_source.is_(None), ChatMessage.intent_source == 'llm')
+                ).order_by(ChatMessage.id.desc()).limit(limit).all()
+            finally:
+                session.close()
+            return [(content, intent) for content, intent in rows]
+        except Exception as e:
+            logger.error(f"查询意图样本失败: {e}")
+            return []
+
     def select_recipes(self,page:int,page_size:int,category:Optional[str]=None,difficulty:Optional[str]=None):
         """查询菜谱列表，支持按分类和难度过滤，分页返回"""
         try:
@@ -18,6 +18,7 @@ CREATE TABLE chat_messages (
     role ENUM('user', 'assistant', 'system'),    -- 角色
     content TEXT NOT NULL,                       -- 消息内容
     intent VARCHAR(50),                          -- 意图（list/detail/general）
+    intent_source VARCHAR(20),                   -- 意图来源（llm/local/ingredient，为空表示大模型）
     rewrited_query TEXT,                         -- 重写后的查询
     sources JSON,                                -- 引用的菜谱来源
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
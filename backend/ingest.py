@@ -0,0 +1,323 @@
+"""
+菜谱批量入库命令行
+
+    python -m backend.ingest [--data-path dishes] [--workers 0] [--batch-size 256] [--restart]
+
+读取、解析、切分菜谱文件的工作分发到进程池,结果按文件顺序流式汇总:
+每凑满 batch_size 个文件写入一次数据库,并作为一个分段保存到检查点目录;
+中断后再次运行会跳过已完成分段中未变化的文件,最后合并所有分段写入父文档/子块存储和文件清单,
+并输出每个阶段的吞吐。向量索引在服务下次启动时按子块存储校正。
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .config import settings
+from .db.database import DatabaseManager
+from .logging_config import setup_logging
+from .modules.chunk_store import ChunkStore
+from .modules.document_processor import RecipeDocumentProcessor
+from .modules.recipe_parser import load_records, save_records
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 2
+# 子进程阶段: 读文件、解析结构化记录、Markdown切分;主进程阶段: 写数据库、写存储
+WORKER_STAGES = ("read", "parse", "split")
+MAIN_STAGES = ("database", "store")
+
+_worker_processor: Optional[RecipeDocumentProcessor] = None
+_worker_splitter = None
+
+
+def _init_worker(data_path: str) -> None:
+    """子进程初始化: 每个进程只创建一次处理器和切分器"""
+    global _worker_processor, _worker_splitter
+    _worker_processor = RecipeDocumentProcessor(data_path, "", "", "", db_manager=None)
+    _worker_splitter = _worker_processor.get_splitter()
+
+
+def _process_file(md_file: str) -> Tuple[str, Optional[tuple], Optional[str]]:
+    """在子进程中处理单个菜谱文件,返回 (文件路径, 处理结果, 错误信息)"""
+    try:
+        return md_file, _worker_processor.process_file(Path(md_file), _worker_splitter), None
+    except Exception as e:
+        return md_file, None, str(e)
+
+
+class IngestCheckpoint:
+    """
+    入库检查点目录
+        checkpoint.json       版本号、数据目录、已完成分段及其文件指纹(大小, 修改时间)
+        segment-00000/        分段结果: documents/ 父文档、chunks/ 子块(ChunkStore 格式)、records.json 结构化记录
+    分段都是纯数据,读取时不会执行任何反序列化代码;旧版本(pickle 分段)的检查点直接丢弃重新开始
+    分段先写临时目录再替换,checkpoint.json 在分段写完之后才更新,中断时最多丢失一个分段
+    """
+    def __init__(self, path: str, data_path: str):
+        self.path = Path(path)
+        self.data_path = str(Path(data_path).resolve())
+        self.segments: List[Dict[str, Any]] = []
+        info_path = self.path / "checkpoint.json"
+        if info_path.exists():
+            with open(info_path, "r", encoding="utf-8") as f:
+                info = json.load(f)
+            if info.get("format_version") == CHECKPOINT_VERSION and info.get("data_path") == self.data_path:
+                self.segments = info["segments"]
+            else:
+                logger.warning(f"检查点与当前数据目录或版本不一致,重新开始: {self.path}")
+                self.clear()
+
+    def clear(self) -> None:
+        """删除检查点目录"""
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self.segments = []
+
+    def completed_files(self) -> Dict[str, List[int]]:
+        """已完成的文件: 相对路径 -> 文件指纹"""
+        return {name: fingerprint for segment in self.segments for name, fingerprint in segment["files"].items()}
+
+    def drop_stale(self, fingerprints: Dict[str, List[int]]) -> List[str]:
+        """
+        丢弃包含已修改或已删除文件的分段,其中未变化的文件会被重新处理
+        Returns:
+            被丢弃分段中的父文档ID,需要从数据库清理
+        """
+        kept, stale_ids = [], []
+        for segment in self.segments:
+            if all(fingerprints.get(name) == fingerprint for name, fingerprint in segment["files"].items()):
+                kept.append(segment)
+            else:
+                stale_ids.extend(segment["parent_ids"])
+                shutil.rmtree(self.path / segment["name"], ignore_errors=True)
+        if len(kept) != len(self.segments):
+            logger.info(f"检查点中{len(self.segments) - len(kept)}个分段的文件已变化,重新处理")
+            self.segments = kept
+            self._save_info()
+        return stale_ids
+
+    def add_segment(self, files: Dict[str, List[int]], documents: list, records: list, chunks: list) -> None:
+        """写入一个分段并更新检查点"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        name = self._next_segment_name()
+        tmp_path = self.path / (name + ".tmp")
+        if tmp_path.exists():
+            shutil.rmtree(tmp_path)
+        ChunkStore.write_files(tmp_path / "documents", documents)
+        ChunkStore.write_files(tmp_path / "chunks", chunks)
+        save_records(tmp_path, records)
+        os.replace(tmp_path, self.path / name)
+        self.segments.append({"name": name, "files": files, "parent_ids": [doc.metadata["parent_id"] for doc in documents]})
+        self._save_info()
+
+    def _next_segment_name(self) -> str:
+        """
+        新分段的文件名: 编号取已有分段的最大编号加一,丢弃中间的分段后也不会与保留的分段重名
+        Raises:
+            FileExistsError: 文件名已被检查点中的分段使用
+        """
+        index = max((int(segment["name"][len("segment-"):]) for segment in self.segments), default=-1) + 1
+        name = f"segment-{index:05d}"
+        if any(segment["name"] == name for segment in self.segments):
+            raise FileExistsError(f"检查点分段重名: {name}")
+        return name
+
+    def load_segments(self) -> Iterator[Tuple[list, list, list]]:
+        """按写入顺序读取所有分段"""
+        for segment in self.segments:
+            segment_path = self.path / segment["name"]
+            documents = list(ChunkStore(segment_path / "documents").documents())
+            chunks = list(ChunkStore(segment_path / "chunks").documents())
+            yield documents, list(load_records(segment_path).values()), chunks
+
+    def _save_info(self) -> None:
+        tmp_path = self.path / "checkpoint.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"format_version": CHECKPOINT_VERSION, "data_path": self.data_path, "segments": self.segments}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path / "checkpoint.json")
+
+
+def file_fingerprint(md_file: Path) -> List[int]:
+    """文件指纹: (大小, 修改时间纳秒),用于判断检查点中的结果是否仍然有效"""
+    stat = md_file.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def ingest(data_path: str, document_path: str, chunks_path: str, manifest_path: str, db_manager: DatabaseManager,
+           checkpoint_path: str, workers: int = 0, batch_size: int = 256, restart: bool = False) -> Dict[str, Any]:
+    """
+    并行入库 data_path 下的所有菜谱
+    Args:
+        workers: 进程数,0表示使用全部CPU核,1表示在当前进程中处理
+        batch_size: 每个分段(一次数据库写入和检查点)包含的文件数
+        restart: 忽略已有检查点,从头开始
+    Returns:
+        统计信息: 文件数、父文档数、子块数、失败文件和各阶段耗时/吞吐
+    """
+    start = time.perf_counter()
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
+    batch_size = max(1, batch_size)
+    processor = RecipeDocumentProcessor(data_path, document_path, chunks_path, "", db_manager, manifest_path)
+    files = sorted(Path(data_path).rglob("*.md"))
+    fingerprints = {processor.get_relative_path(md_file): file_fingerprint(md_file) for md_file in files}
+
+    checkpoint = IngestCheckpoint(checkpoint_path, data_path)
+    if restart:
+        checkpoint.clear()
+    stale_ids = checkpoint.drop_stale(fingerprints)
+    completed = checkpoint.completed_files()
+    pending = [md_file for md_file in files if processor.get_relative_path(md_file) not in completed]
+    logger.info(f"开始入库: 共{len(files)}个文件, 检查点已完成{len(completed)}个, 待处理{len(pending)}个, 进程数{workers}")
+
+    stage_seconds = {stage: 0.0 for stage in WORKER_STAGES + MAIN_STAGES}
+    failed: List[str] = []
+    processed = 0
+    db_counts: Dict[str, Dict[str, int]] = {"recipes": {}, "chunks": {}}
+    # 源文件已删除的菜谱不会再被写入,在写入前从数据库清理: 包括上次完整入库之后删除的文件
+    # (文件清单会按当前文件重写,服务启动时的增量同步不再能发现它们)和被丢弃分段中的文件;
+    # 仍存在的菜谱重新处理后覆盖写入
+    current_ids = {processor.make_parent_id(name) for name in fingerprints}
+    session = db_manager.get_session()
+    try:
+        deleted_ids = sorted(set(db_manager.select_all_parent_ids(session)).union(stale_ids) - current_ids)
+        if deleted_ids:
+            deleted = db_manager.delete_recipes_by_parent_ids(deleted_ids, session)
+            session.commit()
+            logger.info(f"清理源文件已删除的菜谱: {deleted}个")
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+    def flush(batch: List[tuple]) -> None:
+        """把一批处理结果写入数据库和检查点"""
+        documents = [doc for _, (doc, _, _, _) in batch]
+        chunks = [chunk for _, (_, _, doc_chunks, _) in batch for chunk in doc_chunks]
+        t = time.perf_counter()
+        session = db_manager.get_session()
+        try:
+            # 按 parent_id / chunk_id 批量插入或更新,重复运行或从检查点恢复时结果不变
+            counts = db_manager.upsert_documents(documents, chunks, session)
+        finally:
+            session.close()
+        for table, table_counts in counts.items():
+            for name, value in table_counts.items():
+                db_counts[table][name] = db_counts[table].get(name, 0) + value
+        stage_seconds["database"] += time.perf_counter() - t
+        t = time.perf_counter()
+        checkpoint.add_segment(
+            {name: fingerprints[name] for name, _ in batch},
+            documents, [record for _, (_, record, _, _) in batch], chunks
+        )
+        stage_seconds["store"] += time.perf_counter() - t
+        logger.info(f"入库进度: {len(checkpoint.completed_files())}/{len(files)}个文件")
+
+    pool_start = time.perf_counter()
+    batch: List[tuple] = []
+    paths = [str(md_file) for md_file in pending]
+    if workers == 1 or len(paths) < 2:
+        _init_worker(data_path)
+        results = map(_process_file, paths)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data_path,))
+        # 每个任务包含若干文件,减少进程间通信次数;map 按提交顺序返回结果
+        results = pool.map(_process_file, paths, chunksize=max(1, min(32, len(paths) // (workers * 4))))
+    try:
+        for md_file, result, error in results:
+            if error is not None:
+                logger.error(f"处理菜谱失败: {md_file} - {error}")
+                failed.append(md_file)
+                continue
+            for stage, seconds in result[3].items():
+                stage_seconds[stage] += seconds
+            batch.append((processor.get_relative_path(Path(md_file)), result))
+            processed += 1
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    pool_seconds = time.perf_counter() - pool_start
+
+    # 合并所有分段,写入父文档/子块存储、结构化记录和文件清单
+    t = time.perf_counter()
+    for documents, records, chunks in checkpoint.load_segments():
+        processor.documents.extend(documents)
+        processor.chunks.extend(chunks)
+        processor.records.update((record.parent_id, record) for record in records)
+    for chunk in processor.chunks:
+        if "chunk_id" in chunk.metadata:
+            processor.parent_child_map[chunk.metadata["chunk_id"]] = chunk.metadata["parent_id"]
+    processor.persist_state()
+    stage_seconds["store"] += time.perf_counter() - t
+    if not failed:
+        checkpoint.clear()
+
+    total_seconds = time.perf_counter() - start
+    stats = {
+        "files": len(files),
+        "processed": processed,
+        "resumed": len(completed),
+        "documents": len(processor.documents),
+        "chunks": len(processor.chunks),
+        "failed": failed,
+        "workers": workers,
+        "database": db_counts,
+        "seconds": round(total_seconds, 3),
+        "pool_files_per_second": round(processed / pool_seconds, 1) if processed and pool_seconds > 0 else 0.0,
+        "stages": {
+            stage: {
+                "seconds": round(seconds, 3),
+                # 子进程阶段为单进程吞吐(各进程耗时之和),主进程阶段为实际吞吐
+                "files_per_second": round((processed if stage != "store" else len(processor.documents)) / seconds, 1) if seconds > 0 else 0.0,
+            }
+            for stage, seconds in stage_seconds.items()
+        },
+    }
+    return stats
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="并行、可断点续跑的菜谱批量入库")
+    parser.add_argument("--data-path", default=settings.DATA_PATH, help="菜谱Markdown目录")
+    parser.add_argument("--workers", type=int, default=settings.INGEST_NUM_WORKERS, help="进程数,0表示使用全部CPU核")
+    parser.add_argument("--batch-size", type=int, default=settings.INGEST_BATCH_SIZE, help="每个检查点分段包含的文件数")
+    parser.add_argument("--checkpoint-path", default=settings.INGEST_CHECKPOINT_PATH, help="检查点目录")
+    parser.add_argument("--restart", action="store_true", help="忽略已有检查点,从头开始")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    stats = ingest(
+        data_path=args.data_path,
+        document_path=settings.DOCUMENT_PATH,
+        chunks_path=settings.CHUNKS_PATH,
+        manifest_path=settings.MANIFEST_PATH,
+        db_manager=DatabaseManager(settings.DB_URL),
+        checkpoint_path=args.checkpoint_path,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        restart=args.restart,
+    )
+    logger.info(f"入库完成: {stats['files']}个文件(本次处理{stats['processed']}个, 检查点恢复{stats['resumed']}个), "
+                f"{stats['documents']}个菜谱, {stats['chunks']}个子块, 失败{len(stats['failed'])}个, "
+                f"进程数{stats['workers']}, 总耗时{stats['seconds']}s, 并行处理吞吐 {stats['pool_files_per_second']} files/s")
+    logger.info(f"数据库写入: {stats['database']}")
+    for stage, info in stats["stages"].items():
+        logger.info(f"  {stage:<8} {info['seconds']:>8.3f}s  {info['files_per_second']:>10.1f} files/s")
+    if stats["failed"]:
+        logger.warning(f"{len(stats['failed'])}个文件处理失败,检查点已保留,修复后重新运行即可继续")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
 from .llm_generation import RecipeLLMGeneration
 from .rag_engine import RecipeRAGEngine
+from .cache import SemanticCache
+from .retrieval_optimization import RecipeRetrievalOptimizer
+from .document_processor import RecipeDocumentProcessor
+from .intent_classifier import IntentClassifier, IntentPrediction
+from .memory_report import memory_report
 from ..config import Settings
+import asyncio
+import json
 import logging
-from typing import List, Dict, Any
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple
 from ..db.database import DatabaseManager
 
 logger = logging.getLogger(__name__)
@@ -11,44 +20,384 @@ class RecipeAgentService:
     
     def __init__(self, db_manager: DatabaseManager):
         """初始化服务，注入RAG引擎和LLM生成器"""
+        self.db_manager = db_manager
+        # 热加载: 同一时间只允许一个后台加载任务
+        self._reload_lock = threading.Lock()
+        self.reload_status: Dict[str, Any] = {"state": "idle", "error": None, "started_at": None, "finished_at": None}
+        self.rag_engine = self.create_rag_engine(generation=1)
+        self.rag_engine.setup_rag_service()
+        settings = Settings()
+        self.llm_generator = RecipeLLMGeneration(model_name=settings.MODEL_NAME)
+        # 检索使用召回-重排级联;关闭时沿用RRF融合排序
+        self.cascade = settings.RERANK_CASCADE
+        # 原料组合问题走原料倒排索引
+        self.ingredient_search = settings.INGREDIENT_SEARCH_ENABLED
+        self.ingredient_top_k = settings.INGREDIENT_TOP_K
+        self.ingredient_rank_by = settings.INGREDIENT_RANK_BY
+        # 上下文使用结构化菜谱记录,不再拼接Markdown原文
+        self.context_from_records = settings.CONTEXT_FROM_RECORDS
+        # 查询重写、意图识别和过滤条件抽取合并为一次大模型调用,解析失败时退回两次调用
+        self.combined_analysis = settings.QUERY_ANALYSIS_COMBINED
+        self.analysis_filters = settings.QUERY_ANALYSIS_FILTERS
+        self._analysis_lock = threading.Lock()
+        self.analysis_stats = {"combined": 0, "fallback": 0, "local": 0}
+        # 本地意图分类: 规则或历史问题质心有把握的问题不再调用大模型重写和路由
+        self.intent_classifier = IntentClassifier(
+            margin=settings.INTENT_CENTROID_MARGIN,
+            min_examples=settings.INTENT_MIN_EXAMPLES,
+            shadow_rate=settings.INTENT_SHADOW_RATE,
+            log_every=settings.INTENT_LOG_EVERY,
+        ) if settings.INTENT_CLASSIFIER_ENABLED else None
+        self.intent_training_limit = settings.INTENT_TRAINING_LIMIT
+        self.intent_skip_rewrite = settings.INTENT_SKIP_REWRITE
+        self.train_intent_classifier(self.rag_engine)
+        # 语义结果缓存: 相似问题直接复用重写结果、意图和父文档ID,跳过重写、路由和检索
+        self.semantic_cache = SemanticCache(
+            max_size=settings.SEMANTIC_CACHE_SIZE,
+            ttl=settings.SEMANTIC_CACHE_TTL,
+            threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+        ) if settings.SEMANTIC_CACHE_ENABLED else None
+        logger.info("菜谱Agent服务初始化完成")
+
+    def create_rag_engine(self, generation: int, previous: RecipeRAGEngine = None) -> RecipeRAGEngine:
+        """按当前配置创建一代RAG引擎"""
         settings = Settings()
-        self.rag_engine = RecipeRAGEngine(data_path=settings.DATA_PATH, 
+        return RecipeRAGEngine(data_path=settings.DATA_PATH, 
                         document_path=settings.DOCUMENT_PATH, 
                         chunks_path=settings.CHUNKS_PATH, 
                         parent_child_map_path=settings.PARENT_CHILD_MAP_PATH, 
                         index_path=settings.INDEX_PATH, 
                         embedding_model_name=settings.EMBEDDING_MODEL_NAME,
-                        db_manager=db_manager
+                        db_manager=self.db_manager,
+                        manifest_path=settings.MANIFEST_PATH,
+                        incremental=settings.INCREMENTAL_INDEX,
+                        generation=generation,
+                        previous=previous
                         )
-        self.rag_engine.setup_rag_service()
-        self.llm_generator = RecipeLLMGeneration(model_name=settings.MODEL_NAME)
-        logger.info("菜谱Agent服务初始化完成")
+
+    @property
+    def generation(self) -> int:
+        """当前对外服务的索引代数"""
+        return self.rag_engine.generation
+
+    def reload_index(self, background: bool = True) -> bool:
+        """
+        加载新一代索引(向量、BM25、子块存储)并原子切换
+        新一代在后台构建完成前,请求继续由旧一代处理;已开始的请求持有旧引擎的引用,切换后在旧一代上完成
+        Args:
+            background: 是否在后台线程中加载
+        Returns:
+            是否启动了加载任务;已有加载任务在运行时返回False
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            logger.warning("已有索引热加载任务在运行")
+            return False
+        self.reload_status = {"state": "running", "error": None, "started_at": time.time(), "finished_at": None}
+        if background:
+            threading.Thread(target=self._reload, name="index-reload", daemon=True).start()
+        else:
+            self._reload()
+        return True
+
+    def _reload(self) -> None:
+        """构建新一代RAG引擎并替换当前引擎(调用方已持有 _reload_lock)"""
+        try:
+            current = self.rag_engine
+            logger.info(f"开始热加载索引, 当前代数: {current.generation}")
+            start = time.perf_counter()
+            new_engine = self.create_rag_engine(generation=current.generation + 1, previous=current)
+            new_engine.setup_rag_service()
+            # 属性赋值是原子的,之后的新请求使用新一代引擎
+            self.rag_engine = new_engine
+            # 用新一代的嵌入模型和最新的历史问题重新计算意图质心
+            self.train_intent_classifier(new_engine)
+            # 缓存的父文档ID属于旧一代索引
+            if self.semantic_cache is not None:
+                self.semantic_cache.clear()
+            self.reload_status.update(state="idle", finished_at=time.time())
+            logger.info(f"索引热加载完成, 代数: {new_engine.generation}, 耗时{time.perf_counter() - start:.1f}s")
+        except Exception as e:
+            self.reload_status.update(state="failed", error=str(e), finished_at=time.time())
+            logger.error(f"索引热加载失败,继续使用当前索引: {e}", exc_info=True)
+        finally:
+            self._reload_lock.release()
+
+    def get_reload_status(self) -> Dict[str, Any]:
+        """热加载状态与当前索引代数"""
+        return {**self.reload_status, "generation": self.generation}
+
+    def get_retrieval_stats(self) -> Dict[str, Any]:
+        """当前一代引擎各检索分支的耗时统计与分词吞吐"""
+        optimizer = self.rag_engine.retrieval_optimizer
+        return {
+            "branches": optimizer.get_branch_stats(),
+            "tokenizer": optimizer.tokenizer.stats(),
+            "rerank": optimizer.rerank_batcher.stats() if optimizer.rerank_batcher else {},
+            "cascade": optimizer.get_cascade_stats(),
+            "query_analysis": dict(self.analysis_stats),
+            "intent_classifier": self.intent_classifier.stats() if self.intent_classifier is not None else {},
+        }
+
+    def get_memory_stats(self) -> Dict[str, Any]:
+        """当前worker进程的内存报告,以及当前一代引擎启动前后的RSS"""
+        return {"process": memory_report(), "engine": self.rag_engine.memory_report}
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """各级缓存的命中统计"""
+        return {
+            "query_embedding": self.rag_engine.index_builder.query_embeddings.stats(),
+            "rerank_score": self.rag_engine.retrieval_optimizer.rerank_cache.stats(),
+            "semantic_result": self.semantic_cache.stats() if self.semantic_cache is not None else {},
+            "parent_store": self.rag_engine.document_processor.parent_store.stats(),
+        }
 
     def query(self, user_query: str, filters: Dict[str, Any] = None, streaming: bool = False) -> Dict[str, Any]:
         """
         处理用户查询的主要入口
         """
-        #1. 查询意图识别（调用 llm_generator.query_router）
-        #2. 查询优化（调用 llm_generator.rewrite_query）
-        rewrited_query = self.llm_generator.rewrite_query(user_query)['messages'][-1].content
-        logger.info(f"重写后的查询: {rewrited_query}")
-        router_result = self.llm_generator.query_router(rewrited_query)['messages'][-1].content.strip()
-        logger.info(f"路由结果: {router_result}")
+        # 整个请求只使用开始时的这一代引擎,热加载切换不影响进行中的请求
+        rag_engine = self.rag_engine
+        #0. 原料组合问题("我只有X、Y可以做什么"): 原料倒排索引精确求解
+        ingredient_answer = self.answer_ingredient_query(rag_engine, user_query, filters)
+        if ingredient_answer is not None:
+            return ingredient_answer
+
+        #0. 语义缓存: 相似问题直接复用重写结果、意图和检索到的父文档
+        query_vector, cached = self.lookup_semantic_cache(rag_engine, user_query, filters)
+        if cached is not None:
+            rewrited_query, router_result = cached["rewrited_query"], cached["intent"]
+            parent_recipes = rag_engine.document_processor.get_parent_recipes_by_ids(cached["parent_ids"])
+            return self.generate_answer(rewrited_query, router_result, parent_recipes, streaming, self.prompt_records(rag_engine), cached["intent_source"])
+
+        #1-2. 查询优化与意图识别
+        rewrited_query, router_result, query_filters, intent_source = self.analyze_query(user_query, rag_engine, query_vector)
+        search_filters = self.merge_filters(filters, query_filters)
 
         #3. 检索相关文档（调用 rag_engine.retrieval_optimizer）
-        if filters:
-            logger.info(f"应用过滤器: {filters}")
-            context_docs = self.rag_engine.retrieval_optimizer.metadata_filtered_search(rewrited_query,filters)
+        if self.cascade:
+            context_docs = rag_engine.retrieval_optimizer.cascade_search(rewrited_query, search_filters)
+        elif search_filters:
+            logger.info(f"应用过滤器: {search_filters}")
+            context_docs = rag_engine.retrieval_optimizer.metadata_filtered_search(rewrited_query,search_filters)
         else:
-            context_docs = self.rag_engine.retrieval_optimizer.hybrid_search(rewrited_query, k=6)
+            context_docs = rag_engine.retrieval_optimizer.hybrid_search(rewrited_query, k=6)
         logger.info(f"检索到的上下文文档数量: {len(context_docs)}")
 
-        #4. 回溯父文档（调用 document_processor.get_parent_document）
-        parent_recipes = self.rag_engine.document_processor.get_parent_recipes(context_docs)
+        #4. 回溯父文档（调用 document_processor.get_parent_recipes）
+        parent_recipes = rag_engine.document_processor.get_parent_recipes(context_docs)
+        logger.info(f"回溯到的父菜谱数量: {len(parent_recipes)}")
+        self.store_semantic_cache(rag_engine, query_vector, filters, rewrited_query, router_result, parent_recipes, intent_source)
+
+        #5-7. 构建上下文并生成答案
+        return self.generate_answer(rewrited_query, router_result, parent_recipes, streaming, self.prompt_records(rag_engine), intent_source)
+
+    async def aquery(self, user_query: str, filters: Dict[str, Any] = None, streaming: bool = False) -> Dict[str, Any]:
+        """
+        query 的异步版本,供 FastAPI 路由使用
+        阻塞的大模型调用和数据库查询放到线程中执行,检索分支并发执行且不阻塞事件循环
+        """
+        rag_engine = self.rag_engine
+        ingredient_answer = await asyncio.to_thread(self.answer_ingredient_query, rag_engine, user_query, filters)
+        if ingredient_answer is not None:
+            return ingredient_answer
+        query_vector, cached = await asyncio.to_thread(self.lookup_semantic_cache, rag_engine, user_query, filters)
+        if cached is not None:
+            rewrited_query, router_result = cached["rewrited_query"], cached["intent"]
+            parent_recipes = await asyncio.to_thread(rag_engine.document_processor.get_parent_recipes_by_ids, cached["parent_ids"])
+            return await asyncio.to_thread(self.generate_answer, rewrited_query, router_result, parent_recipes, streaming, self.prompt_records(rag_engine), cached["intent_source"])
+
+        rewrited_query, router_result, query_filters, intent_source = await asyncio.to_thread(self.analyze_query, user_query, rag_engine, query_vector)
+        search_filters = self.merge_filters(filters, query_filters)
+        if self.cascade:
+            context_docs = await rag_engine.retrieval_optimizer.acascade_search(rewrited_query, search_filters)
+        elif search_filters:
+            logger.info(f"应用过滤器: {search_filters}")
+            context_docs = await asyncio.to_thread(rag_engine.retrieval_optimizer.metadata_filtered_search, rewrited_query, search_filters)
+        else:
+            context_docs = await rag_engine.retrieval_optimizer.ahybrid_search(rewrited_query, k=6)
+        logger.info(f"检索到的上下文文档数量: {len(context_docs)}")
+        parent_recipes = await asyncio.to_thread(rag_engine.document_processor.get_parent_recipes, context_docs)
         logger.info(f"回溯到的父菜谱数量: {len(parent_recipes)}")
+        self.store_semantic_cache(rag_engine, query_vector, filters, rewrited_query, router_result, parent_recipes, intent_source)
+        return await asyncio.to_thread(self.generate_answer, rewrited_query, router_result, parent_recipes, streaming, self.prompt_records(rag_engine), intent_source)
+
+    def answer_ingredient_query(self, rag_engine: RecipeRAGEngine, user_query: str,
+                                filters: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+        """
+        用原料倒排索引回答 "我只有X、Y可以做什么" 类问题,跳过重写、路由和检索
+        Returns:
+            与 query 相同结构的结果;不是这类问题或没有匹配的菜谱时返回None,走常规流程
+        """
+        ingredient_index = getattr(rag_engine, "ingredient_index", None)
+        if not self.ingredient_search or ingredient_index is None:
+            return None
+        found = ingredient_index.search_query(
+            user_query, k=self.ingredient_top_k, rank_by=self.ingredient_rank_by,
+            filters=RecipeRetrievalOptimizer.normalize_filters(filters)
+        )
+        if found is None or not found[1]:
+            return None
+        ingredients, matches = found
+        parent_recipes = rag_engine.document_processor.get_parent_recipes_by_ids([match["parent_id"] for match in matches])
+        return {
+            "rewrited_query": user_query,
+            "intent": "list",
+            "intent_source": "ingredient",
+            "answer": self.llm_generator.ingredient_question(ingredients, matches),
+            "parent_recipes": parent_recipes,
+        }
+
+    @staticmethod
+    def semantic_cache_namespace(rag_engine: RecipeRAGEngine, filters: Dict[str, Any]) -> str:
+        """语义缓存的命名空间: 索引代数 + 过滤条件,只有两者都相同的问题才能互相命中"""
+        return f"{rag_engine.generation}|{json.dumps(filters or {}, ensure_ascii=False, sort_keys=True)}"
+
+    def lookup_semantic_cache(self, rag_engine: RecipeRAGEngine, user_query: str,
+                              filters: Dict[str, Any] = None) -> Tuple[Optional[List[float]], Optional[Dict[str, Any]]]:
+        """
+        按问题向量查找语义缓存
+        Returns:
+            (问题向量, 命中的缓存值);未启用缓存或编码失败时向量为None
+        """
+        if self.semantic_cache is None:
+            return None, None
+        try:
+            query_vector = rag_engine.index_builder.query_embeddings.embed_query(user_query)
+        except Exception as e:
+            logger.error(f"语义缓存编码查询失败,跳过缓存: {e}")
+            return None, None
+        hit = self.semantic_cache.get(query_vector, self.semantic_cache_namespace(rag_engine, filters))
+        if hit is None:
+            return query_vector, None
+        cached, similarity = hit
+        logger.info(f"语义缓存命中: 相似度{similarity:.3f}, 复用重写查询: {cached['rewrited_query']}")
+        return query_vector, cached
+
+    def store_semantic_cache(self, rag_engine: RecipeRAGEngine, query_vector: Optional[List[float]], filters: Dict[str, Any],
+                             rewrited_query: str, router_result: str, parent_recipes: List[Any], intent_source: str = "llm") -> None:
+        """写入语义缓存;没有检索到父文档的结果不缓存"""
+        if self.semantic_cache is None or query_vector is None or not parent_recipes:
+            return
+        self.semantic_cache.put(query_vector, {
+            "rewrited_query": rewrited_query,
+            "intent": router_result,
+            "intent_source": intent_source,
+            "parent_ids": [recipe.parent_id for recipe in parent_recipes],
+        }, self.semantic_cache_namespace(rag_engine, filters))
+
+    def train_intent_classifier(self, rag_engine: RecipeRAGEngine) -> None:
+        """由 chat_messages 中大模型标注意图的用户问题计算意图质心(不使用本地分类的结果),向量与查询向量使用同一个嵌入模型"""
+        if self.intent_classifier is None:
+            return
+        examples = self.db_manager.select_intent_examples(self.intent_training_limit)
+        if not examples:
+            logger.info("没有已标注意图的历史问题,本地意图分类只使用规则")
+            return
+        try:
+            texts, intents = zip(*examples)
+            self.intent_classifier.train(texts, intents, rag_engine.index_builder.query_embeddings.embed_documents)
+        except Exception as e:
+            logger.error(f"训练本地意图分类器失败,只使用规则: {e}")
+
+    def classify_intent(self, rag_engine: RecipeRAGEngine, user_query: str,
+                        query_vector: Optional[List[float]] = None) -> Optional[IntentPrediction]:
+        """本地意图分类;已有质心而没有问题向量时(语义缓存未启用)先编码问题,编码命中查询向量缓存时不重复计算"""
+        if self.intent_classifier is None:
+            return None
+        if query_vector is None and self.intent_classifier.has_centroids and self.intent_classifier.rule_intent(user_query) is None:
+            try:
+                query_vector = rag_engine.index_builder.query_embeddings.embed_query(user_query)
+            except Exception as e:
+                logger.error(f"本地意图分类编码查询失败,只使用规则: {e}")
+        return self.intent_classifier.classify(user_query, query_vector)
 
+    @staticmethod
+    def literal_filters(user_query: str) -> Dict[str, Any]:
+        """跳过大模型时的过滤条件: 问题中只出现一个分类名称时按该分类过滤"""
+        categories = [label for label in RecipeDocumentProcessor.CATEGORY_LABELS if label in user_query]
+        return {"category": categories[0]} if len(categories) == 1 else {}
+
+    def shadow_route(self, prediction: IntentPrediction, user_query: str) -> None:
+        """后台调用大模型路由复核直接采用的本地意图,只用于统计一致率"""
+        def run() -> None:
+            try:
+                router_result = self.llm_generator.query_router(user_query)['messages'][-1].content.strip()
+                self.intent_classifier.record_agreement(prediction, router_result)
+            except Exception as e:
+                logger.warning(f"本地意图复核失败: {e}")
+        threading.Thread(target=run, name="intent-shadow", daemon=True).start()
+
+    def analyze_query(self, user_query: str, rag_engine: RecipeRAGEngine = None,
+                      query_vector: Optional[List[float]] = None) -> Tuple[str, str, Dict[str, Any], str]:
+        """
+        重写查询并识别意图
+        本地意图分类有把握时使用本地意图,不调用大模型路由,查询仍由大模型重写(INTENT_SKIP_REWRITE 开启时直接使用原问题);
+        否则开启合并分析时一次大模型调用同时得到重写查询、意图和过滤条件;输出无法解析或调用失败时退回两次调用
+        Args:
+            query_vector: 语义缓存已计算的问题向量,用于本地意图分类
+        Returns:
+            (重写后的查询, 意图, 从问题中抽取的过滤条件, 意图来源: local/llm)
+        """
+        prediction = self.classify_intent(rag_engine or self.rag_engine, user_query, query_vector)
+        if prediction is not None and prediction.confident:
+            with self._analysis_lock:
+                self.analysis_stats["local"] += 1
+            if self.intent_classifier.should_shadow():
+                self.shadow_route(prediction, user_query)
+            logger.info(f"本地意图分类: {prediction}, 跳过大模型路由")
+            if self.intent_skip_rewrite:
+                rewrited_query = user_query
+            else:
+                rewrited_query = self.llm_generator.rewrite_query(user_query)['messages'][-1].content
+                logger.info(f"重写后的查询: {rewrited_query}")
+            return rewrited_query, prediction.intent, self.literal_filters(user_query), "local"
+        if self.combined_analysis:
+            try:
+                analysis = self.llm_generator.analyze_query(user_query)
+                with self._analysis_lock:
+                    self.analysis_stats["combined"] += 1
+                logger.info(f"合并查询分析: 重写后的查询: {analysis.rewritten_query}, 路由结果: {analysis.intent}, 过滤条件: {analysis.filter_dict()}")
+                self.record_intent_agreement(prediction, analysis.intent)
+                return analysis.rewritten_query, analysis.intent, analysis.filter_dict(), "llm"
+            except Exception as e:
+                with self._analysis_lock:
+                    self.analysis_stats["fallback"] += 1
+                logger.warning(f"合并查询分析失败,退回重写+路由两次调用: {e}")
+        #1. 查询优化（调用 llm_generator.rewrite_query）
+        #2. 查询意图识别（调用 llm_generator.query_router）
+        rewrited_query = self.llm_generator.rewrite_query(user_query)['messages'][-1].content
+        logger.info(f"重写后的查询: {rewrited_query}")
+        router_result = self.llm_generator.query_router(rewrited_query)['messages'][-1].content.strip()
+        logger.info(f"路由结果: {router_result}")
+        self.record_intent_agreement(prediction, router_result)
+        return rewrited_query, router_result, {}, "llm"
+
+    def record_intent_agreement(self, prediction: Optional[IntentPrediction], router_result: str) -> None:
+        """交给大模型的问题,记录本地的参考预测与大模型意图是否一致"""
+        if self.intent_classifier is not None:
+            self.intent_classifier.record_agreement(prediction, router_result)
+
+    def merge_filters(self, filters: Dict[str, Any], query_filters: Dict[str, Any]) -> Dict[str, Any]:
+        """请求中的过滤条件优先,问题中抽取的条件只补充请求未指定的字段"""
+        if not self.analysis_filters or not query_filters:
+            return filters
+        merged = dict(query_filters)
+        merged.update({key: value for key, value in (filters or {}).items() if value not in (None, "", [])})
+        return merged
+
+    def prompt_records(self, rag_engine: RecipeRAGEngine) -> Optional[Dict[str, Any]]:
+        """构建上下文使用的结构化菜谱记录,关闭时返回None(使用Markdown原文)"""
+        return rag_engine.document_processor.records if self.context_from_records else None
+
+    def generate_answer(self, rewrited_query: str, router_result: str, parent_recipes: List[Any],
+                        streaming: bool = False, records: Optional[Dict[str, Any]] = None, intent_source: str = "llm") -> Dict[str, Any]:
+        """
+        根据回溯到的父菜谱构建上下文并生成答案
+        Args:
+            intent_source: 意图来源(llm/local),随消息入库,本地意图分类器只用大模型标注的意图训练
+        """
         #5. 构建上下文（调用 llm_generator.build_context）
-        context = self.llm_generator.build_context(parent_recipes,3000)
+        context = self.llm_generator.build_context(parent_recipes,3000,records)
         logger.info(f"构建的上下文长度: {len(context)}")
         #6. 生成答案（根据意图调用不同的生成方法）
         if router_result == "list":
@@ -62,7 +411,7 @@ class RecipeAgentService:
         return {
                 "rewrited_query": rewrited_query, 
                 "intent": router_result, 
+                "intent_source": intent_source,
                 "answer": result_answer,
                 "parent_recipes": parent_recipes
                 }
-    
@@ -0,0 +1,185 @@
+#向量索引后端模块
+import logging
+import math
+import time
+from typing import Any, Dict, List
+
+import faiss
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_pq", "ivf_sq8")
+
+
+def truncate_vectors(vectors: np.ndarray, truncate_dim: int) -> np.ndarray:
+    """截断向量维度并重新做L2归一化; truncate_dim 为0时原样返回"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if not truncate_dim or truncate_dim >= vectors.shape[1]:
+        return vectors
+    vectors = np.ascontiguousarray(vectors[:, :truncate_dim])
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class TruncatedEmbeddings(Embeddings):
+    """对查询和文档向量做维度截断的嵌入包装,保证查询与索引维度一致"""
+    def __init__(self, embeddings: Embeddings, truncate_dim: int):
+        self.embeddings = embeddings
+        self.truncate_dim = truncate_dim
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        return truncate_vectors(vectors, self.truncate_dim).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = np.asarray([self.embeddings.embed_query(text)], dtype=np.float32)
+        return truncate_vectors(vector, self.truncate_dim)[0].tolist()
+
+
+def _largest_divisor(dimension: int, upper: int) -> int:
+    """不超过 upper 且能整除 dimension 的最大整数(PQ子空间数需要整除维度)"""
+    for m in range(min(upper, dimension), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def create_faiss_index(dimension: int, num_vectors: int, index_type: str = "flat", pca_dim: int = 0,
+                       hnsw_m: int = 32, hnsw_ef_construction: int = 200, ivf_nlist: int = 64, pq_m: int = 16) -> Any:
+    """
+    按配置创建未训练的FAISS索引(L2距离,向量已归一化)
+    Args:
+        dimension: 输入向量维度
+        num_vectors: 训练/入库的向量数量,用于收敛 nlist 和 PQ 码本大小
+        index_type: flat / hnsw / ivf_pq / ivf_sq8
+        pca_dim: 大于0时先用PCA降到该维度
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型: {index_type}, 可选: {INDEX_TYPES}")
+    inner_dim = pca_dim if 0 < pca_dim < dimension else dimension
+    # 每个聚类中心至少需要约39个训练点
+    nlist = max(1, min(ivf_nlist, num_vectors // 39))
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(inner_dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(inner_dim, hnsw_m)
+        index.hnsw.efConstruction = hnsw_ef_construction
+    elif index_type == "ivf_pq":
+        m = _largest_divisor(inner_dim, pq_m)
+        # 码本大小 2^nbits 不能超过训练点数
+        nbits = max(1, min(8, int(math.log2(max(2, num_vectors)))))
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(inner_dim), inner_dim, nlist, m, nbits)
+    else:
+        index = faiss.IndexIVFScalarQuantizer(faiss.IndexFlatL2(inner_dim), inner_dim, nlist, faiss.ScalarQuantizer.QT_8bit)
+
+    if inner_dim != dimension:
+        index = faiss.IndexPreTransform(faiss.PCAMatrix(dimension, inner_dim), index)
+    return index
+
+
+def apply_search_params(index: Any, hnsw_ef_search: int = 64, ivf_nprobe: int = 8) -> None:
+    """设置查询期参数(nprobe / efSearch),加载已有索引后也可调整,无需重建"""
+    inner = unwrap_index(index)
+    params = faiss.ParameterSpace()
+    if isinstance(inner, faiss.IndexHNSW):
+        params.set_index_parameter(index, "efSearch", hnsw_ef_search)
+    elif isinstance(inner, faiss.IndexIVF):
+        params.set_index_parameter(index, "nprobe", min(ivf_nprobe, inner.nlist))
+
+
+def unwrap_index(index: Any) -> Any:
+    """去掉PCA等预变换包装,返回实际的索引对象"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexPreTransform):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def supports_compacting_remove(index: Any) -> bool:
+    """
+    只有Flat索引删除后会把后续向量的位置前移,与langchain按位置维护的ID映射一致;
+    HNSW不支持删除,IVF删除后保留原位置,这两类需要重建
+    """
+    return isinstance(unwrap_index(index), faiss.IndexFlat)
+
+
+def make_search_params(index: Any, selector: Any, exhaustive: bool = False) -> Any:
+    """
+    为带ID过滤的查询构造搜索参数
+    Args:
+        index: FAISS索引
+        selector: IDSelector
+        exhaustive: 为True时把 nprobe / efSearch 放大到全量,保证过滤后也能取满k条
+    """
+    inner = unwrap_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=inner.nlist if exhaustive else inner.nprobe)
+    elif isinstance(inner, faiss.IndexHNSW):
+        ef_search = max(inner.hnsw.efSearch, int(inner.ntotal)) if exhaustive else inner.hnsw.efSearch
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    if isinstance(faiss.downcast_index(index), faiss.IndexPreTransform):
+        params = faiss.SearchParametersPreTransform(index_params=params)
+    return params
+
+
+def filtered_search(index: Any, query: np.ndarray, mask: np.ndarray, k: int):
+    """
+    只在 mask 为True的向量位置中检索
+    先用常规的 nprobe / efSearch 检索,结果不足k条时再做一次全量探查
+    Returns:
+        (距离数组, 位置数组),只包含有效结果
+    """
+    k = min(k, int(mask.sum()))
+    if k <= 0:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+    # 位图按小端位序打包,与 IDSelectorBitmap 的读取方式一致;bits 需要在检索期间保持引用
+    bits = np.packbits(mask, bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bits))
+    query = np.ascontiguousarray(query.reshape(1, -1), dtype=np.float32)
+    for exhaustive in (False, True):
+        params = make_search_params(index, selector, exhaustive)
+        distances, positions = index.search(query, k, params=params)
+        valid = positions[0] >= 0
+        if valid.sum() >= k:
+            break
+    return distances[0][valid], positions[0][valid]
+
+
+def describe_index(index: Any) -> str:
+    """索引类型的可读描述"""
+    inner = unwrap_index(index)
+    desc = type(inner).__name__
+    if isinstance(faiss.downcast_index(index), faiss.IndexPreTransform):
+        desc = f"PCA({index.d}->{inner.d})+{desc}"
+    return desc
+
+
+def benchmark_index(index: Any, queries: np.ndarray, k: int = 10) -> Dict[str, Any]:
+    """
+    统计索引大小和逐条查询的延迟分位数
+    Args:
+        index: FAISS索引
+        queries: 采样的查询向量
+        k: 每次查询返回的数量
+    """
+    size_bytes = int(faiss.serialize_index(index).nbytes)
+    latencies = []
+    for vector in queries:
+        start = time.perf_counter()
+        index.search(vector.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    report = {
+        "index_type": describe_index(index),
+        "ntotal": int(index.ntotal),
+        "size_bytes": size_bytes,
+        "p50_ms": float(np.percentile(latencies, 50)) if latencies else 0.0,
+        "p99_ms": float(np.percentile(latencies, 99)) if latencies else 0.0,
+    }
+    logger.info(f"索引报告: 类型 {report['index_type']}, 向量数 {report['ntotal']}, 大小 {size_bytes / 1024 / 1024:.2f}MB, "
+                f"查询延迟 p50 {report['p50_ms']:.3f}ms / p99 {report['p99_ms']:.3f}ms")
+    return report
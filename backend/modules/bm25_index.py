@@ -0,0 +1,199 @@
+#BM25稀疏索引模块
+import hashlib
+import json
+import logging
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import scipy.sparse as sp
+
+from .generations import current_path, write_generation
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+# 旧版直接写在索引目录下的文件,切换到分代目录后删除
+INDEX_FILES = ("bm25.npz", "vocab.json", "format.json")
+
+
+def text_hash(text: str) -> str:
+    """子块文本哈希,用于判断已分词的行能否复用"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class BM25Index:
+    """
+    基于稀疏矩阵的BM25索引
+    - term_freqs: 文档 x 词 的CSR词频矩阵,落盘保存,启动时无需重新分词
+    - weights: 词 x 文档 的CSR矩阵,存放预先算好的 idf * tf*(k1+1) / (tf + k1*(1-b+b*dl/avgdl)),
+      查询时只取查询词对应的行相加,再做向量化的top-k选择
+    目录结构:
+        format.json  版本号、k1/b、分词器签名、每行的文档ID与文本哈希
+        vocab.json   词表(按词ID顺序)
+        bm25.npz     词频矩阵的 data / indices / indptr / shape
+    """
+    def __init__(self, term_freqs: sp.csr_matrix, vocabulary: List[str], ids: List[str], hashes: List[str],
+                 k1: float = 1.5, b: float = 0.75, signature: str = ""):
+        self.term_freqs = term_freqs.tocsr()
+        self.vocabulary = vocabulary
+        self.term_to_id: Dict[str, int] = {term: i for i, term in enumerate(vocabulary)}
+        self.ids = ids
+        self.hashes = hashes
+        self.k1 = k1
+        self.b = b
+        # 分词器签名,分词器变化后已落盘的词频不能复用
+        self.signature = signature
+        self.compute_weights()
+
+    def __len__(self) -> int:
+        return self.term_freqs.shape[0]
+
+    def compute_weights(self) -> None:
+        """由词频矩阵计算IDF、文档长度和BM25权重矩阵"""
+        tf = self.term_freqs
+        n_docs, n_terms = tf.shape
+        self.doc_len = np.asarray(tf.sum(axis=1), dtype=np.float32).ravel()
+        self.avgdl = float(self.doc_len.mean()) if n_docs else 0.0
+        df = np.bincount(tf.indices, minlength=n_terms)
+        # Lucene 形式的IDF,始终为正,常见词不会得到负分
+        self.idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        rows = np.repeat(np.arange(n_docs), np.diff(tf.indptr))
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len[rows] / max(self.avgdl, 1e-9))
+        data = self.idf[tf.indices] * tf.data * (self.k1 + 1) / (tf.data + norm)
+        self.weights = sp.csr_matrix((data.astype(np.float32), tf.indices, tf.indptr), shape=tf.shape).T.tocsr()
+
+    @classmethod
+    def build(cls, texts: List[str], ids: List[str], tokenizer: Callable[[str], List[str]],
+              previous: Optional["BM25Index"] = None, k1: float = 1.5, b: float = 0.75, signature: str = "") -> "BM25Index":
+        """
+        构建索引;文本哈希与 previous 中某行一致时直接复用该行词频,只对新增或修改的文本分词
+        Args:
+            texts: 文档文本,行号即文档在检索结果中的位置
+            ids: 每行的文档ID
+            tokenizer: 分词函数
+            previous: 上一次落盘的索引
+            signature: 分词器签名,与 previous 不一致时全部重新分词
+        """
+        start = time.perf_counter()
+        hashes = [text_hash(text) for text in texts]
+        if previous is not None and previous.signature != signature:
+            logger.info(f"分词器已变化({previous.signature} -> {signature}),全部子块重新分词")
+            previous = None
+        reusable = {h: row for row, h in enumerate(previous.hashes)} if previous is not None else {}
+        term_to_id: Dict[str, int] = {}
+        indptr = [0]
+        indices: List[int] = []
+        data: List[float] = []
+        tokenized = 0
+        for text, h in zip(texts, hashes):
+            if h in reusable:
+                row = reusable[h]
+                start_pos, end_pos = previous.term_freqs.indptr[row], previous.term_freqs.indptr[row + 1]
+                counts = {
+                    previous.vocabulary[term_id]: freq
+                    for term_id, freq in zip(previous.term_freqs.indices[start_pos:end_pos], previous.term_freqs.data[start_pos:end_pos])
+                }
+            else:
+                counts = Counter(tokenizer(text))
+                tokenized += 1
+            row_terms = sorted((term_to_id.setdefault(term, len(term_to_id)), freq) for term, freq in counts.items())
+            indices.extend(term_id for term_id, _ in row_terms)
+            data.extend(freq for _, freq in row_terms)
+            indptr.append(len(indices))
+        vocabulary = [""] * len(term_to_id)
+        for term, term_id in term_to_id.items():
+            vocabulary[term_id] = term
+        term_freqs = sp.csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(texts), len(vocabulary))
+        )
+        index = cls(term_freqs, vocabulary, list(ids), hashes, k1=k1, b=b, signature=signature)
+        elapsed = time.perf_counter() - start
+        logger.info(f"BM25索引构建完成: {len(texts)}个文档, 词表{len(vocabulary)}个词, 重新分词{tokenized}个, 耗时{elapsed:.2f}s")
+        return index
+
+    def term_ids(self, tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """查询词 -> (词ID, 出现次数),忽略词表外的词"""
+        known = [self.term_to_id[token] for token in tokens if token in self.term_to_id]
+        if not known:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        term_ids, counts = np.unique(known, return_counts=True)
+        return term_ids, counts.astype(np.float32)
+
+    def get_scores(self, tokens: List[str]) -> np.ndarray:
+        """计算查询对所有文档的BM25分数"""
+        term_ids, counts = self.term_ids(tokens)
+        if not len(term_ids):
+            return np.zeros(len(self), dtype=np.float32)
+        return np.asarray(self.weights[term_ids].T @ counts, dtype=np.float32).ravel()
+
+    def search(self, tokens: List[str], k: int = 5, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        向量化的top-k检索
+        Args:
+            tokens: 查询分词结果
+            k: 返回数量
+            mask: 可选的布尔掩码,只在为True的文档中检索
+        Returns:
+            (文档行号, 分数),按分数从高到低排列,不包含0分文档
+        """
+        scores = self.get_scores(tokens)
+        if mask is not None:
+            scores = np.where(mask, scores, 0)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        rows = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return rows, scores[rows]
+
+    def save(self, path: Union[str, Path]) -> None:
+        """写入索引目录的新一代,写完后切换当前代"""
+        tf = self.term_freqs
+        with write_generation(path, legacy=INDEX_FILES) as generation:
+            np.savez(generation / "bm25.npz", data=tf.data, indices=tf.indices, indptr=tf.indptr, shape=np.asarray(tf.shape))
+            with open(generation / "vocab.json", "w", encoding="utf-8") as f:
+                json.dump(self.vocabulary, f, ensure_ascii=False)
+            with open(generation / "format.json", "w", encoding="utf-8") as f:
+                json.dump({"format_version": FORMAT_VERSION, "k1": self.k1, "b": self.b, "signature": self.signature,
+                           "ids": self.ids, "hashes": self.hashes}, f, ensure_ascii=False)
+        logger.info(f"BM25索引保存完成: {len(self)}个文档, 路径: {path}")
+
+    @classmethod
+    def open(cls, path: Union[str, Path]) -> Optional["BM25Index"]:
+        """加载索引目录的当前代,不存在或版本不兼容时返回None"""
+        path = current_path(path)
+        if not (path / "format.json").exists():
+            return None
+        try:
+            with open(path / "format.json", "r", encoding="utf-8") as f:
+                info = json.load(f)
+            if info.get("format_version") != FORMAT_VERSION:
+                logger.warning(f"BM25索引版本不兼容: {info.get('format_version')}, 需要重建")
+                return None
+            with open(path / "vocab.json", "r", encoding="utf-8") as f:
+                vocabulary = json.load(f)
+            arrays = np.load(path / "bm25.npz")
+            term_freqs = sp.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), shape=tuple(arrays["shape"]))
+            index = cls(term_freqs, vocabulary, info["ids"], info["hashes"], k1=info["k1"], b=info["b"], signature=info.get("signature", ""))
+            logger.info(f"BM25索引加载完成: {len(index)}个文档, 词表{len(vocabulary)}个词")
+            return index
+        except Exception as e:
+            logger.error(f"BM25索引加载失败: {path} - {e}")
+            return None
+
+    @classmethod
+    def load_or_build(cls, path: Union[str, Path], texts: List[str], ids: List[str], tokenizer: Callable[[str], List[str]],
+                      k1: float = 1.5, b: float = 0.75, signature: str = "") -> "BM25Index":
+        """
+        加载与当前文档一致的索引;文档有变化时复用未变化的行增量重建并落盘
+        """
+        index = cls.open(path)
+        if index is not None and index.ids == list(ids) and index.k1 == k1 and index.b == b \
+                and index.signature == signature and index.hashes == [text_hash(text) for text in texts]:
+            return index
+        index = cls.build(texts, ids, tokenizer, previous=index, k1=k1, b=b, signature=signature)
+        index.save(path)
+        return index
@@ -0,0 +1,167 @@
+#通用缓存模块
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+
+class LRUCache:
+    """
+    线程安全的有界LRU缓存,支持TTL过期
+    - max_size: 最大条目数,超出时淘汰最久未使用的条目
+    - ttl: 条目存活秒数,0表示永不过期
+    """
+    def __init__(self, max_size: int = 1024, ttl: float = 0):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """读取缓存,未命中或已过期时返回None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if not expires_at or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """写入缓存"""
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """清空缓存(命中统计保留)"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class SemanticCache:
+    """
+    按查询向量最近邻查找的线程安全缓存,同义改写的问题("宫保鸡丁的做法" / "宫保鸡丁怎么做")也能命中
+    - 向量存放在预分配的矩阵中,查找为一次矩阵向量乘法
+    - namespace 相同且余弦相似度不低于 threshold 的最近条目视为命中
+    - max_size / ttl 与 LRUCache 相同: 超出时淘汰最久未使用的条目,ttl为0表示永不过期
+    """
+    def __init__(self, max_size: int = 1000, ttl: float = 0, threshold: float = 0.95):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.threshold = threshold
+        self._vectors: Optional[np.ndarray] = None
+        self._namespaces: List[Hashable] = [None] * self.max_size
+        # 槽位 -> (值, 过期时间),按使用顺序排列
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._free = list(range(self.max_size - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(vector: Any) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _nearest(self, vector: np.ndarray, namespace: Hashable) -> Tuple[int, float]:
+        """同一 namespace 中最相似的槽位及相似度,没有条目时返回 (-1, -1)"""
+        if self._vectors is None or not self._entries:
+            return -1, -1.0
+        candidates = np.fromiter(
+            (slot for slot in self._entries if self._namespaces[slot] == namespace), dtype=np.int64
+        )
+        if not len(candidates):
+            return -1, -1.0
+        similarities = self._vectors[candidates] @ vector
+        best = int(np.argmax(similarities))
+        return int(candidates[best]), float(similarities[best])
+
+    def _evict(self, slot: int) -> None:
+        del self._entries[slot]
+        self._namespaces[slot] = None
+        self._free.append(slot)
+
+    def get(self, vector: Any, namespace: Hashable = None) -> Optional[Tuple[Any, float]]:
+        """
+        查找最相似的缓存条目
+        Returns:
+            (值, 相似度),未命中、相似度不足或已过期时返回None
+        """
+        vector = self._normalize(vector)
+        with self._lock:
+            slot, similarity = self._nearest(vector, namespace)
+            if slot >= 0 and similarity >= self.threshold:
+                value, expires_at = self._entries[slot]
+                if not expires_at or expires_at > time.monotonic():
+                    self._entries.move_to_end(slot)
+                    self.hits += 1
+                    return value, similarity
+                self._evict(slot)
+            self.misses += 1
+            return None
+
+    def put(self, vector: Any, value: Any, namespace: Hashable = None) -> None:
+        """写入缓存;已有足够相似的条目时覆盖该条目"""
+        vector = self._normalize(vector)
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(vector):
+                self._vectors = np.zeros((self.max_size, len(vector)), dtype=np.float32)
+                for slot in list(self._entries):
+                    self._evict(slot)
+            slot, similarity = self._nearest(vector, namespace)
+            if slot < 0 or similarity < self.threshold:
+                if not self._free:
+                    self._evict(next(iter(self._entries)))
+                slot = self._free.pop()
+            self._vectors[slot] = vector
+            self._namespaces[slot] = namespace
+            self._entries[slot] = (value, expires_at)
+            self._entries.move_to_end(slot)
+
+    def clear(self) -> None:
+        """清空缓存(命中统计保留)"""
+        with self._lock:
+            for slot in list(self._entries):
+                self._evict(slot)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,240 @@
+#子块存储模块
+import json
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+from .generations import current_path, write_generation
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+# 旧版直接写在存储目录下的文件,切换到分代目录后删除
+STORE_FILES = ("format.json", "ids.json", "texts.bin", "offsets.npy", "metadata.json")
+
+
+class ChunkStore:
+    """
+    列式只读文本存储,替代pickle
+    目录结构:
+        format.json   版本号与条目数
+        ids.json      每行的文档ID(chunk_id / parent_id)
+        texts.bin     UTF-8 文本顺序拼接,内存映射读取
+        offsets.npy   每行文本在 texts.bin 中的起止偏移(int64, n+1),内存映射读取
+        metadata.json 按列存储的元数据 {列名: [每行的值]},首次访问时才加载
+    文件都是纯数据,加载时不会执行任何反序列化代码;多个进程打开同一目录时共享页缓存
+    以上文件位于存储目录当前代的子目录中(见 generations.py),写入新一代不会改动正在被读取的文件
+    """
+    def __init__(self, path: Union[str, Path]):
+        # 逻辑目录解析为当前代目录;之后只读这一代的文件
+        self.path = current_path(path)
+        with open(self.path / "format.json", "r", encoding="utf-8") as f:
+            info = json.load(f)
+        if info.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"不支持的子块存储版本: {info.get('format_version')}, 期望: {FORMAT_VERSION}")
+        self.count = info["count"]
+        with open(self.path / "ids.json", "r", encoding="utf-8") as f:
+            self.ids: List[str] = json.load(f)
+        self.offsets = np.load(self.path / "offsets.npy", mmap_mode="r")
+        texts_path = self.path / "texts.bin"
+        # 空文件无法建立内存映射
+        self.texts = np.memmap(texts_path, dtype=np.uint8, mode="r") if texts_path.stat().st_size else np.zeros(0, dtype=np.uint8)
+        # 元数据按需加载,打开时即持有文件句柄: 这一代目录被后续发布清理后仍可读取
+        self._metadata_file = open(self.path / "metadata.json", "rb")
+        self._columns: Optional[Dict[str, List[Any]]] = None
+        self._id_to_row: Optional[Dict[str, int]] = None
+
+    @staticmethod
+    def exists(path: Union[str, Path]) -> bool:
+        """判断目录下是否存在子块存储"""
+        return (current_path(path) / "format.json").exists()
+
+    @classmethod
+    def open(cls, path: Union[str, Path]) -> Optional["ChunkStore"]:
+        """打开子块存储,不存在或版本不兼容时返回None"""
+        if not cls.exists(path):
+            return None
+        try:
+            return cls(path)
+        except Exception as e:
+            logger.error(f"子块存储打开失败: {path} - {e}")
+            return None
+
+    @classmethod
+    def write(cls, path: Union[str, Path], documents: Sequence[Document], ids: List[str] = None,
+              extra: Callable[[Path], None] = None) -> None:
+        """
+        将文档列表写入存储目录的新一代,写完后切换当前代;正在读取上一代的进程(旧一代引擎、运行中的服务)不受影响
+        Args:
+            path: 存储目录
+            documents: 文档列表
+            ids: 每个文档的ID,默认取 metadata 中的 chunk_id 或 parent_id
+            extra: 写入同一代目录的其他文件(如结构化菜谱记录),与文档一起切换
+        """
+        with write_generation(path, legacy=STORE_FILES + ("records.json",)) as generation:
+            cls.write_files(generation, documents, ids)
+            if extra is not None:
+                extra(generation)
+        logger.info(f"子块存储写入完成: {len(documents)}条, 路径: {path}")
+
+    @staticmethod
+    def write_files(path: Union[str, Path], documents: Sequence[Document], ids: List[str] = None) -> None:
+        """
+        将文档列表写入一个新目录(不分代),供已在分代目录中的调用方(如向量索引)使用
+        """
+        tmp_path = Path(path)
+        if ids is None:
+            ids = [doc.metadata.get("chunk_id") or doc.metadata.get("parent_id", "") for doc in documents]
+        tmp_path.mkdir(parents=True, exist_ok=True)
+
+        offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+        with open(tmp_path / "texts.bin", "wb") as f:
+            for i, doc in enumerate(documents):
+                data = doc.page_content.encode("utf-8")
+                f.write(data)
+                offsets[i + 1] = offsets[i] + len(data)
+        np.save(tmp_path / "offsets.npy", offsets)
+
+        column_names = []
+        for doc in documents:
+            for key in doc.metadata:
+                if key not in column_names:
+                    column_names.append(key)
+        columns = {name: [doc.metadata.get(name) for doc in documents] for name in column_names}
+        with open(tmp_path / "metadata.json", "w", encoding="utf-8") as f:
+            json.dump(columns, f, ensure_ascii=False)
+        with open(tmp_path / "ids.json", "w", encoding="utf-8") as f:
+            json.dump(list(ids), f, ensure_ascii=False)
+        with open(tmp_path / "format.json", "w", encoding="utf-8") as f:
+            json.dump({"format_version": FORMAT_VERSION, "count": len(documents), "columns": column_names}, f, ensure_ascii=False)
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def columns(self) -> Dict[str, List[Any]]:
+        """按列存储的元数据,首次访问时加载;同一父文档的子块共用相同取值,加载时与 ids 一起合并为同一个字符串对象"""
+        if self._columns is None:
+            with self._metadata_file as f:
+                columns = json.loads(f.read().decode("utf-8"))
+            shared: Dict[str, str] = {doc_id: doc_id for doc_id in self.ids}
+            for values in columns.values():
+                for row, value in enumerate(values):
+                    if isinstance(value, str):
+                        values[row] = shared.setdefault(value, value)
+            self._columns = columns
+        return self._columns
+
+    def row_of(self, doc_id: str) -> Optional[int]:
+        """根据文档ID查找行号"""
+        if self._id_to_row is None:
+            self._id_to_row = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        return self._id_to_row.get(doc_id)
+
+    def get_text(self, row: int) -> str:
+        """读取一行文本"""
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return bytes(self.texts[start:end]).decode("utf-8")
+
+    def get_metadata(self, row: int) -> Dict[str, Any]:
+        """读取一行元数据(忽略该行缺失的列)"""
+        return {name: values[row] for name, values in self.columns.items() if values[row] is not None}
+
+    def get_document(self, row: int) -> Document:
+        """按行构建Document对象"""
+        return Document(page_content=self.get_text(row), metadata=self.get_metadata(row))
+
+    def documents(self) -> Iterator[Document]:
+        """按行顺序遍历所有文档"""
+        for row in range(self.count):
+            yield self.get_document(row)
+
+    def text_length(self, row: int) -> int:
+        """一行文本的UTF-8字节数,不解码文本"""
+        return int(self.offsets[row + 1] - self.offsets[row])
+
+
+class StoredDocuments(Sequence):
+    """
+    ChunkStore 的只读文档序列,下标即行号
+    访问时才从内存映射构建Document,替代常驻内存的 List[Document];需要修改时先转换为列表
+    """
+    def __init__(self, store: ChunkStore):
+        self.store = store
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self.store.get_document(i) for i in range(*row.indices(len(self.store)))]
+        if row < 0:
+            row += len(self.store)
+        if not 0 <= row < len(self.store):
+            raise IndexError(f"行号越界: {row}")
+        return self.store.get_document(row)
+
+    def __iter__(self) -> Iterator[Document]:
+        return self.store.documents()
+
+    def column(self, key: str) -> List[Any]:
+        """按行顺序取出某个元数据字段的值,不构建Document"""
+        return self.store.columns.get(key, [None] * len(self.store))
+
+
+class RowIds(Mapping):
+    """
+    只读索引的 向量位置 -> docstore ID 映射: 行号即向量位置,ID就是行号本身
+    代替 dict(enumerate(ids)),langchain FAISS 检索时按整数行号直接读取 ChunkStore
+    """
+    def __init__(self, count: int):
+        self.count = count
+
+    def __getitem__(self, position: int) -> int:
+        if not 0 <= position < self.count:
+            raise KeyError(position)
+        return position
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.count))
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class ChunkStoreDocstore(Docstore, AddableMixin):
+    """
+    基于ChunkStore的langchain docstore
+    查询时按需从内存映射中构建Document;运行期新增的文档放在内存中,删除只做标记
+    """
+    def __init__(self, store: Optional[ChunkStore] = None):
+        self.store = store
+        self.added: Dict[str, Document] = {}
+        self.deleted: set = set()
+
+    def search(self, search: Union[str, int]) -> Union[str, Document]:
+        if isinstance(search, (int, np.integer)):
+            if self.store is not None and 0 <= search < len(self.store):
+                return self.store.get_document(int(search))
+            return f"ID {search} not found."
+        if search in self.added:
+            return self.added[search]
+        if self.store is not None and search not in self.deleted:
+            row = self.store.row_of(search)
+            if row is not None:
+                return self.store.get_document(row)
+        return f"ID {search} not found."
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        for doc_id, doc in texts.items():
+            self.added[doc_id] = doc
+            self.deleted.discard(doc_id)
+
+    def delete(self, ids: List) -> None:
+        for doc_id in ids:
+            self.added.pop(doc_id, None)
+            self.deleted.add(doc_id)
@@ -1,13 +1,17 @@
 #文档处理模块
 import logging
 import hashlib
+import time
+import json
 from pathlib import Path
-from typing import List, Dict, Any
-import pickle
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 from langchain_text_splitters import MarkdownHeaderTextSplitter
 from langchain_core.documents import Document
 from ..db.database import DatabaseManager,Recipe
-import uuid
+from .chunk_store import ChunkStore, StoredDocuments
+from .facet_index import FacetIndex
+from .parent_store import ParentRecipe, ParentStore
+from .recipe_parser import RecipeRecord, load_records, parse_recipe, save_records
 
 
 logger = logging.getLogger(__name__)
@@ -26,17 +30,24 @@ class RecipeDocumentProcessor:
     }
     CATEGORY_LABELS = list(set(CATEGORY_MAPPING.values()))
     DIFFICULTY_LABELS = ['非常简单', '简单', '中等', '困难', '非常困难']
+    # 父文档建立分面索引的元数据字段
+    FACET_KEYS = ("category", "difficulty")
+    HEADERS_TO_SPLIT_ON = [
+        ("#","主标题"),
+        ("##","二级标题"),
+        ("###","三级标题"),
+    ]
 
     @classmethod
     def get_difficulty_label(cls) -> str:
         return cls.DIFFICULTY_LABELS
-    
+
     @classmethod
     def get_category_label(cls) -> str:
         return cls.CATEGORY_MAPPING
 
 
-    def __init__(self,data_path:str,document_path:str,chunks_path:str,parent_child_map_path:str,db_manager:DatabaseManager):
+    def __init__(self,data_path:str,document_path:str,chunks_path:str,parent_child_map_path:str,db_manager:DatabaseManager,manifest_path:str=None):
         """
         初始化菜谱文档处理器
         """
@@ -44,18 +55,27 @@ class RecipeDocumentProcessor:
         self.document_path = document_path
         self.chunks_path = chunks_path
         self.data_path = data_path
-        # self.documents: List[Document] = [] #父文档(完整食谱)
-        self.chunks: List[Document] = [] #子文档(按标题切割的小块)
-        self.parent_child_map:Dict[str,str] = {}  # 子块ID -> 父文档ID的映射 
+        self.manifest_path = manifest_path
+        # 落盘后替换为 ChunkStore 的只读视图(StoredDocuments),按行号访问,不再常驻Document列表
+        self.documents: Sequence[Document] = [] #父文档(完整食谱)
+        self.chunks: Sequence[Document] = [] #子文档(按标题切割的小块)
+        self.parent_child_map:Dict[str,str] = {}  # 子块ID -> 父文档ID的映射
+        self.records: Dict[str, RecipeRecord] = {}  # 父文档ID -> 结构化菜谱记录
         self.db_manager = db_manager
+        # 父菜谱存储: build_parent_store 之前所有查询都回退到数据库批量查询
+        self.parent_store = ParentStore(fallback=self.select_parents)
+        # 父文档分面索引: 父文档加载、落盘或增量同步后重建,过滤、计数和分页不再扫描父文档
+        self.facet_index = FacetIndex()
 
     def load_documents(self) -> List[Document]:
         """加载所有菜谱"""
         logger.info(f"正在从{self.data_path}加载菜谱")
-        if Path(self.document_path).exists():
-            with open(self.document_path, "rb") as f:
-                documents = pickle.load(f,encoding="utf-8")
+        store = ChunkStore.open(self.document_path)
+        if store is not None:
+            documents = StoredDocuments(store)
             self.documents = documents
+            self.build_facet_index()
+            self.load_records()
             logger.info(f"菜谱加载完成,加载路径: {self.document_path}")
             return documents
         documents = []
@@ -65,66 +85,105 @@ class RecipeDocumentProcessor:
             return []
         for md_file in data_path.rglob("*.md"):
             try:
-                with open(md_file, "r", encoding="utf-8") as f:
-                    content = f.read()
-                # 为每个父文档分配确定性的唯一ID（基于数据根目录的相对路径）
-                try:
-                    data_root = Path(self.data_path).resolve()
-                    relative_path = Path(md_file).relative_to(data_root).as_posix()
-                except Exception as e:
-                    relative_path = Path(md_file).as_posix()
-                parent_id = hashlib.md5(relative_path.encode("utf-8")).hexdigest()
-                #创建Document对象
-                doc = Document(
-                    page_content=content,
-                    metadata={
-                        "source": str(md_file),
-                        "parent_id": parent_id,
-                        "doc_type": "parent"
-                    }
-                )
-                documents.append(doc)
+                documents.append(self.read_markdown_file(md_file))
             except Exception as e:
                 logger.error(f"加载菜谱失败: {md_file} - {e}")
         #增强文档元数据
-        session = self.db_manager.get_session()
         for doc in documents:
             self.enhance_metadata(doc)
-            self.db_manager.save_document_to_db(doc, session)
-        session.close()
+        self.write_database(lambda session: self.db_manager.upsert_recipes(documents, session))
 
         self.documents = documents
-        with open(self.document_path, "wb") as f:
-            pickle.dump(documents, f)
-        logger.info(f"菜谱加载完成,保存路径: {self.document_path}")
+        self.save_documents()
         return documents
 
+    def read_markdown_file(self, md_file: Path) -> Document:
+        """读取单个菜谱文件,生成带确定性parent_id和内容哈希的父文档"""
+        with open(md_file, "r", encoding="utf-8") as f:
+            content = f.read()
+        # 为每个父文档分配确定性的唯一ID（基于数据根目录的相对路径）
+        parent_id = self.make_parent_id(self.get_relative_path(md_file))
+        #创建Document对象
+        return Document(
+            page_content=content,
+            metadata={
+                "source": str(md_file),
+                "parent_id": parent_id,
+                "doc_type": "parent",
+                "content_hash": self.compute_content_hash(content)
+            }
+        )
+
+    def process_file(self, md_file: Path, splitter: MarkdownHeaderTextSplitter = None) -> Tuple[Document, RecipeRecord, List[Document], Dict[str, float]]:
+        """
+        读取、解析并切分单个菜谱文件,不访问数据库,可在子进程中执行
+        Returns:
+            (父文档, 结构化记录, 子块, 各阶段耗时秒数 {"read", "parse", "split"})
+        """
+        start = time.perf_counter()
+        doc = self.read_markdown_file(md_file)
+        read_done = time.perf_counter()
+        self.enhance_metadata(doc)
+        record = self.records.pop(doc.metadata["parent_id"])
+        parse_done = time.perf_counter()
+        chunks = self.split_document(doc, splitter)
+        # 子进程只负责计算,父子映射由汇总方维护
+        for chunk in chunks:
+            self.parent_child_map.pop(chunk.metadata.get("chunk_id"), None)
+        timings = {"read": read_done - start, "parse": parse_done - read_done, "split": time.perf_counter() - parse_done}
+        return doc, record, chunks, timings
+
+    def get_relative_path(self, md_file: Path) -> str:
+        """获取菜谱文件相对数据根目录的路径"""
+        try:
+            data_root = Path(self.data_path).resolve()
+            return Path(md_file).relative_to(data_root).as_posix()
+        except Exception as e:
+            return Path(md_file).as_posix()
+
+    @staticmethod
+    def compute_content_hash(content: str) -> str:
+        """计算菜谱内容的md5,用于判断文件是否变更"""
+        return hashlib.md5(content.encode("utf-8")).hexdigest()
+
     def enhance_metadata(self, doc: Document) -> None:
-        file_path = Path(doc.metadata.get("source"))
-        path_parts = file_path.parts
-        
-        #提取菜品分类
-        doc.metadata["category"] = "其他"
-        for key, value in self.CATEGORY_MAPPING.items():
-            if key in path_parts:
-                doc.metadata["category"] = value
-                break
-        #提取菜品名称
-        doc.metadata["name"] = file_path.stem
-        #提取菜品难度
-        content = doc.page_content
-        if "预估烹饪难度：★★★★★" in doc.page_content:
-            doc.metadata["difficulty"] = "非常困难"
-        elif "预估烹饪难度：★★★★" in doc.page_content:
-            doc.metadata["difficulty"] = "困难"
-        elif "预估烹饪难度：★★★" in doc.page_content:
-            doc.metadata["difficulty"] = "中等"
-        elif "预估烹饪难度：★★" in doc.page_content:
-            doc.metadata["difficulty"] = "简单"
-        elif "预估烹饪难度：★" in doc.page_content:
-            doc.metadata["difficulty"] = "非常简单"
-        else:
-            doc.metadata["difficulty"] = "未知"
+        """单遍解析菜谱生成结构化记录,并把分类、菜名、难度写入元数据"""
+        record = parse_recipe(
+            doc.page_content,
+            doc.metadata.get("source"),
+            parent_id=doc.metadata.get("parent_id", ""),
+            content_hash=doc.metadata.get("content_hash", ""),
+            categories=self.CATEGORY_MAPPING,
+        )
+        self.records[record.parent_id] = record
+        doc.metadata["category"] = record.category
+        doc.metadata["name"] = record.name
+        doc.metadata["difficulty"] = record.difficulty
+
+    def load_records(self) -> None:
+        """加载已落盘的菜谱记录,缺失或内容哈希不一致的父文档重新解析"""
+        # 记录与父文档存储在同一代目录中,读取已打开的这一代,不受入库进程同时发布新一代的影响
+        records_path = self.documents.store.path
+        records = load_records(records_path)
+        stale = 0
+        for doc in self.documents:
+            record = records.get(doc.metadata.get("parent_id"))
+            if record is None or record.content_hash != doc.metadata.get("content_hash"):
+                stale += 1
+                self.enhance_metadata(doc)
+            else:
+                self.records[record.parent_id] = record
+        if stale:
+            logger.info(f"重新解析{stale}个菜谱记录")
+            save_records(records_path, self.recipe_records())
+
+    def recipe_records(self) -> List[RecipeRecord]:
+        """按父文档顺序返回结构化菜谱记录"""
+        return [self.records[parent_id] for parent_id in self.metadata_column(self.documents, "parent_id") if parent_id in self.records]
+
+    def get_record(self, parent_id: str) -> Optional[RecipeRecord]:
+        """按父文档ID获取结构化菜谱记录"""
+        return self.records.get(parent_id)
 
 
     def markdown_header_spliter(self) -> List[Document]:
@@ -132,9 +191,9 @@ class RecipeDocumentProcessor:
             Returns:
             按标题结构分割的文档列表
             """
-        if Path(self.chunks_path).exists():
-            with open(self.chunks_path, "rb") as f:
-                chunks = pickle.load(f,encoding="utf-8")
+        store = ChunkStore.open(self.chunks_path)
+        if store is not None:
+            chunks = StoredDocuments(store)
             self.chunks = chunks
             logger.info(f"子块加载完成,加载路径: {self.chunks_path}")
             # if Path(self.parent_child_map_path).exists():
@@ -142,62 +201,224 @@ class RecipeDocumentProcessor:
             #         self.parent_child_map = pickle.load(f)
             #     logger.info(f"父子映射加载完成,加载路径: {self.parent_child_map_path}")
             return chunks
-        headers_to_split_on = [
-            ("#","主标题"),
-            ("##","二级标题"),
-            ("###","三级标题"),
-        ]
-        splitter = MarkdownHeaderTextSplitter(
-            headers_to_split_on = headers_to_split_on,
-            strip_headers = False
-        )
+        splitter = self.get_splitter()
         all_chunks = []
-        session = self.db_manager.get_session()
         for doc in self.documents:
-            try:
-                content_preview = doc.page_content[:200]
-                has_headers = any( line.strip().startswith("#") for line in content_preview.split("\n"))
-
-                if not has_headers:
-                    logger.warning(f"文档没有标题: {doc.metadata['source']}")
-                    logger.debug(f"文档内容: {doc.page_content[:200]}")                
-                
-                md_chunks = splitter.split_text(doc.page_content)
-                logger.debug(f"{doc.metadata['source']}分割后的切片数量: {len(md_chunks)}")
-
-                if len(md_chunks) <= 1:
-                    logger.warning(f"文档未能按照标题分割: {doc.metadata['source']}")
-
-                parent_id = doc.metadata["parent_id"]
-                for i, chunk in enumerate(md_chunks):
-                    child_id = str(uuid.uuid4())
-                    chunk.metadata.update(doc.metadata)
-                    chunk.metadata.update(
-                        {
-                            "chunk_id": child_id,
-                            "parent_id": parent_id,
-                            "doc_type": "child",
-                            "chunk_index": i,
-                        }
-                    )
-                    all_chunks.append(chunk)
-                    self.db_manager.save_chunk_to_db(chunk, session)
-                    self.parent_child_map[child_id] = parent_id
-                # with open(self.parent_child_map_path, "wb") as f:
-                #     pickle.dump(self.parent_child_map, f)
-                # logger.info(f"父子映射保存完成,保存路径: {self.parent_child_map_path}")
-            except Exception as e:
-                logger.error(f"Markdown标题分割失败: {doc.metadata['source']} - {e}")
-                logger.exception(e)
-                all_chunks.append(doc)
+            all_chunks.extend(self.split_document(doc, splitter))
         logger.info(f"Markdown标题分割完成,生成{len(all_chunks)}个切片")
-        session.close()
-        with open(self.chunks_path, "wb") as f:
-            pickle.dump(all_chunks, f)
-        logger.info(f"子块保存完成,保存路径: {self.chunks_path}")
+        self.write_database(lambda session: self.db_manager.upsert_chunks(all_chunks, session))
         self.chunks = all_chunks
+        self.save_chunks()
+        if self.manifest_path and not Path(self.manifest_path).exists():
+            self.save_manifest()
         return all_chunks
 
+    def get_splitter(self) -> MarkdownHeaderTextSplitter:
+        """创建Markdown标题分割器"""
+        return MarkdownHeaderTextSplitter(
+            headers_to_split_on = self.HEADERS_TO_SPLIT_ON,
+            strip_headers = False
+        )
+
+    @staticmethod
+    def make_parent_id(relative_path: str) -> str:
+        """由菜谱文件相对数据根目录的路径生成确定性的父文档ID"""
+        return hashlib.md5(relative_path.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_chunk_id(parent_id: str, chunk_index: int) -> str:
+        """由父文档ID和块序号生成确定性的子块ID,同一内容多次切分得到相同ID"""
+        return hashlib.md5(f"{parent_id}#{chunk_index}".encode("utf-8")).hexdigest()
+
+    def split_document(self, doc: Document, splitter: MarkdownHeaderTextSplitter = None) -> List[Document]:
+        """
+        将单个父文档按标题切分为子块
+        Args:
+            doc: 父文档
+            splitter: Markdown标题分割器,为空时新建
+        Returns:
+            子块列表,分割失败时返回父文档本身
+        """
+        splitter = splitter or self.get_splitter()
+        try:
+            content_preview = doc.page_content[:200]
+            has_headers = any( line.strip().startswith("#") for line in content_preview.split("\n"))
+
+            if not has_headers:
+                logger.warning(f"文档没有标题: {doc.metadata['source']}")
+                logger.debug(f"文档内容: {doc.page_content[:200]}")
+
+            md_chunks = splitter.split_text(doc.page_content)
+            logger.debug(f"{doc.metadata['source']}分割后的切片数量: {len(md_chunks)}")
+
+            if len(md_chunks) <= 1:
+                logger.warning(f"文档未能按照标题分割: {doc.metadata['source']}")
+
+            parent_id = doc.metadata["parent_id"]
+            for i, chunk in enumerate(md_chunks):
+                child_id = self.make_chunk_id(parent_id, i)
+                chunk.metadata.update(doc.metadata)
+                chunk.metadata.update(
+                    {
+                        "chunk_id": child_id,
+                        "parent_id": parent_id,
+                        "doc_type": "child",
+                        "chunk_index": i,
+                    }
+                )
+                self.parent_child_map[child_id] = parent_id
+            return md_chunks
+        except Exception as e:
+            logger.error(f"Markdown标题分割失败: {doc.metadata['source']} - {e}")
+            logger.exception(e)
+            return [doc]
+
+    def save_documents(self) -> None:
+        """保存父文档缓存,之后父文档改为按行号读取存储"""
+        records = self.recipe_records()
+        ChunkStore.write(self.document_path, self.documents, extra=lambda generation: save_records(generation, records))
+        self.documents = StoredDocuments(ChunkStore(self.document_path))
+        self.build_facet_index()
+        logger.info(f"菜谱保存完成,保存路径: {self.document_path}")
+
+    def save_chunks(self) -> None:
+        """保存子块缓存,之后子块改为按行号读取存储"""
+        ChunkStore.write(self.chunks_path, self.chunks)
+        self.chunks = StoredDocuments(ChunkStore(self.chunks_path))
+        logger.info(f"子块保存完成,保存路径: {self.chunks_path}")
+
+    @staticmethod
+    def metadata_column(documents: Sequence[Document], key: str, default: Any = None) -> List[Any]:
+        """按顺序取出某个元数据字段的值,存储视图直接读取列,不构建Document"""
+        if isinstance(documents, StoredDocuments):
+            return [default if value is None else value for value in documents.column(key)]
+        return [doc.metadata.get(key, default) for doc in documents]
+
+    def build_manifest(self) -> Dict[str, Dict[str, str]]:
+        """根据当前父文档生成文件清单: 相对路径 -> {parent_id, content_hash}"""
+        manifest = {}
+        for doc in self.documents:
+            relative_path = self.get_relative_path(Path(doc.metadata["source"]))
+            manifest[relative_path] = {
+                "parent_id": doc.metadata["parent_id"],
+                "content_hash": doc.metadata.get("content_hash") or self.compute_content_hash(doc.page_content),
+            }
+        return manifest
+
+    def load_manifest(self) -> Dict[str, Dict[str, str]]:
+        """加载文件清单,清单不存在时根据已缓存的父文档重建"""
+        if self.manifest_path and Path(self.manifest_path).exists():
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return self.build_manifest()
+
+    def save_manifest(self) -> None:
+        """保存文件清单"""
+        if not self.manifest_path:
+            return
+        with open(self.manifest_path, "w", encoding="utf-8") as f:
+            json.dump(self.build_manifest(), f, ensure_ascii=False, indent=2)
+        logger.info(f"文件清单保存完成,保存路径: {self.manifest_path}")
+
+    def sync_documents(self) -> Dict[str, Any]:
+        """
+        增量同步菜谱目录: 对比文件清单中的内容哈希,只对新增、修改、删除的菜谱重新切分
+        需要在 load_documents 和 markdown_header_spliter 之后调用;
+        只更新内存和数据库,索引更新完成后再调用 persist_state 落盘
+        Returns:
+            {"added"/"changed"/"deleted": 父文档ID列表,
+             "new_chunks": 需要写入索引的子块, "removed_chunk_ids": 需要从索引删除的子块ID}
+        """
+        diff = {"added": [], "changed": [], "deleted": [], "new_chunks": [], "removed_chunk_ids": []}
+        data_path = Path(self.data_path)
+        if not data_path.exists():
+            logger.error(f"菜谱数据目录不存在: {self.data_path}")
+            return diff
+        manifest = self.load_manifest()
+
+        added_docs, changed_docs = [], []
+        seen_paths = set()
+        for md_file in data_path.rglob("*.md"):
+            relative_path = self.get_relative_path(md_file)
+            seen_paths.add(relative_path)
+            try:
+                doc = self.read_markdown_file(md_file)
+            except Exception as e:
+                logger.error(f"加载菜谱失败: {md_file} - {e}")
+                continue
+            entry = manifest.get(relative_path)
+            if entry and entry.get("content_hash") == doc.metadata["content_hash"]:
+                continue
+            self.enhance_metadata(doc)
+            (changed_docs if entry else added_docs).append(doc)
+
+        diff["added"] = [doc.metadata["parent_id"] for doc in added_docs]
+        diff["changed"] = [doc.metadata["parent_id"] for doc in changed_docs]
+        diff["deleted"] = [entry["parent_id"] for path, entry in manifest.items() if path not in seen_paths]
+        if not (added_docs or changed_docs or diff["deleted"]):
+            logger.info("增量同步完成: 菜谱目录没有变化")
+            return diff
+
+        stale_ids = set(diff["changed"]) | set(diff["deleted"])
+        diff["removed_chunk_ids"] = [
+            chunk.metadata["chunk_id"] for chunk in self.chunks
+            if chunk.metadata.get("parent_id") in stale_ids and "chunk_id" in chunk.metadata
+        ]
+        splitter = self.get_splitter()
+        fresh_docs = added_docs + changed_docs
+        for doc in fresh_docs:
+            diff["new_chunks"].extend(self.split_document(doc, splitter))
+
+        self.documents = [doc for doc in self.documents if doc.metadata.get("parent_id") not in stale_ids] + fresh_docs
+        self.build_facet_index()
+        self.chunks = [chunk for chunk in self.chunks if chunk.metadata.get("parent_id") not in stale_ids] + diff["new_chunks"]
+        for chunk_id in diff["removed_chunk_ids"]:
+            self.parent_child_map.pop(chunk_id, None)
+        for parent_id in set(diff["deleted"]):
+            self.records.pop(parent_id, None)
+        self.sync_database(stale_ids, fresh_docs, diff["new_chunks"])
+
+        logger.info(f"增量同步完成: 新增{len(added_docs)}个, 修改{len(changed_docs)}个, 删除{len(diff['deleted'])}个菜谱, "
+                    f"新增{len(diff['new_chunks'])}个子块, 移除{len(diff['removed_chunk_ids'])}个子块")
+        return diff
+
+    def sync_database(self, stale_ids: set, docs: List[Document], chunks: List[Document]) -> None:
+        """将增量变更写入数据库: 删除已删除的菜谱,批量写入新增和修改的菜谱及其子块"""
+        fresh_ids = {doc.metadata["parent_id"] for doc in docs}
+        deleted_ids = [parent_id for parent_id in stale_ids if parent_id not in fresh_ids]
+
+        def write(session):
+            # 删除和写入在同一个事务中,由 write_database 提交或回滚
+            if deleted_ids:
+                self.db_manager.delete_recipes_by_parent_ids(deleted_ids, session)
+            return self.db_manager.upsert_documents(docs, chunks, session, commit=False)
+        self.write_database(write)
+
+    def write_database(self, write) -> Optional[Dict[str, Any]]:
+        """
+        在一个事务中执行批量数据库写入并记录行数统计,写入成功后提交,任一步失败时整体回滚
+        数据库只用于展示和回溯,写入失败时记录错误,不影响检索服务启动
+        """
+        session = self.db_manager.get_session()
+        try:
+            counts = write(session)
+            session.commit()
+            logger.info(f"数据库写入完成: {counts}")
+            return counts
+        except Exception as e:
+            session.rollback()
+            logger.error(f"数据库写入失败,已回滚: {e}")
+            return None
+        finally:
+            session.close()
+
+    def persist_state(self) -> None:
+        """将父文档、子块和文件清单落盘"""
+        self.save_documents()
+        self.save_chunks()
+        self.save_manifest()
+
+
     def filter_documents_by_category(self, category: str) -> List[Document]:
         """ 根据菜品分类过滤文档
         Args:
@@ -205,7 +426,7 @@ class RecipeDocumentProcessor:
         Returns:
             符合分类的文档列表
         """
-        return [doc for doc in self.documents if doc.metadata["category"] == category]
+        return [self.documents[int(row)] for row in self.facet_index.rows({"category": category})]
         
     def filter_documents_by_difficulty(self, difficulty: str) -> List[Document]:
         """ 根据菜品难度过滤文档
@@ -214,7 +435,7 @@ class RecipeDocumentProcessor:
         Returns:
             符合难度的文档列表
         """
-        return [doc for doc in self.documents if doc.metadata["difficulty"] == difficulty]
+        return [self.documents[int(row)] for row in self.facet_index.rows({"difficulty": difficulty})]
 
     def get_statistics(self) -> Dict[str, Any]:
         """
@@ -226,24 +447,29 @@ class RecipeDocumentProcessor:
         if not self.documents:
             return {}
         
-        categories = {}
-        difficulties = {}
-
-        for doc in self.documents:
-            category = doc.metadata.get("category", "未知")
-            difficulty = doc.metadata.get("difficulty", "未知")
-            categories[category] = categories.get(category, 0) + 1
-            difficulties[difficulty] = difficulties.get(difficulty, 0) + 1
-
         return {
-            "total_documents": len(self.documents),
+            "total_documents": len(self.facet_index),
             "total_chunks": len(self.chunks),
-            "categories": categories,
-            "difficulties": difficulties,
+            "categories": self.facet_index.counts("category"),
+            "difficulties": self.facet_index.counts("difficulty"),
             "avg_chunk_size": sum(len(chunk.page_content) for chunk in self.chunks) / len(self.chunks) if self.chunks else 0
         }   
 
 
+    def build_facet_index(self) -> None:
+        """由当前父文档的分类、难度列重建分面索引,行号即父文档下标"""
+        columns = {key: self.metadata_column(self.documents, key) for key in self.FACET_KEYS}
+        self.facet_index = FacetIndex.build(columns, len(self.documents))
+
+    def list_recipes(self, page: int, page_size: int, category: Optional[str] = None, difficulty: Optional[str] = None) -> Tuple[int, List[ParentRecipe]]:
+        """
+        按分类、难度分页列出菜谱,只构建当前页的记录
+        Returns:
+            (满足条件的总数, 当前页的父菜谱)
+        """
+        total, rows = self.facet_index.page({"category": category, "difficulty": difficulty}, page, page_size)
+        return total, [ParentRecipe.from_document(self.documents[int(row)]) for row in rows]
+
     def export_metadata(self, output_path: str) -> None:
         """
         将元数据导出为JSON文件
@@ -266,43 +492,43 @@ class RecipeDocumentProcessor:
             json.dump(metadata_list, f, ensure_ascii=False, indent=2)
         logger.info(f"元数据导出完成,导出路径: {output_path}")
 
-    def get_parent_recipes(self, child_chunks: List[Document]) -> List[Recipe]:
+    def build_parent_store(self, enabled: bool = True) -> None:
+        """
+        由当前父文档构建进程内父菜谱存储,回溯父文档时不再查询数据库
+        需要在 load_documents / sync_documents 之后调用;父文档已落盘时按行号引用父文档存储,
+        enabled 为 False 时只使用数据库批量查询
+        """
+        if enabled and isinstance(self.documents, StoredDocuments):
+            self.parent_store = ParentStore.from_chunk_store(self.documents.store, fallback=self.select_parents)
+        elif enabled:
+            self.parent_store = ParentStore.from_documents(self.documents, fallback=self.select_parents)
+        else:
+            self.parent_store = ParentStore(fallback=self.select_parents)
+
+    def select_parents(self, parent_ids: List[str]) -> Dict[str, Recipe]:
+        """父菜谱存储未命中时,一次批量查询数据库"""
+        if self.db_manager is None:
+            return {}
+        return self.db_manager.select_parents_by_ids(parent_ids)
+
+    def get_parent_recipes(self, child_chunks: List[Document]) -> List[Any]:
         """
         根据子文档列表获取父文档列表
         Args:
             child_chunks: 子文档列表
         Returns:
-            父文档
+            父文档,按命中的子块数从多到少排列
         """
         parent_relevance = {}
-        parent_docs_map = {}
-
         for chunk in child_chunks:
             parent_id = chunk.metadata.get("parent_id", "未知")
             if parent_id:
                 parent_relevance[parent_id] = parent_relevance.get(parent_id, 0) + 1
 
-                # if parent_id not in parent_docs_map:
-                #     for doc in self.documents:
-                #         if doc.metadata.get("parent_id") == parent_id:
-                #             parent_docs_map[parent_id] = doc    
-                #             break
-                if parent_id not in parent_docs_map:
-                    try:
-                        recipe = self.db_manager.select_parent_by_id(parent_id)
-                        if recipe:
-                            parent_docs_map[parent_id] = recipe
-                    except Exception as e:
-                        logger.error(f"查询父文档失败: {e}")
-                        continue
-        
         sorted_parent_ids = sorted(parent_relevance.keys(), key=lambda x: parent_relevance[x], reverse=True)
+        parent_docs_map = self.parent_store.get_many(sorted_parent_ids)
+        parent_recipes = [parent_docs_map[parent_id] for parent_id in sorted_parent_ids if parent_id in parent_docs_map]
 
-        parent_recipes = []
-        for parent_id in sorted_parent_ids:
-            if parent_id in parent_docs_map:
-                parent_recipes.append(parent_docs_map[parent_id])
-        
         parent_info = []
         for recipe in parent_recipes:
             name = recipe.name
@@ -313,6 +539,11 @@ class RecipeDocumentProcessor:
         logger.info(f"从 {len(child_chunks)} 个子块中找到 {len(parent_recipes)} 个去重父文档: {', '.join(parent_info)}")
         return parent_recipes
 
+    def get_parent_recipes_by_ids(self, parent_ids: List[str]) -> List[Any]:
+        """按给定顺序获取父文档,用于语义缓存命中和原料查询时直接回溯"""
+        parent_docs_map = self.parent_store.get_many(parent_ids)
+        return [parent_docs_map[parent_id] for parent_id in parent_ids if parent_id in parent_docs_map]
+
 # if __name__ == "__main__":
 #     processor = RecipeDocumentProcessor(data_path="E:/algorithm_study/agent_learning/CookRag/dishes/meat_dish/宫保鸡丁")
 #     documents = processor.load_documents()
@@ -0,0 +1,125 @@
+#嵌入缓存模块
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """规范化子块文本: 去掉首尾空白并合并连续空白,避免格式差异导致缓存失效"""
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """
+    持久化的嵌入向量缓存
+    - 键: (模型名, 规范化文本哈希)
+    - 向量保存在 .npy 文件中,以只读内存映射方式打开
+    - 每个模型单独一个子目录,切换模型只需计算新模型缺失的向量
+    """
+    def __init__(self, cache_dir: str, model_name: str, dimension: int):
+        self.model_name = model_name
+        self.dimension = dimension
+        model_slug = re.sub(r"[^0-9A-Za-z._-]+", "__", model_name)
+        self.cache_dir = Path(cache_dir) / model_slug
+        self.vectors_path = self.cache_dir / "vectors.npy"
+        self.keys_path = self.cache_dir / "keys.json"
+        self.vectors = np.zeros((0, dimension), dtype=np.float32)
+        self.key_to_row: Dict[str, int] = {}
+        self.pending: Dict[str, np.ndarray] = {}  # 尚未落盘的新向量
+        self.retained_keys = None  # 下次保存时保留的键,None表示全部保留
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def make_key(self, text: str) -> str:
+        """计算缓存键"""
+        return hashlib.sha1(f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def load(self) -> None:
+        """以只读内存映射方式加载缓存"""
+        if not (self.vectors_path.exists() and self.keys_path.exists()):
+            return
+        try:
+            with open(self.keys_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            vectors = np.load(self.vectors_path, mmap_mode="r")
+            if meta.get("dimension") != self.dimension or vectors.shape != (len(meta["keys"]), self.dimension):
+                logger.warning(f"嵌入缓存与当前模型维度不一致,忽略缓存: {self.cache_dir}")
+                return
+            self.vectors = vectors
+            self.key_to_row = {key: row for row, key in enumerate(meta["keys"])}
+            logger.info(f"嵌入缓存加载完成: {len(self.key_to_row)}条, 路径: {self.cache_dir}")
+        except Exception as e:
+            logger.error(f"嵌入缓存加载失败: {e}")
+
+    def lookup(self, texts: List[str]) -> Tuple[np.ndarray, List[int]]:
+        """
+        批量查询缓存
+        Returns:
+            (向量矩阵, 未命中的文本下标); 未命中位置的向量为0
+        """
+        result = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        missing = []
+        for i, text in enumerate(texts):
+            key = self.make_key(text)
+            if key in self.pending:
+                result[i] = self.pending[key]
+            elif key in self.key_to_row:
+                result[i] = self.vectors[self.key_to_row[key]]
+            else:
+                missing.append(i)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return result, missing
+
+    def update(self, texts: List[str], vectors: np.ndarray) -> None:
+        """写入新计算的向量(保存前只存在内存中)"""
+        for text, vector in zip(texts, vectors):
+            self.pending[self.make_key(text)] = np.asarray(vector, dtype=np.float32)
+
+    def retain(self, texts: Iterable[str]) -> None:
+        """只保留给定文本对应的条目,其余在下次保存时淘汰"""
+        self.retained_keys = {self.make_key(text) for text in texts}
+
+    def save(self) -> None:
+        """合并新向量、淘汰过期条目后原子地写回磁盘"""
+        keys = [key for key in self.key_to_row if key not in self.pending]
+        keys += list(self.pending)
+        if self.retained_keys is not None:
+            keys = [key for key in keys if key in self.retained_keys]
+        if not self.pending and len(keys) == len(self.key_to_row):
+            return
+        # 新向量可能覆盖已有的键,按键的并集计数
+        evicted = len(self.key_to_row.keys() | self.pending.keys()) - len(keys)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_vectors = self.vectors_path.with_suffix(".tmp.npy")
+        out = np.lib.format.open_memmap(tmp_vectors, mode="w+", dtype=np.float32, shape=(len(keys), self.dimension))
+        for row, key in enumerate(keys):
+            out[row] = self.pending[key] if key in self.pending else self.vectors[self.key_to_row[key]]
+        out.flush()
+        del out
+        tmp_keys = self.keys_path.with_suffix(".tmp")
+        with open(tmp_keys, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dimension": self.dimension, "keys": keys}, f)
+        # 替换前释放旧文件的内存映射(Windows 下被映射的文件无法替换)
+        self.vectors = np.zeros((0, self.dimension), dtype=np.float32)
+        self.key_to_row = {}
+        self.pending = {}
+        self.retained_keys = None
+        # 先替换向量再替换键,加载时会校验行数是否一致
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_keys, self.keys_path)
+        self.load()
+        logger.info(f"嵌入缓存保存完成: {len(keys)}条, 淘汰{evicted}条, 路径: {self.cache_dir}")
+
+    def stats(self) -> Dict[str, int]:
+        """缓存命中统计"""
+        return {"size": len(self.key_to_row.keys() | self.pending.keys()), "hits": self.hits, "misses": self.misses}
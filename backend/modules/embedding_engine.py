@@ -0,0 +1,152 @@
+#嵌入引擎模块
+import logging
+import math
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from sentence_transformers import SentenceTransformer
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_device(device: str) -> str:
+    """解析嵌入设备: auto 时有可用GPU才使用cuda,否则回退到cpu"""
+    device = (device or "cpu").lower()
+    if device == "auto":
+        try:
+            import torch
+            return "cuda" if torch.cuda.is_available() else "cpu"
+        except Exception:
+            return "cpu"
+    return device
+
+
+@contextmanager
+def _limit_worker_threads(num_threads: int):
+    """限制子进程的BLAS/OpenMP线程数,避免多进程之间线程超额订阅"""
+    keys = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]
+    saved = {key: os.environ.get(key) for key in keys}
+    for key in keys:
+        os.environ[key] = str(num_threads)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+class RecipeEmbeddingEngine(Embeddings):
+    """
+    批量嵌入引擎
+    - 显式指定设备(cpu/cuda/auto),默认cpu
+    - 可调的批大小
+    - CPU多核主机上把子块列表切分到进程池并行编码
+    """
+    def __init__(self, model_name: str, device: str = "cpu", batch_size: int = 32, num_workers: int = 0, normalize: bool = True):
+        """
+        初始化嵌入引擎
+        Args:
+            model_name: 嵌入模型名称
+            device: cpu / cuda / auto
+            batch_size: 每批编码的文本数
+            num_workers: CPU进程池大小,0表示使用全部CPU核,1表示单进程
+            normalize: 是否对向量做L2归一化
+        """
+        self.model_name = model_name
+        self.device = resolve_device(device)
+        self.batch_size = max(1, batch_size)
+        self.num_workers = num_workers if num_workers > 0 else (os.cpu_count() or 1)
+        self.normalize = normalize
+        logger.info(f"加载嵌入模型: {model_name}, 设备: {self.device}, 批大小: {self.batch_size}, CPU进程数: {self.num_workers}")
+        self.model = SentenceTransformer(model_name, device=self.device)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def use_process_pool(self, num_texts: int) -> bool:
+        """仅在CPU上且文本量足够填满每个进程至少一批时才启用进程池"""
+        return self.device == "cpu" and self.num_workers > 1 and num_texts >= self.batch_size * self.num_workers
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        批量编码文本
+        Returns:
+            形状为 (len(texts), dimension) 的 float32 矩阵
+        """
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        start = time.perf_counter()
+        if self.use_process_pool(len(texts)):
+            vectors = self._encode_multi_process(texts)
+        else:
+            vectors = self.model.encode(
+                texts,
+                batch_size=self.batch_size,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.normalize:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        elapsed = time.perf_counter() - start
+        if len(texts) > 1:
+            logger.info(f"嵌入完成: {len(texts)}个文本, 耗时{elapsed:.2f}s, 吞吐 {len(texts) / max(elapsed, 1e-9):.1f} chunks/s")
+        return vectors
+
+    def _encode_multi_process(self, texts: List[str]) -> np.ndarray:
+        """把文本切分给多个CPU进程编码"""
+        threads_per_worker = max(1, (os.cpu_count() or 1) // self.num_workers)
+        # 每个进程分到若干个分片,便于负载均衡
+        chunk_size = max(self.batch_size, math.ceil(len(texts) / (self.num_workers * 4)))
+        with _limit_worker_threads(threads_per_worker):
+            pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.num_workers)
+        try:
+            return self.model.encode_multi_process(texts, pool, batch_size=self.batch_size, chunk_size=chunk_size)
+        finally:
+            self.model.stop_multi_process_pool(pool)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """langchain Embeddings 接口: 编码文档"""
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """langchain Embeddings 接口: 编码查询"""
+        return self.encode([text])[0].tolist()
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询文本: 去掉首尾空白、合并连续空白并转小写"""
+    return " ".join(query.split()).lower()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    带LRU/TTL缓存的查询嵌入包装
+    缓存键为 (模型名, 规范化查询),文档嵌入直接透传不缓存
+    """
+    def __init__(self, embeddings: Embeddings, model_name: str, max_size: int = 1024, ttl: float = 0):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = LRUCache(max_size=max_size, ttl=ttl)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = (self.model_name, normalize_query(text))
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(key, vector)
+        return vector
+
+    def stats(self) -> Dict[str, Any]:
+        """查询嵌入缓存命中统计"""
+        return self.cache.stats()
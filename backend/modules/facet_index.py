@@ -0,0 +1,102 @@
+#分面索引模块
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 取值缺失时归入的分面取值
+MISSING_VALUE = "未知"
+
+
+class FacetIndex:
+    """
+    父文档的分面索引: 每个分面字段的每个取值对应一个升序的行号数组(int32)
+    单个取值的过滤直接返回数组;同一字段的多个取值取并集,不同字段从最短的数组开始求交集
+    计数即数组长度,统计和分页都不再扫描全部父文档
+    """
+    def __init__(self, facets: Dict[str, Dict[Any, np.ndarray]] = None, size: int = 0):
+        """
+        Args:
+            facets: {字段: {取值: 升序行号数组}}
+            size: 父文档总数
+        """
+        self.facets = facets or {}
+        self.size = size
+
+    @classmethod
+    def build(cls, columns: Dict[str, Sequence[Any]], size: int) -> "FacetIndex":
+        """
+        由按列的元数据构建索引
+        Args:
+            columns: {字段: 按行号排列的取值},缺失值归入 MISSING_VALUE
+            size: 父文档总数
+        """
+        facets = {}
+        for key, values in columns.items():
+            rows_by_value: Dict[Any, List[int]] = {}
+            for row, value in enumerate(values):
+                rows_by_value.setdefault(MISSING_VALUE if value is None else value, []).append(row)
+            facets[key] = {value: np.asarray(rows, dtype=np.int32) for value, rows in rows_by_value.items()}
+        logger.info(f"分面索引构建完成: {size}个父文档, " + ", ".join(f"{key}: {len(values)}个取值" for key, values in facets.items()))
+        return cls(facets, size)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def keys(self) -> List[str]:
+        return list(self.facets)
+
+    def value_rows(self, key: str, value: Any) -> np.ndarray:
+        """某个字段取值的行号数组;value 为列表时取并集"""
+        if key not in self.facets:
+            raise KeyError(f"没有分面字段: {key}")
+        values = self.facets[key]
+        if not isinstance(value, (list, tuple, set)):
+            return values.get(value, np.zeros(0, dtype=np.int32))
+        parts = [values[item] for item in value if item in values]
+        if not parts:
+            return np.zeros(0, dtype=np.int32)
+        if len(parts) == 1:
+            return parts[0]
+        # 同一字段的不同取值互不重叠,拼接后排序即为并集
+        return np.sort(np.concatenate(parts))
+
+    def rows(self, filters: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """
+        满足全部过滤条件的行号(升序),取值为None的条件忽略
+        Raises:
+            KeyError: 过滤字段不是分面字段
+        """
+        filters = {key: value for key, value in (filters or {}).items() if value is not None}
+        if not filters:
+            return np.arange(self.size, dtype=np.int32)
+        candidates = sorted((self.value_rows(key, value) for key, value in filters.items()), key=len)
+        result = candidates[0]
+        for rows in candidates[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, rows, assume_unique=True)
+        return result
+
+    def count(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        """满足过滤条件的父文档数,单个条件时直接取数组长度"""
+        return len(self.rows(filters))
+
+    def page(self, filters: Optional[Dict[str, Any]], page: int, page_size: int) -> Tuple[int, np.ndarray]:
+        """
+        分页查询
+        Returns:
+            (满足条件的总数, 当前页的行号)
+        """
+        rows = self.rows(filters)
+        start = (page - 1) * page_size
+        return len(rows), rows[start:start + page_size]
+
+    def counts(self, key: str) -> Dict[Any, int]:
+        """某个字段各取值的父文档数"""
+        return {value: len(rows) for value, rows in self.facets.get(key, {}).items()}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"size": self.size, **{key: self.counts(key) for key in self.facets}}
@@ -0,0 +1,107 @@
+#检索结果融合模块
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+FUSION_METHODS = ("rrf", "minmax", "zscore")
+
+# 分支结果: 按相关性排好序的文档,或 (文档, 原始分数) 对(分数越大越相关)
+BranchResult = Sequence[Union[Document, Tuple[Document, float]]]
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """
+    解析分支权重配置,如 "vector:1.0,bm25:0.8";未列出的分支权重为1
+    """
+    weights = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition(":")
+        try:
+            weights[name.strip()] = float(value)
+        except ValueError:
+            raise ValueError(f"分支权重配置格式错误: {item!r}, 应为 分支名:权重")
+    return weights
+
+
+def doc_key(doc: Document) -> str:
+    """融合时文档的唯一标识: 子块ID,没有子块ID的父文档使用 parent_id"""
+    return doc.metadata.get("chunk_id") or doc.metadata.get("parent_id") or str(hash(doc.page_content))
+
+
+def _branch_contribution(raw: np.ndarray, ranks: np.ndarray, method: str, rrf_k: int) -> Tuple[np.ndarray, float]:
+    """
+    单个分支对其候选的得分贡献,以及未被该分支召回的候选得到的填充值
+    - rrf: 1 / (rrf_k + 名次)
+    - minmax: 原始分数缩放到 [0, 1]
+    - zscore: 原始分数标准化
+    未召回的候选视为不优于该分支最差的结果
+    """
+    if method == "rrf":
+        return 1.0 / (rrf_k + ranks + 1), 0.0
+    if method == "minmax":
+        span = raw.max() - raw.min()
+        return ((raw - raw.min()) / span if span > 0 else np.ones_like(raw)), 0.0
+    std = raw.std()
+    scores = (raw - raw.mean()) / std if std > 0 else np.zeros_like(raw)
+    return scores, float(scores.min())
+
+
+def fuse(results: Dict[str, BranchResult], method: str = "rrf", weights: Optional[Dict[str, float]] = None,
+         rrf_k: int = 60) -> List[Tuple[Document, float]]:
+    """
+    按子块ID融合任意数量检索分支的结果
+
+    Args:
+        results: {分支名: 该分支的排序结果}
+        method: rrf / minmax / zscore;rrf 只看名次,后两者融合归一化后的原始分数
+        weights: 分支权重,未列出的分支为1;全部为1时即普通RRF
+        rrf_k: RRF平滑参数
+
+    Returns:
+        [(文档, 融合分数)],按融合分数从高到低排列,同分时保持首次出现的顺序
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"不支持的融合方法: {method}, 可选: {FUSION_METHODS}")
+    weights = weights or {}
+    columns: Dict[str, int] = {}
+    docs: List[Document] = []
+    all_cols: List[np.ndarray] = []
+    all_values: List[np.ndarray] = []
+    # 所有候选共有的填充值之和,各分支只累加相对填充值的增量
+    base = 0.0
+    for name, items in results.items():
+        weight = weights.get(name, 1.0)
+        if not items or weight == 0:
+            continue
+        cols, raw, ranks = [], [], []
+        seen = set()
+        for rank, item in enumerate(items):
+            # 只有文档没有分数的分支,以名次的相反数作为分数
+            doc, score = item if isinstance(item, tuple) else (item, -rank)
+            key = doc_key(doc)
+            # 同一分支重复返回的文档只取排名最靠前的一次
+            if key in seen:
+                continue
+            seen.add(key)
+            col = columns.setdefault(key, len(docs))
+            if col == len(docs):
+                docs.append(doc)
+            cols.append(col)
+            raw.append(score)
+            ranks.append(rank)
+        contribution, fill = _branch_contribution(np.asarray(raw, dtype=np.float64), np.asarray(ranks), method, rrf_k)
+        all_cols.append(np.asarray(cols, dtype=np.int64))
+        all_values.append(weight * (contribution - fill))
+        base += weight * fill
+
+    if not docs:
+        return []
+    fused = base + np.bincount(np.concatenate(all_cols), weights=np.concatenate(all_values), minlength=len(docs))
+    order = np.argsort(-fused, kind="stable")
+    return [(docs[i], float(fused[i])) for i in order]
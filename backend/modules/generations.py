@@ -0,0 +1,113 @@
+#存储分代目录模块
+import logging
+import os
+import re
+import shutil
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = "CURRENT"
+GENERATION_PATTERN = re.compile(r"^gen-(\d{6})(\.tmp)?$")
+
+
+def current_path(path: Union[str, Path]) -> Path:
+    """
+    逻辑目录当前代的物理目录
+    目录结构:
+        path/CURRENT       当前代目录名(单行文本,原子替换)
+        path/gen-000003/   每一代的全部文件
+    没有 CURRENT 时返回 path 本身(旧版直接写在 path 下的布局)
+    """
+    path = Path(path)
+    try:
+        name = (path / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except OSError:
+        return path
+    return path / name if name else path
+
+
+def generations(path: Union[str, Path]) -> List[Tuple[int, Path]]:
+    """path 下已发布的代目录,按编号升序"""
+    path = Path(path)
+    if not path.is_dir():
+        return []
+    found = []
+    for child in path.iterdir():
+        match = GENERATION_PATTERN.match(child.name)
+        if match and not match.group(2) and child.is_dir():
+            found.append((int(match.group(1)), child))
+    return sorted(found)
+
+
+def _next_number(path: Path) -> int:
+    """下一代编号: 已有最大编号(含未完成的临时目录)加一,编号只增不减"""
+    numbers = [int(match.group(1)) for match in (GENERATION_PATTERN.match(child.name) for child in path.iterdir()) if match]
+    return max(numbers, default=0) + 1
+
+
+def publish(path: Union[str, Path], generation: Path, keep: Optional[int] = None, legacy: Iterable[str] = ()) -> None:
+    """
+    把 CURRENT 原子地指向新一代,之后删除更早的代
+    正在服务的旧一代引擎仍在读取上一代的内存映射,因此至少保留 keep 代;
+    删除失败(Windows 下文件仍被其他进程映射)时留到下次发布再删
+    Args:
+        keep: 保留的代数,默认取配置 STORE_KEEP_GENERATIONS
+        legacy: 旧版直接写在 path 下的文件名,切换后一并删除
+    """
+    path = Path(path)
+    if keep is None:
+        keep = settings.STORE_KEEP_GENERATIONS
+    tmp_current = path / (CURRENT_FILE + ".tmp")
+    tmp_current.write_text(generation.name, encoding="utf-8")
+    os.replace(tmp_current, path / CURRENT_FILE)
+    published = generations(path)
+    for number, old in published[:-max(1, keep)]:
+        if old.name == generation.name:
+            continue
+        try:
+            shutil.rmtree(old)
+        except OSError as e:
+            logger.warning(f"旧一代目录暂时无法删除,下次发布时重试: {old} - {e}")
+    for name in legacy:
+        old = path / name
+        try:
+            if old.is_dir():
+                shutil.rmtree(old)
+            elif old.exists():
+                old.unlink()
+        except OSError as e:
+            logger.warning(f"旧版文件暂时无法删除,下次发布时重试: {old} - {e}")
+    logger.info(f"已切换到新一代: {generation}")
+
+
+@contextmanager
+def write_generation(path: Union[str, Path], keep: Optional[int] = None, legacy: Iterable[str] = ()) -> Iterator[Path]:
+    """
+    在逻辑目录下写入新一代: 先写临时目录 gen-N.tmp,写完改名为 gen-N 再切换 CURRENT
+    不覆盖任何已有文件,其他进程(旧一代引擎、运行中的服务)可以继续读取当前代
+        with write_generation(path) as generation:
+            ...写入 generation 目录...
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    for child in path.iterdir():
+        match = GENERATION_PATTERN.match(child.name)
+        if match and match.group(2):
+            # 上次中断遗留的临时目录
+            shutil.rmtree(child, ignore_errors=True)
+    number = _next_number(path)
+    tmp_generation = path / f"gen-{number:06d}.tmp"
+    tmp_generation.mkdir()
+    try:
+        yield tmp_generation
+    except BaseException:
+        shutil.rmtree(tmp_generation, ignore_errors=True)
+        raise
+    generation = path / f"gen-{number:06d}"
+    os.replace(tmp_generation, generation)
+    publish(path, generation, keep, legacy)
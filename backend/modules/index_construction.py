@@ -1,77 +1,419 @@
 #索引构建
 import logging
-from typing import List
+import json
+from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
+import numpy as np
 
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_core.documents import Document
+from .ann_index import (
+    TruncatedEmbeddings, truncate_vectors, create_faiss_index,
+    apply_search_params, supports_compacting_remove, benchmark_index, filtered_search
+)
+from .chunk_store import ChunkStore, ChunkStoreDocstore, RowIds, StoredDocuments
+import faiss
+from .embedding_engine import RecipeEmbeddingEngine, CachedQueryEmbeddings
+from .embedding_cache import EmbeddingCache
+from .generations import current_path, write_generation
+from ..config import settings
 
 logger = logging.getLogger(__name__)
 
 class RecipeIndexBuilder:
-    """菜谱索引构建器"""
-    def __init__(self, embedding_model_name: str, index_path: str):
-        """初始化菜谱索引构建器"""
+    """
+    菜谱索引构建器
+    索引目录格式(版本见 INDEX_FORMAT_VERSION),以下文件位于 CURRENT 指向的代目录 gen-NNNNNN/ 中(见 generations.py):
+        format.json        格式版本
+        index_config.json  构建期索引参数
+        index.faiss        FAISS原生索引文件,只读加载时内存映射
+        chunks/            ChunkStore 列式子块存储(文本 + 元数据),行号即向量位置
+    索引保存或只读加载后,子块存储就是进程内唯一的一份子块: docstore ID 为行号,
+    文档处理器、BM25检索都通过 chunk_documents 按行号引用它
+    """
+    INDEX_FORMAT_VERSION = 1
+    INDEX_CONFIG_FILE = "index_config.json"
+    # 旧版直接写在索引目录下的文件,切换到分代目录后删除
+    INDEX_FILES = ("format.json", INDEX_CONFIG_FILE, "index.faiss", "chunks", "index.pkl")
+    # 建立位图、支持在向量检索内部过滤的元数据字段
+    FACET_KEYS = ("category", "difficulty")
+
+    def __init__(self, embedding_model_name: str, index_path: str, device: str = None, batch_size: int = None, num_workers: int = None,
+                 cache_dir: str = None, index_type: str = None, embeddings: RecipeEmbeddingEngine = None):
+        """
+        初始化菜谱索引构建器,未指定的嵌入参数取自配置
+        embeddings: 已加载的嵌入引擎,热加载新一代索引时复用,避免重复加载模型
+        """
         self.embedding_model_name = embedding_model_name
         self.index_path = index_path
-        self.embeddings = None
+        self.device = device or settings.EMBEDDING_DEVICE
+        self.batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        self.num_workers = settings.EMBEDDING_NUM_WORKERS if num_workers is None else num_workers
+        self.cache_dir = settings.EMBEDDING_CACHE_PATH if cache_dir is None else cache_dir
+        # 构建期参数,变化后需要重建索引
+        self.index_config = {
+            "index_type": (index_type or settings.ANN_INDEX_TYPE).lower(),
+            "pca_dim": settings.ANN_PCA_DIM,
+            "truncate_dim": settings.ANN_TRUNCATE_DIM,
+            "hnsw_m": settings.ANN_HNSW_M,
+            "hnsw_ef_construction": settings.ANN_HNSW_EF_CONSTRUCTION,
+            "ivf_nlist": settings.ANN_IVF_NLIST,
+            "pq_m": settings.ANN_PQ_M,
+        }
+        self.index_report: Dict[str, Any] = {}
+        # 分面位图: {字段: {取值: 按向量位置的布尔掩码}}
+        self.facet_masks: Dict[str, Dict[Any, np.ndarray]] = {}
+        self.embeddings = embeddings
+        self.query_embeddings = None
+        self.embedding_cache = None
         self.vectorstore = None
         self.setup_embeddings()
     
     def setup_embeddings(self):
         """设置嵌入模型"""
         logger.info(f"设置嵌入模型: {self.embedding_model_name}")
-        self.embeddings = HuggingFaceEmbeddings(
+        if self.embeddings is None or self.embeddings.model_name != self.embedding_model_name:
+            self.embeddings = RecipeEmbeddingEngine(
+                model_name=self.embedding_model_name,
+                device=self.device,
+                batch_size=self.batch_size,
+                num_workers=self.num_workers,
+                normalize=True
+            )
+        truncate_dim = self.index_config["truncate_dim"]
+        self.query_embeddings = CachedQueryEmbeddings(
+            TruncatedEmbeddings(self.embeddings, truncate_dim) if truncate_dim else self.embeddings,
             model_name=self.embedding_model_name,
-            model_kwargs={"device": "cuda"},
-            encode_kwargs={"normalize_embeddings": True}
+            max_size=settings.QUERY_EMBEDDING_CACHE_SIZE,
+            ttl=settings.QUERY_EMBEDDING_CACHE_TTL
         )
+        if self.cache_dir:
+            self.embedding_cache = EmbeddingCache(self.cache_dir, self.embedding_model_name, self.embeddings.dimension)
         logger.info(f"嵌入模型设置完成")
 
-    def build_index(self, chunks: List[Document]) -> FAISS:
-        """构建FAISS索引"""
-        logger.info(f"构建FAISS索引")
+    def embed_texts(self, texts: List[str]) -> np.ndarray:
+        """嵌入子块文本,先查嵌入缓存,只对未命中的文本调用模型"""
+        if self.embedding_cache is None:
+            return self.embeddings.encode(texts)
+        vectors, missing = self.embedding_cache.lookup(texts)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            new_vectors = self.embeddings.encode(missing_texts)
+            vectors[missing] = new_vectors
+            self.embedding_cache.update(missing_texts, new_vectors)
+        logger.info(f"嵌入缓存命中{len(texts) - len(missing)}/{len(texts)}个子块")
+        return vectors
+
+    def prune_embedding_cache(self, chunks: List[Document]) -> None:
+        """淘汰已不存在的子块对应的缓存向量并落盘"""
+        if self.embedding_cache is None:
+            return
+        self.embedding_cache.retain(chunk.page_content for chunk in chunks)
+        self.embedding_cache.save()
+
+    def build_index(self, chunks: List[Document], prune_cache: bool = True) -> FAISS:
+        """
+        按配置的索引类型构建FAISS索引
+        Args:
+            chunks: 子块列表
+            prune_cache: 是否同时淘汰嵌入缓存中已不存在的子块
+        """
+        logger.info(f"构建FAISS索引, 配置: {self.index_config}")
         if not chunks:
             raise ValueError("没有可构建索引的子块")
-        self.vectorstore = FAISS.from_documents(
-            documents=chunks,
-            embedding=self.embeddings
-        )   
+        texts = [chunk.page_content for chunk in chunks]
+        vectors = truncate_vectors(self.embed_texts(texts), self.index_config["truncate_dim"])
+        if prune_cache:
+            self.prune_embedding_cache(chunks)
+        config = self.index_config
+        index = create_faiss_index(
+            dimension=vectors.shape[1],
+            num_vectors=len(vectors),
+            index_type=config["index_type"],
+            pca_dim=config["pca_dim"],
+            hnsw_m=config["hnsw_m"],
+            hnsw_ef_construction=config["hnsw_ef_construction"],
+            ivf_nlist=config["ivf_nlist"],
+            pq_m=config["pq_m"]
+        )
+        if not index.is_trained:
+            index.train(vectors)
+        apply_search_params(index, settings.ANN_HNSW_EF_SEARCH, settings.ANN_IVF_NPROBE)
+        self.vectorstore = FAISS(
+            embedding_function=self.query_embeddings,
+            index=index,
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={}
+        )
+        self.vectorstore.add_embeddings(
+            text_embeddings=list(zip(texts, vectors.tolist())),
+            metadatas=[chunk.metadata for chunk in chunks],
+            ids=self.get_chunk_ids(chunks)
+        )
+        self.build_facet_masks()
+        sample = vectors[np.random.default_rng(0).choice(len(vectors), size=min(200, len(vectors)), replace=False)]
+        self.index_report = benchmark_index(index, sample)
 
         logger.info(f"FAISS索引构建完成,包含{len(chunks)}个子块")
         return self.vectorstore
     
+    @staticmethod
+    def get_chunk_ids(chunks: List[Document]) -> List[str]:
+        """使用子块的确定性chunk_id作为向量库中的文档ID"""
+        return [chunk.metadata.get("chunk_id") or chunk.metadata["parent_id"] for chunk in chunks]
+
     def add_new_chunks(self, new_chunks: List[Document]) -> None:
-        """添加新的子块到索引"""
+        """添加新的子块到索引,已存在的同ID子块会先被替换"""
         logger.info(f"添加{len(new_chunks)}个子块到索引")
         if not new_chunks:
             raise ValueError("没有可添加的子块")
-        self.vectorstore.add_documents(new_chunks)
+        self.use_chunk_ids()
+        ids = self.get_chunk_ids(new_chunks)
+        self.delete_chunks(ids)
+        texts = [chunk.page_content for chunk in new_chunks]
+        vectors = truncate_vectors(self.embed_texts(texts), self.index_config["truncate_dim"])
+        if self.embedding_cache is not None:
+            self.embedding_cache.save()
+        self.vectorstore.add_embeddings(
+            text_embeddings=list(zip(texts, vectors.tolist())),
+            metadatas=[chunk.metadata for chunk in new_chunks],
+            ids=ids
+        )
+        self.build_facet_masks()
         logger.info(f"子块添加完成")
 
+    def delete_chunks(self, chunk_ids: List[str]) -> int:
+        """
+        从索引中删除子块
+        Args:
+            chunk_ids: 子块的chunk_id列表
+        Returns:
+            实际删除的子块数量
+        """
+        if not chunk_ids:
+            return 0
+        if not self.vectorstore:
+            raise ValueError("没有可删除的索引")
+        self.use_chunk_ids()
+        targets = set(chunk_ids)
+        docstore_ids = [docstore_id for docstore_id in self.vectorstore.index_to_docstore_id.values() if docstore_id in targets]
+        if docstore_ids:
+            if supports_compacting_remove(self.vectorstore.index):
+                self.vectorstore.delete(docstore_ids)
+                self.build_facet_masks()
+            else:
+                self.rebuild_without(set(docstore_ids))
+        logger.info(f"从索引删除{len(docstore_ids)}个子块")
+        return len(docstore_ids)
+
+    def use_chunk_ids(self) -> None:
+        """增删子块前把按行号的只读映射换回 向量位置 -> chunk_id 的字典,langchain 按ID增删"""
+        if isinstance(self.vectorstore.index_to_docstore_id, RowIds):
+            self.vectorstore.index_to_docstore_id = dict(enumerate(self.docstore_ids()))
+
+    def docstore_ids(self) -> List[str]:
+        """按向量位置顺序返回子块ID"""
+        mapping = self.vectorstore.index_to_docstore_id
+        if isinstance(mapping, RowIds):
+            return list(self.vectorstore.docstore.store.ids)
+        return [docstore_id for _, docstore_id in sorted(mapping.items())]
+
+    def chunk_documents(self) -> Optional[StoredDocuments]:
+        """
+        索引的子块存储视图,下标即向量位置
+        只在索引已落盘且没有未保存的增删时可用,否则返回None
+        """
+        if self.vectorstore is None or not isinstance(self.vectorstore.index_to_docstore_id, RowIds):
+            return None
+        return StoredDocuments(self.vectorstore.docstore.store)
+
+    def rebuild_without(self, docstore_ids: set) -> None:
+        """HNSW/IVF索引不支持按位置删除,用剩余子块(向量来自嵌入缓存)重建索引"""
+        logger.info("当前索引类型不支持删除,使用剩余子块重建索引")
+        remaining = [
+            self.vectorstore.docstore.search(docstore_id)
+            for _, docstore_id in sorted(self.vectorstore.index_to_docstore_id.items())
+            if docstore_id not in docstore_ids
+        ]
+        self.build_index(remaining, prune_cache=False)
+
+    def stale_chunks(self, chunks: List[Document]) -> Tuple[List[Document], List[str]]:
+        """
+        按 (chunk_id, content_hash) 对比已保存的索引与当前子块,
+        子块由入库命令行等外部流程重新生成后,用于在启动时校正索引
+        Returns:
+            (需要嵌入写入的子块, 需要从索引删除的子块ID)
+        """
+        store = ChunkStore.open(current_path(self.index_path) / "chunks")
+        if store is None:
+            return list(chunks), []
+        indexed = dict(zip(store.ids, store.columns.get("content_hash", [None] * len(store))))
+        current = dict(zip(self.get_chunk_ids(chunks), chunks))
+        new_chunks = [
+            chunk for chunk_id, chunk in current.items()
+            if chunk_id not in indexed or indexed[chunk_id] != chunk.metadata.get("content_hash")
+        ]
+        removed_chunk_ids = [
+            chunk_id for chunk_id, content_hash in indexed.items()
+            if chunk_id not in current or current[chunk_id].metadata.get("content_hash") != content_hash
+        ]
+        return new_chunks, removed_chunk_ids
+
+    def apply_diff(self, new_chunks: List[Document], removed_chunk_ids: List[str]) -> None:
+        """将增量同步得到的子块变更应用到索引"""
+        self.delete_chunks(removed_chunk_ids)
+        if new_chunks:
+            self.add_new_chunks(new_chunks)
+        logger.info(f"索引增量更新完成,当前包含{self.vectorstore.index.ntotal}个子块")
+
     def save_index(self) -> None:
-        """保存FAISS索引"""
+        """保存FAISS索引和子块存储"""
         logger.info(f"保存FAISS索引到: {self.index_path}")
         if not self.vectorstore:
             raise ValueError("没有可保存的索引")
-        Path(self.index_path).mkdir(parents=True, exist_ok=True)
-        self.vectorstore.save_local(self.index_path)
+        ids = self.docstore_ids()
+        docs = [self.vectorstore.docstore.search(docstore_id) for _, docstore_id in sorted(self.vectorstore.index_to_docstore_id.items())]
+        # 先换成内存docstore: 写入失败时索引仍然完整可用
+        self.vectorstore.docstore = InMemoryDocstore(dict(zip(ids, docs)))
+        self.vectorstore.index_to_docstore_id = dict(enumerate(ids))
+        # 写入新一代目录,不覆盖正在被其他进程映射的当前代;旧版 pickle docstore 在切换后删除
+        with write_generation(self.index_path, legacy=self.INDEX_FILES) as index_dir:
+            faiss.write_index(self.vectorstore.index, str(index_dir / "index.faiss"))
+            ChunkStore.write_files(index_dir / "chunks", docs, ids)
+            with open(index_dir / self.INDEX_CONFIG_FILE, "w", encoding="utf-8") as f:
+                json.dump(self.index_config, f, ensure_ascii=False, indent=2)
+            with open(index_dir / "format.json", "w", encoding="utf-8") as f:
+                json.dump({"format_version": self.INDEX_FORMAT_VERSION, "count": len(ids)}, f)
+        store = ChunkStore.open(current_path(self.index_path) / "chunks")
+        self.vectorstore.docstore = ChunkStoreDocstore(store)
+        self.vectorstore.index_to_docstore_id = RowIds(len(store))
+        # 从列存储重建分面位图,同时让元数据列常驻内存
+        self.build_facet_masks()
         logger.info(f"FAISS索引保存完成,保存路径: {self.index_path}")
     
-    def load_index(self) -> bool:
-        """加载FAISS索引"""
+    def load_index(self, writable: bool = False) -> bool:
+        """
+        加载FAISS索引
+        Args:
+            writable: 是否需要在加载后增删子块;只读加载时索引文件以内存映射方式打开,
+                      多个worker进程共享同一份页缓存
+        """
         logger.info(f"加载FAISS索引从: {self.index_path}")
-        if not self.embeddings:
+        if not self.query_embeddings:
             self.setup_embeddings()
         
-        if not Path(self.index_path).exists():
-            logger.error(f"FAISS索引文件不存在: {self.index_path}")
+        index_dir = current_path(self.index_path)
+        format_path = index_dir / "format.json"
+        if not format_path.exists():
+            if (Path(self.index_path) / "index.pkl").exists():
+                logger.warning(f"检测到旧版pickle格式索引,出于安全原因不再加载,将重新构建: {self.index_path}")
+            else:
+                logger.error(f"FAISS索引文件不存在: {self.index_path}")
+            return False
+        with open(format_path, "r", encoding="utf-8") as f:
+            format_version = json.load(f).get("format_version")
+        if format_version != self.INDEX_FORMAT_VERSION:
+            logger.warning(f"索引格式版本不兼容({format_version}),需要重建")
+            return False
+        config_path = index_dir / self.INDEX_CONFIG_FILE
+        saved_config = {}
+        if config_path.exists():
+            with open(config_path, "r", encoding="utf-8") as f:
+                saved_config = json.load(f)
+        if saved_config != self.index_config:
+            logger.warning(f"索引配置已变化,需要重建: {saved_config} -> {self.index_config}")
             return False
-        self.vectorstore = FAISS.load_local(self.index_path, self.embeddings,allow_dangerous_deserialization=True)
-        logger.info(f"FAISS索引加载完成,加载路径: {self.index_path}")
+
+        io_flags = 0 if writable else faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        index = faiss.read_index(str(index_dir / "index.faiss"), io_flags)
+        store = ChunkStore.open(index_dir / "chunks")
+        if store is None or len(store) != index.ntotal:
+            logger.warning("子块存储与索引不一致,需要重建")
+            return False
+        apply_search_params(index, settings.ANN_HNSW_EF_SEARCH, settings.ANN_IVF_NPROBE)
+        self.vectorstore = FAISS(
+            embedding_function=self.query_embeddings,
+            index=index,
+            docstore=ChunkStoreDocstore(store),
+            index_to_docstore_id=dict(enumerate(store.ids)) if writable else RowIds(len(store))
+        )
+        self.build_facet_masks()
+        logger.info(f"FAISS索引加载完成,加载路径: {self.index_path}, 子块数: {index.ntotal}")
         return True
     
+    def facet_values(self, key: str) -> List[Any]:
+        """按向量位置顺序取出某个元数据字段的值,只读加载时直接读取子块存储的列"""
+        docstore = self.vectorstore.docstore
+        if isinstance(self.vectorstore.index_to_docstore_id, RowIds):
+            return list(docstore.store.columns.get(key, [None] * len(docstore.store)))
+        ids = [docstore_id for _, docstore_id in sorted(self.vectorstore.index_to_docstore_id.items())]
+        if isinstance(docstore, ChunkStoreDocstore) and docstore.store is not None:
+            column = docstore.store.columns.get(key, [])
+            values = []
+            for docstore_id in ids:
+                if docstore_id in docstore.added:
+                    values.append(docstore.added[docstore_id].metadata.get(key))
+                else:
+                    row = docstore.store.row_of(docstore_id)
+                    values.append(column[row] if row is not None and row < len(column) else None)
+            return values
+        values = []
+        for docstore_id in ids:
+            doc = docstore.search(docstore_id)
+            values.append(doc.metadata.get(key) if isinstance(doc, Document) else None)
+        return values
+
+    def build_facet_masks(self) -> None:
+        """为分类、难度等字段建立按向量位置的布尔掩码,索引变化后需要重新计算"""
+        self.facet_masks = {}
+        for key in self.FACET_KEYS:
+            values = np.array(self.facet_values(key), dtype=object)
+            self.facet_masks[key] = {value: values == value for value in set(values.tolist()) if value is not None}
+        summary = {key: len(masks) for key, masks in self.facet_masks.items()}
+        logger.info(f"分面位图构建完成: {summary}")
+
+    def facet_mask(self, filters: Dict[str, Any]) -> Optional[np.ndarray]:
+        """
+        把过滤条件转换为向量位置掩码: 同一字段的多个取值取并集,不同字段取交集
+        Returns:
+            掩码数组; filters 中没有分面字段时返回None
+        """
+        mask = None
+        for key, value in filters.items():
+            if key not in self.facet_masks:
+                continue
+            key_mask = np.zeros(self.vectorstore.index.ntotal, dtype=bool)
+            for item in (value if isinstance(value, (list, tuple, set)) else [value]):
+                if item in self.facet_masks[key]:
+                    key_mask |= self.facet_masks[key][item]
+            mask = key_mask if mask is None else mask & key_mask
+        return mask
+
+    def filtered_similarity_search(self, query: str, filters: Dict[str, Any], k: int = 10) -> List[Document]:
+        """
+        带元数据过滤的向量检索: 用位图作为ID选择器在索引内部过滤,过滤后仍能取满k条
+        filters 中没有分面字段时退化为普通相似度搜索
+        """
+        return [doc for doc, _ in self.filtered_similarity_search_with_score(query, filters, k)]
+
+    def filtered_similarity_search_with_score(self, query: str, filters: Dict[str, Any], k: int = 10) -> List[Tuple[Document, float]]:
+        """filtered_similarity_search 的带分数版本,分数为L2距离(越小越相似)"""
+        if not self.vectorstore:
+            raise ValueError("没有可搜索的索引")
+        mask = self.facet_mask(filters)
+        if mask is None:
+            return self.vectorstore.similarity_search_with_score(query, k)
+        vector = np.asarray(self.query_embeddings.embed_query(query), dtype=np.float32)
+        distances, positions = filtered_search(self.vectorstore.index, vector, mask, k)
+        results = []
+        for distance, position in zip(distances, positions):
+            doc = self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[int(position)])
+            if isinstance(doc, Document):
+                results.append((doc, float(distance)))
+        logger.info(f"过滤向量检索: {filters}, 候选子块{int(mask.sum())}个, 返回{len(results)}个")
+        return results
+
     def similarity_search(self, query: str, k: int = 5) -> List[Document]:
         """相似度搜索"""
         logger.info(f"相似度搜索: {query}, 返回{k}个相似文档")
@@ -0,0 +1,260 @@
+#原料倒排索引模块
+import json
+import logging
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+from .generations import current_path, write_generation
+from .recipe_parser import RecipeRecord
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2
+# 旧版直接写在索引目录下的文件,切换到分代目录后删除
+INDEX_FILES = ("ingredients.npz", "format.json")
+
+# 同一种原料的不同叫法,统一为右侧的规范名
+ALIASES = {
+    "西红柿": "番茄",
+    "洋柿子": "番茄",
+    "鸡子": "鸡蛋",
+    "马铃薯": "土豆",
+    "洋芋": "土豆",
+    "番薯": "红薯",
+    "地瓜": "红薯",
+    "芫荽": "香菜",
+    "包菜": "卷心菜",
+    "圆白菜": "卷心菜",
+    "大白菜": "白菜",
+    "花椰菜": "菜花",
+    "生粉": "淀粉",
+}
+# 调味品与常备品: 默认家中都有,不计入缺少的原料
+PANTRY = {
+    "盐", "食盐", "食用油", "油", "植物油", "糖", "白糖", "白砂糖", "冰糖", "水", "清水", "开水", "热水", "冷水", "温水",
+    "凉水", "凉白开", "生抽", "老抽", "酱油", "醋", "陈醋", "香醋", "白醋", "料酒", "黄酒", "味精", "鸡精", "蚝油",
+    "胡椒粉", "白胡椒粉", "黑胡椒粉", "淀粉", "香油", "芝麻油", "冰块",
+    "葱", "小葱", "大葱", "香葱", "葱花", "姜", "生姜", "姜片", "姜丝", "蒜", "大蒜", "蒜瓣", "蒜末",
+}
+# 以这些字结尾的是厨具,不是原料
+TOOL_SUFFIXES = ("锅", "刀", "板", "碗", "盘", "铲", "箱", "机", "煲", "勺", "筷", "盆", "杯", "纸", "膜", "器", "签", "夹", "称", "秤")
+# "我只有鸡蛋、番茄和面条,可以做什么" / "冰箱里有土豆和牛肉能做啥"
+INGREDIENT_QUERY = re.compile(
+    r"(只有|就有|还有|剩下?|家里有|冰箱里?有|手头有|手上有|现有|用).+?(能|可以|可)?(做|煮|炒)(点)?(什么|啥|哪些|些什么)"
+)
+# 单字节的 1 的个数,用于对打包后的位集求 popcount
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def normalize_ingredient(name: str) -> str:
+    """原料名规范化: 去掉空白并合并别名"""
+    name = name.strip()
+    return ALIASES.get(name, name)
+
+
+def is_staple(name: str) -> bool:
+    """调味品、常备品或厨具,不参与缺少原料的计数"""
+    return name in PANTRY or name.endswith(TOOL_SUFFIXES)
+
+
+def record_ingredients(record: RecipeRecord) -> Tuple[List[str], List[str]]:
+    """
+    取结构化菜谱记录中的原料
+    Returns:
+        (必需原料, 可选原料),均为规范名;调味品和厨具归入可选
+    """
+    required, optional = {}, {}
+    for ingredient in record.ingredients:
+        name = normalize_ingredient(ingredient.name)
+        if ingredient.optional or is_staple(name):
+            optional[name] = None
+        else:
+            required[name] = None
+    # 别名合并后同一原料可能既必需又可选,以可选为准
+    return [name for name in required if name not in optional], list(optional)
+
+
+def _popcount(bits: np.ndarray) -> np.ndarray:
+    """按行统计打包位集中 1 的个数"""
+    return _POPCOUNT8[bits].sum(axis=1, dtype=np.int32)
+
+
+class IngredientIndex:
+    """
+    原料倒排索引
+    - required / optional: 菜谱 x 原料 的打包位集(每行一个菜谱,np.packbits 按原料ID打包)
+    - postings: 原料ID -> 含有该原料的菜谱行号(有序数组),用于先确定候选菜谱
+    查询时把用户已有的原料也打包为位集,对候选行做按位与/与非后 popcount,
+    得到已有原料数和缺少原料数,排序结果是精确的
+    目录结构:
+        format.json       版本号、原料表、菜谱信息与内容哈希
+        ingredients.npz   required / optional 位集
+    """
+    def __init__(self, vocabulary: List[str], recipes: List[Dict[str, Any]], required: np.ndarray, optional: np.ndarray):
+        self.vocabulary = vocabulary
+        self.term_to_id: Dict[str, int] = {term: i for i, term in enumerate(vocabulary)}
+        self.recipes = recipes
+        self.required = required
+        self.optional = optional
+        self.required_counts = _popcount(required)
+        self.required_ids: List[np.ndarray] = [
+            np.flatnonzero(row) for row in np.unpackbits(required, axis=1, count=len(vocabulary)).astype(bool)
+        ]
+        contains = np.unpackbits(required | optional, axis=1, count=len(vocabulary)).astype(bool)
+        self.postings: List[np.ndarray] = [np.flatnonzero(column) for column in contains.T]
+        # 查询时按最长匹配识别原料: 规范名和别名都可以
+        surfaces = {term: term for term in vocabulary}
+        surfaces.update({alias: name for alias, name in ALIASES.items() if name in self.term_to_id})
+        self.surfaces = sorted(surfaces.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def __len__(self) -> int:
+        return len(self.recipes)
+
+    @classmethod
+    def build(cls, records: List[RecipeRecord]) -> "IngredientIndex":
+        """由结构化菜谱记录构建索引"""
+        start = time.perf_counter()
+        parsed = [record_ingredients(record) for record in records]
+        vocabulary = sorted({name for required, optional in parsed for name in required + optional})
+        term_to_id = {term: i for i, term in enumerate(vocabulary)}
+        required_bits = np.zeros((len(records), len(vocabulary)), dtype=bool)
+        optional_bits = np.zeros((len(records), len(vocabulary)), dtype=bool)
+        for row, (required, optional) in enumerate(parsed):
+            required_bits[row, [term_to_id[name] for name in required]] = True
+            optional_bits[row, [term_to_id[name] for name in optional]] = True
+        recipes = [{
+            "parent_id": record.parent_id,
+            "name": record.name,
+            "category": record.category,
+            "difficulty": record.difficulty,
+            "content_hash": record.content_hash,
+        } for record in records]
+        index = cls(vocabulary, recipes, np.packbits(required_bits, axis=1), np.packbits(optional_bits, axis=1))
+        logger.info(f"原料倒排索引构建完成: {len(recipes)}个菜谱, {len(vocabulary)}种原料, 耗时{time.perf_counter() - start:.2f}s")
+        return index
+
+    def extract(self, text: str) -> List[str]:
+        """从用户问题中按最长匹配识别已知原料,返回规范名"""
+        found = {}
+        for surface, name in self.surfaces:
+            if surface in text:
+                # 调味品和厨具也参与匹配("冰箱" 不会再匹配出 "冰"),但不作为已有原料
+                if not is_staple(name):
+                    found[name] = None
+                # 已匹配的部分替换掉,避免 "番茄酱" 再匹配出 "番茄"
+                text = text.replace(surface, "|")
+        return list(found)
+
+    def search(self, ingredients: Iterable[str], k: int = 10, rank_by: str = "missing",
+               filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        按用户已有的原料查找菜谱
+        Args:
+            ingredients: 已有原料(规范名或别名)
+            k: 返回数量
+            rank_by: missing 按缺少原料数从少到多; coverage 按已有原料占必需原料的比例从高到低
+            filters: 菜谱元数据过滤条件(列表表示取值之一即可)
+        Returns:
+            [{parent_id, name, matched, missing, coverage}],至少用到一种已有原料的菜谱
+        """
+        if rank_by not in ("missing", "coverage"):
+            raise ValueError(f"不支持的排序方式: {rank_by}, 可选: missing / coverage")
+        ids = sorted({self.term_to_id[name] for name in map(normalize_ingredient, ingredients) if name in self.term_to_id})
+        if not ids:
+            return []
+        have = np.zeros(len(self.vocabulary), dtype=bool)
+        have[ids] = True
+        have_bits = np.packbits(have)
+        rows = np.unique(np.concatenate([self.postings[i] for i in ids]))
+        if filters:
+            rows = np.array([row for row in rows if self._match(self.recipes[row], filters)], dtype=np.int64)
+            if not len(rows):
+                return []
+        required = self.required[rows]
+        matched = _popcount(required & have_bits)
+        missing = self.required_counts[rows] - matched
+        coverage = matched / np.maximum(self.required_counts[rows], 1)
+        if rank_by == "missing":
+            order = np.lexsort((-matched, missing))
+        else:
+            order = np.lexsort((missing, -matched, -coverage))
+        results = []
+        for i in order[:k]:
+            row = int(rows[i])
+            recipe_required = self.required_ids[row]
+            results.append({
+                "parent_id": self.recipes[row]["parent_id"],
+                "name": self.recipes[row]["name"],
+                "matched": [self.vocabulary[j] for j in recipe_required if have[j]],
+                "missing": [self.vocabulary[j] for j in recipe_required if not have[j]],
+                "coverage": round(float(coverage[i]), 4),
+            })
+        return results
+
+    @staticmethod
+    def _match(recipe: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+        for key, value in filters.items():
+            if isinstance(value, list):
+                if recipe.get(key) not in value:
+                    return False
+            elif recipe.get(key) != value:
+                return False
+        return True
+
+    def search_query(self, text: str, k: int = 10, rank_by: str = "missing",
+                     filters: Optional[Dict[str, Any]] = None) -> Optional[Tuple[List[str], List[Dict[str, Any]]]]:
+        """
+        "我只有X、Y,可以做什么" 类问题的查询入口
+        Returns:
+            (识别出的原料, 匹配的菜谱);不是这类问题或识别不出原料时返回None
+        """
+        if not INGREDIENT_QUERY.search(text):
+            return None
+        ingredients = self.extract(text)
+        if not ingredients:
+            return None
+        start = time.perf_counter()
+        results = self.search(ingredients, k=k, rank_by=rank_by, filters=filters)
+        logger.info(f"原料查询: {ingredients}, 匹配{len(results)}个菜谱, 耗时{(time.perf_counter() - start) * 1e6:.0f}us")
+        return ingredients, results
+
+    def save(self, path: Union[str, Path]) -> None:
+        """写入索引目录的新一代,写完后切换当前代"""
+        with write_generation(path, legacy=INDEX_FILES) as generation:
+            np.savez(generation / "ingredients.npz", required=self.required, optional=self.optional)
+            with open(generation / "format.json", "w", encoding="utf-8") as f:
+                json.dump({"format_version": FORMAT_VERSION, "vocabulary": self.vocabulary, "recipes": self.recipes}, f, ensure_ascii=False)
+        logger.info(f"原料倒排索引保存完成: {len(self)}个菜谱, 路径: {path}")
+
+    @classmethod
+    def open(cls, path: Union[str, Path]) -> Optional["IngredientIndex"]:
+        """加载索引目录的当前代,不存在或版本不兼容时返回None"""
+        path = current_path(path)
+        if not (path / "format.json").exists():
+            return None
+        try:
+            with open(path / "format.json", "r", encoding="utf-8") as f:
+                info = json.load(f)
+            if info.get("format_version") != FORMAT_VERSION:
+                logger.warning(f"原料倒排索引版本不兼容: {info.get('format_version')}, 需要重建")
+                return None
+            arrays = np.load(path / "ingredients.npz")
+            return cls(info["vocabulary"], info["recipes"], arrays["required"], arrays["optional"])
+        except Exception as e:
+            logger.error(f"原料倒排索引加载失败: {path} - {e}")
+            return None
+
+    @classmethod
+    def load_or_build(cls, path: Union[str, Path], records: List[RecipeRecord]) -> "IngredientIndex":
+        """加载与当前菜谱一致的索引,菜谱有增删改时重建并落盘"""
+        index = cls.open(path)
+        signature = [(record.parent_id, record.content_hash) for record in records]
+        if index is not None and [(r["parent_id"], r["content_hash"]) for r in index.recipes] == signature:
+            logger.info(f"原料倒排索引加载完成: {len(index)}个菜谱, {len(index.vocabulary)}种原料")
+            return index
+        index = cls.build(records)
+        index.save(path)
+        return index
@@ -0,0 +1,168 @@
+#本地意图分类模块
+import logging
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INTENTS = ("list", "detail", "general")
+# "宫保鸡丁怎么做" / "红烧肉需要哪些材料" / "糖醋排骨的步骤"
+# 用量: "番茄炒蛋要放几个鸡蛋" / "红烧肉用几个八角" / "2个人的红烧肉要多少肉"
+DETAIL_PATTERN = re.compile(
+    r"(怎么|如何|怎样|咋)(做|炒|煮|烧|炖|蒸|煎|炸|烤|卤|腌|拌|制作|弄)|做法|步骤|制作(方法|过程)|"
+    r"(需要|要|准备)(哪些|什么|啥)(材料|食材|原料|调料|配料)|用料|配方|多少(克|g|毫升|ml)|火候|"
+    r"(放|用|加|需要|要)(几|多少)"
+)
+# "推荐几个素菜" / "有什么简单的汤" / "给我3个快手菜" / "来两道下饭菜"
+# 数量只有后面跟着菜品类别时才算列表: "蛋炒饭用几个蛋" / "做一道红烧肉" 不命中
+LIST_PATTERN = re.compile(
+    r"推荐|有(什么|哪些|啥)(简单|快手|家常|下饭|清淡|好做|素|荤|凉|热|的)*(菜|汤|甜品|饮品|早餐|主食|好吃)|来(几|一些|点)|"
+    r"(几|[0-9一二两三四五六七八九十]+)(个|道|款|种)(简单|快手|家常|下饭|清淡|好吃|好做|素|荤|凉|热|的)*"
+    r"(菜|汤|甜品|甜点|点心|饮品|早餐|主食|小吃)|列出|清单|吃(什么|点什么|啥)"
+)
+# "什么是川菜" / "番茄的营养价值" / "生抽和老抽的区别"
+GENERAL_PATTERN = re.compile(r"什么是|是什么|为什么|区别|营养|功效|热量|卡路里|历史|起源|由来|好处|坏处|能不能|可以吗")
+PATTERNS = {"detail": DETAIL_PATTERN, "list": LIST_PATTERN, "general": GENERAL_PATTERN}
+
+
+class IntentPrediction:
+    """本地意图预测: 意图、来源(rule/centroid)、置信度(最近质心与次近质心的余弦相似度差,规则命中为1)、是否直接采用"""
+    __slots__ = ("intent", "source", "confidence", "confident")
+
+    def __init__(self, intent: str, source: str, confidence: float, confident: bool):
+        self.intent = intent
+        self.source = source
+        self.confidence = confidence
+        self.confident = confident
+
+    def __repr__(self) -> str:
+        return f"<IntentPrediction(intent='{self.intent}', source='{self.source}', confidence={self.confidence:.3f}, confident={self.confident})>"
+
+
+class IntentClassifier:
+    """
+    查询路由前的本地意图分类器
+    1. 规则: 只有一类意图的关键词命中时直接采用
+    2. 最近质心: 用 chat_messages 中已标注意图的历史问题向量求各意图的质心,
+       与次近质心的余弦相似度差达到 margin 时直接采用
+    其余问题交给大模型;被交给大模型的问题和按 shadow_rate 抽样的直接采用问题都与大模型结果比对,统计一致率
+    """
+    def __init__(self, margin: float = 0.1, min_examples: int = 20, shadow_rate: float = 0.05, log_every: int = 100):
+        """
+        Args:
+            margin: 最近质心直接采用所需的最小相似度差
+            min_examples: 每个意图参与质心计算的最少样本数,不足的意图不建质心
+            shadow_rate: 直接采用的问题中,抽样交给大模型复核的比例
+            log_every: 每处理多少个问题输出一次统计日志
+        """
+        self.margin = margin
+        self.min_examples = min_examples
+        self.shadow_rate = shadow_rate
+        self.log_every = max(1, log_every)
+        self.intents: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self._rng = np.random.default_rng()
+        self.stats_counts = {"queries": 0, "bypassed": 0, "rule": 0, "centroid": 0, "compared": 0, "agreed": 0}
+
+    def train(self, texts: Sequence[str], intents: Sequence[str], embed: Callable[[List[str]], List[List[float]]]) -> Dict[str, int]:
+        """
+        由已标注意图的历史问题计算各意图的质心
+        Args:
+            texts: 用户问题
+            intents: 对应的意图标签,非 list/detail/general 的样本忽略
+            embed: 批量编码函数,需与分类时的问题向量处于同一向量空间
+        Returns:
+            参与训练的各意图样本数
+        """
+        examples: Dict[str, List[str]] = {intent: [] for intent in INTENTS}
+        for text, intent in zip(texts, intents):
+            if intent in examples and text:
+                examples[intent].append(text)
+        counts = {intent: len(items) for intent, items in examples.items()}
+        usable = [intent for intent in INTENTS if counts[intent] >= self.min_examples]
+        if len(usable) < 2:
+            logger.info(f"意图样本不足,只使用规则分类: {counts}")
+            self.intents, self.centroids = [], None
+            return counts
+        centroids = []
+        for intent in usable:
+            vectors = np.asarray(embed(examples[intent]), dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            centroid = vectors.mean(axis=0)
+            centroids.append(centroid / max(float(np.linalg.norm(centroid)), 1e-12))
+        self.intents, self.centroids = usable, np.stack(centroids)
+        logger.info(f"意图质心训练完成: {counts}")
+        return counts
+
+    @property
+    def has_centroids(self) -> bool:
+        return self.centroids is not None
+
+    @staticmethod
+    def rule_intent(query: str) -> Optional[str]:
+        """只有一类意图的关键词命中时返回该意图"""
+        matched = [intent for intent, pattern in PATTERNS.items() if pattern.search(query)]
+        return matched[0] if len(matched) == 1 else None
+
+    def centroid_intent(self, vector: Sequence[float]) -> Optional[IntentPrediction]:
+        """最近质心分类,没有质心时返回None"""
+        if self.centroids is None:
+            return None
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape[0] != self.centroids.shape[1]:
+            return None
+        similarities = self.centroids @ (vector / max(float(np.linalg.norm(vector)), 1e-12))
+        order = np.argsort(-similarities)
+        margin = float(similarities[order[0]] - similarities[order[1]])
+        return IntentPrediction(self.intents[order[0]], "centroid", margin, margin >= self.margin)
+
+    def classify(self, query: str, vector: Optional[Sequence[float]] = None) -> Optional[IntentPrediction]:
+        """
+        本地分类: 先规则,再最近质心
+        Args:
+            vector: 问题向量,为None时只用规则
+        Returns:
+            预测结果(confident 为False时只作为与大模型比对的参考);两种方式都无法给出结果时返回None
+        """
+        intent = self.rule_intent(query)
+        prediction = IntentPrediction(intent, "rule", 1.0, True) if intent else None
+        if prediction is None and vector is not None:
+            prediction = self.centroid_intent(vector)
+        with self._lock:
+            self.stats_counts["queries"] += 1
+            if prediction is not None and prediction.confident:
+                self.stats_counts["bypassed"] += 1
+                self.stats_counts[prediction.source] += 1
+            should_log = self.stats_counts["queries"] % self.log_every == 0
+        if should_log:
+            logger.info(f"本地意图分类统计: {self.stats()}")
+        return prediction
+
+    def should_shadow(self) -> bool:
+        """直接采用的问题是否抽样交给大模型复核"""
+        return self.shadow_rate > 0 and self._rng.random() < self.shadow_rate
+
+    def record_agreement(self, prediction: Optional[IntentPrediction], llm_intent: str) -> None:
+        """记录本地预测与大模型意图是否一致"""
+        if prediction is None:
+            return
+        agreed = prediction.intent == llm_intent
+        with self._lock:
+            self.stats_counts["compared"] += 1
+            self.stats_counts["agreed"] += int(agreed)
+        if not agreed:
+            logger.debug(f"本地意图与大模型不一致: 本地{prediction}, 大模型: {llm_intent}")
+
+    def stats(self) -> Dict[str, Any]:
+        """直接采用率(bypass_rate)与和大模型的一致率(agreement)"""
+        counts = dict(self.stats_counts)
+        return {
+            **counts,
+            "bypass_rate": round(counts["bypassed"] / counts["queries"], 4) if counts["queries"] else 0.0,
+            "agreement": round(counts["agreed"] / counts["compared"], 4) if counts["compared"] else None,
+            "centroid_intents": list(self.intents),
+        }
@@ -1,15 +1,81 @@
 #LLM生成模块构建
+import json
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Literal, Optional
 from langchain.chat_models import init_chat_model
 from langchain.agents import create_agent
 from langchain_core.documents import Document
 from langchain_core.messages import AIMessageChunk
+from pydantic import BaseModel, Field, field_validator
 from ..db.database import Recipe
+from .document_processor import RecipeDocumentProcessor
+from .recipe_parser import RecipeRecord
 import os
 from ..config import settings
 
 logger = logging.getLogger(__name__)
+
+
+class QueryFilters(BaseModel):
+    """从问题中抽取的元数据过滤条件;不在已有分类、难度中的取值视为未提及"""
+    category: Optional[str] = None
+    difficulty: Optional[str] = None
+
+    @field_validator("category", mode="before")
+    @classmethod
+    def check_category(cls, value: Any) -> Optional[str]:
+        mapping = RecipeDocumentProcessor.CATEGORY_MAPPING
+        value = mapping.get(value, value) if isinstance(value, str) else None
+        return value if value in mapping.values() else None
+
+    @field_validator("difficulty", mode="before")
+    @classmethod
+    def check_difficulty(cls, value: Any) -> Optional[str]:
+        return value if value in RecipeDocumentProcessor.DIFFICULTY_LABELS else None
+
+
+class QueryAnalysis(BaseModel):
+    """合并的查询分析结果: 重写后的查询、意图和可选的过滤条件"""
+    rewritten_query: str = Field(min_length=1)
+    intent: Literal["list", "detail", "general"]
+    filters: QueryFilters = Field(default_factory=QueryFilters)
+
+    @field_validator("rewritten_query", mode="before")
+    @classmethod
+    def strip_query(cls, value: Any) -> Any:
+        return value.strip() if isinstance(value, str) else value
+
+    @field_validator("intent", mode="before")
+    @classmethod
+    def normalize_intent(cls, value: Any) -> Any:
+        return value.strip().lower() if isinstance(value, str) else value
+
+    @field_validator("filters", mode="before")
+    @classmethod
+    def default_filters(cls, value: Any) -> Any:
+        return value or {}
+
+    def filter_dict(self) -> Dict[str, str]:
+        """非空的过滤条件"""
+        return self.filters.model_dump(exclude_none=True)
+
+
+def parse_query_analysis(text: str) -> QueryAnalysis:
+    """
+    解析模型输出的JSON(允许包在 ```json 代码块中)并校验
+    Raises:
+        ValueError: 不是合法JSON或字段校验失败(pydantic.ValidationError 是 ValueError 的子类)
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError(f"输出中没有JSON对象: {text[:200]}")
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON解析失败: {e}") from e
+    return QueryAnalysis.model_validate(data)
+
+
 class RecipeLLMGeneration:
     """菜谱LLM生成器"""
     def __init__(self, model_name: str):
@@ -50,6 +116,40 @@ class RecipeLLMGeneration:
         return result
 
 
+    def analyze_query(self, query: str) -> QueryAnalysis:
+        """
+        一次调用完成查询重写、意图识别和过滤条件抽取,代替 rewrite_query + query_router 两次往返
+        Raises:
+            ValueError: 模型输出无法解析或校验失败,调用方退回两次调用的流程
+        """
+        categories = "、".join(dict.fromkeys(RecipeDocumentProcessor.CATEGORY_MAPPING.values()))
+        difficulties = "、".join(RecipeDocumentProcessor.DIFFICULTY_LABELS)
+        analysis_prompt = f"""
+        你是一个菜谱问答的查询分析助手。请分析用户问题，只输出一个 JSON 对象，不要输出任何其他文字：
+        {{"rewritten_query": "...", "intent": "list|detail|general", "filters": {{"category": null, "difficulty": null}}}}
+
+        字段说明：
+        1. rewritten_query：用于菜谱检索的查询。
+        - 具体明确的查询（包含具体菜名、明确的制作询问或烹饪技巧）直接返回原问题，如"宫保鸡丁怎么做"
+        - 模糊的查询需要重写：保持原意，增加相关烹饪术语，优先简单易做，保持简洁，如"做菜" → "简单易做的家常菜谱"、"川菜" → "经典川菜菜谱"
+        2. intent：只能是以下三个标签之一。
+        - list：想要菜品列表或推荐（只需要菜名），如"推荐几个素菜"、"给我3个简单的菜"
+        - detail：想要具体的制作方法、步骤或所需食材，如"宫保鸡丁怎么做"、"需要哪些材料"
+        - general：其他泛化或背景类问题，如"什么是川菜"、"营养价值"；无法确定时返回 general
+        3. filters：用户明确提到的分类和难度，没有提到时为 null。
+        - category 只能取：{categories}
+        - difficulty 只能取：{difficulties}
+
+        用户问题：{query}
+        JSON："""
+
+        analysis_chain = create_agent(
+            model=self.llm,
+            tools=[]
+        )
+        result = analysis_chain.invoke({"messages": [{"role": "user", "content": analysis_prompt}]})
+        return parse_query_analysis(result['messages'][-1].content)
+
     def general_question(self,query:str,context:str,streaming:bool=False):
         """通用问题"""
         general_prompt = f"""
@@ -177,26 +277,35 @@ class RecipeLLMGeneration:
             return f"为您推荐：{dish_names[0]}"
         else:
             return f"为您推荐以下菜品：\n" + "\n".join([f"{i+1}. {name}" for i, name in enumerate(dish_names)])
+
+    def ingredient_question(self, ingredients: List[str], matches: List[Dict[str, Any]]) -> str:
+        """按已有原料推荐菜品,列出每道菜还缺少的原料"""
+        if not matches:
+            return "抱歉，没有找到能用这些原料做的食谱"
+        lines = []
+        for i, match in enumerate(matches):
+            missing = f"还缺：{'、'.join(match['missing'])}" if match["missing"] else "原料齐全"
+            lines.append(f"{i+1}. {match['name']}（{missing}）")
+        return f"根据您现有的原料（{'、'.join(ingredients)}），为您推荐以下菜品：\n" + "\n".join(lines)
         
 
-    def build_context(self,docs:List[Recipe],maxlength:int=2000)->str:
-        """构建上下文"""
+    def build_context(self,docs:List[Recipe],maxlength:int=2000,records:Optional[Dict[str, RecipeRecord]]=None)->str:
+        """
+        构建上下文
+        有结构化菜谱记录时使用紧凑的原料、步骤文本,否则使用Markdown原文
+        """
         if not docs:
             logger.warning("没有可构建上下文的文档")
             return ""
         context_parts = []
         context_length = 0
         for i, doc in enumerate(docs):
-            # metadata = doc.metadata
-            # metadata_info = f"食谱{i}:"
-            # if "name" in metadata:
-            #     metadata_info += f"菜名: {metadata['name']}\n"
-            # if "category" in metadata:
-            #     metadata_info += f"分类: {metadata['category']}\n"
-            # if "difficulty" in metadata:
-            #     metadata_info += f"难度: {metadata['difficulty']}\n"
-            metadata_info = f"食谱{i}: 菜名: {doc.name}, 分类: {doc.category}, 难度: {doc.difficulty}\n"
-            doc_text = f"metadata_info:{metadata_info}\n{doc.content}"
+            record = records.get(doc.parent_id) if records else None
+            if record is not None:
+                doc_text = f"食谱{i}: {record.to_prompt()}\n"
+            else:
+                metadata_info = f"食谱{i}: 菜名: {doc.name}, 分类: {doc.category}, 难度: {doc.difficulty}\n"
+                doc_text = f"metadata_info:{metadata_info}\n{doc.content}"
             if context_length + len(doc_text) <= maxlength:
                 context_parts.append(doc_text)
                 context_length += len(doc_text)
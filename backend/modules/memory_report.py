@@ -0,0 +1,171 @@
+#内存报告模块
+import argparse
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import sys
+from queue import Empty
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss_mb() -> Optional[float]:
+    """
+    当前进程的常驻内存(RSS, MB)
+    Linux 读取 /proc/self/status;其他平台使用 psutil(未安装时返回None)
+    """
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return round(psutil.Process().memory_info().rss / 1024 / 1024, 1)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """当前进程的RSS峰值(MB),Windows 上不可用时返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节,Linux 为KB
+    return round(peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def process_memory_mb() -> Dict[str, Optional[float]]:
+    """
+    当前进程的 RSS / PSS / 私有内存(MB)
+    多个 worker 内存映射同一份索引和子块存储时,映射页只在各进程的 RSS 中重复计算;
+    私有内存(Private_Clean + Private_Dirty)才是每多一个 worker 增加的内存,PSS 按共享进程数分摊映射页
+    Linux 读取 /proc/self/smaps_rollup;其他平台使用 psutil(未安装时只有RSS)
+    """
+    try:
+        values = {}
+        with open("/proc/self/smaps_rollup", "r", encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    values[parts[0][:-1]] = int(parts[1])
+        return {
+            "rss_mb": round(values["Rss"] / 1024, 1),
+            "pss_mb": round(values["Pss"] / 1024, 1),
+            "private_mb": round((values["Private_Clean"] + values["Private_Dirty"]) / 1024, 1),
+        }
+    except (OSError, KeyError):
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_full_info()
+        return {
+            "rss_mb": round(info.rss / 1024 / 1024, 1),
+            "pss_mb": round(info.pss / 1024 / 1024, 1) if hasattr(info, "pss") else None,
+            "private_mb": round(info.uss / 1024 / 1024, 1),
+        }
+    except Exception:
+        return {"rss_mb": current_rss_mb(), "pss_mb": None, "private_mb": None}
+
+
+def memory_report() -> Dict[str, Any]:
+    """当前进程的内存报告;每个 uvicorn worker 是独立进程,各自报告自己的RSS"""
+    return {"pid": os.getpid(), **process_memory_mb(), "peak_rss_mb": peak_rss_mb()}
+
+
+def _measure_worker(layout: str, queries: List[str], results, barrier) -> None:
+    """
+    模拟一个 uvicorn worker: 按当前配置启动RAG引擎、执行几次检索后报告内存
+    所有 worker 都报告完才退出,PSS 才能反映共享的映射页
+    """
+    from ..config import Settings
+    from ..db.database import DatabaseManager
+    from .rag_engine import RecipeRAGEngine
+
+    settings = Settings()
+    engine = RecipeRAGEngine(data_path=settings.DATA_PATH,
+                             document_path=settings.DOCUMENT_PATH,
+                             chunks_path=settings.CHUNKS_PATH,
+                             parent_child_map_path=settings.PARENT_CHILD_MAP_PATH,
+                             index_path=settings.INDEX_PATH,
+                             embedding_model_name=settings.EMBEDDING_MODEL_NAME,
+                             db_manager=DatabaseManager(settings.DB_URL),
+                             manifest_path=settings.MANIFEST_PATH,
+                             incremental=settings.INCREMENTAL_INDEX)
+    engine.setup_rag_service()
+    for query in queries:
+        docs = engine.retrieval_optimizer.hybrid_search(query, k=6)
+        engine.document_processor.get_parent_recipes(docs)
+    gc.collect()
+    results.put({"layout": layout, "pid": os.getpid(), **process_memory_mb(),
+                 "setup_delta_mb": engine.memory_report.get("rss_delta_mb"),
+                 "shared_chunk_store": engine.memory_report.get("shared_chunk_store")})
+    barrier.wait()
+
+
+def compare_layouts(workers: int = 2, queries: List[str] = None) -> List[Dict[str, Any]]:
+    """
+    分别用旧布局(父文档和子块常驻为 Document 列表)和共享子块存储布局启动 workers 个进程,
+    每个进程报告启动并检索后的 RSS / PSS / 私有内存;两种布局加载的嵌入和重排模型相同,差值即布局带来的节省
+    需要先完成一次索引构建,避免测量中包含嵌入耗时和写盘
+    """
+    queries = queries or ["红烧肉怎么做", "推荐几道汤", "番茄炒蛋需要哪些材料"]
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for layout, shared in (("legacy", "false"), ("shared", "true")):
+        os.environ["SHARED_CHUNK_STORE"] = shared
+        queue, barrier = context.Queue(), context.Barrier(workers + 1)
+        processes = [context.Process(target=_measure_worker, args=(layout, queries, queue, barrier)) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        layout_results = []
+        while len(layout_results) < workers:
+            try:
+                layout_results.append(queue.get(timeout=5))
+            except Empty:
+                if not any(process.is_alive() for process in processes):
+                    raise RuntimeError(f"{layout} 布局的 worker 进程异常退出,未报告内存")
+        barrier.wait()
+        for process in processes:
+            process.join()
+        results.extend(layout_results)
+    return results
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """每种布局每个 worker 的平均 RSS / PSS / 私有内存"""
+    summary = {}
+    for layout in dict.fromkeys(result["layout"] for result in results):
+        rows = [result for result in results if result["layout"] == layout]
+        summary[layout] = {
+            key: round(sum(row[key] for row in rows) / len(rows), 1)
+            for key in ("rss_mb", "pss_mb", "private_mb", "setup_delta_mb")
+            if all(row.get(key) is not None for row in rows)
+        }
+    return summary
+
+
+if __name__ == "__main__":
+    from ..logging_config import setup_logging
+
+    parser = argparse.ArgumentParser(description="对比旧布局与共享子块存储布局下每个 worker 的内存")
+    parser.add_argument("--workers", type=int, default=2, help="每种布局同时启动的 worker 进程数")
+    args = parser.parse_args()
+    setup_logging()
+    results = compare_layouts(args.workers)
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False))
+    summary = summarize(results)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if {"legacy", "shared"} <= summary.keys():
+        print("每个 worker 节省: " + ", ".join(
+            f"{key} {summary['legacy'][key] - summary['shared'][key]:.1f}MB"
+            for key in ("rss_mb", "pss_mb", "private_mb") if key in summary["legacy"] and key in summary["shared"]
+        ))
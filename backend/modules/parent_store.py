@@ -0,0 +1,128 @@
+#父文档存储模块
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from langchain_core.documents import Document
+
+from .chunk_store import ChunkStore
+
+logger = logging.getLogger(__name__)
+
+
+class ParentRecipe:
+    """
+    只读的父菜谱记录,字段与数据库 Recipe 一致(不含自增ID)
+    由父文档存储按行构建时只在查询时生成,不常驻内存
+    """
+    __slots__ = ("parent_id", "name", "category", "difficulty", "content", "file_path")
+
+    def __init__(self, parent_id: str, name: str, category: str, difficulty: Optional[str], content: str, file_path: str = ""):
+        self.parent_id = parent_id
+        self.name = name
+        self.category = category
+        self.difficulty = difficulty
+        self.content = content
+        self.file_path = file_path
+
+    @classmethod
+    def from_document(cls, doc: Document) -> "ParentRecipe":
+        return cls.from_metadata(doc.metadata, doc.page_content)
+
+    @classmethod
+    def from_row(cls, store: ChunkStore, row: int) -> "ParentRecipe":
+        """直接从父文档存储的行构建,不经过Document"""
+        return cls.from_metadata(store.get_metadata(row), store.get_text(row))
+
+    @classmethod
+    def from_metadata(cls, metadata: Dict[str, Any], content: str) -> "ParentRecipe":
+        return cls(
+            parent_id=metadata.get("parent_id", ""),
+            name=metadata.get("name", ""),
+            category=metadata.get("category", ""),
+            difficulty=metadata.get("difficulty"),
+            content=content,
+            file_path=metadata.get("source", ""),
+        )
+
+    def __repr__(self) -> str:
+        return f"<ParentRecipe(parent_id='{self.parent_id}', name='{self.name}', category='{self.category}')>"
+
+
+class ParentStore:
+    """
+    进程内的父菜谱存储,由当前一代引擎的父文档构建,热加载时随新一代引擎重建
+    父文档已落盘时只保存 parent_id -> 行号,文本从父文档 ChunkStore 的内存映射中读取
+    未命中的父文档ID通过 fallback 一次批量查询数据库;存储本身只读,不写入查询结果
+    """
+    def __init__(self, recipes: Dict[str, ParentRecipe] = None, fallback: Callable[[List[str]], Dict[str, Any]] = None,
+                 store: ChunkStore = None, rows: Dict[str, int] = None):
+        """
+        Args:
+            recipes: parent_id -> 父菜谱记录
+            fallback: 批量查询未命中父文档的函数,如 DatabaseManager.select_parents_by_ids
+            store: 父文档存储,与 rows 一起使用
+            rows: parent_id -> 父文档存储中的行号
+        """
+        self.recipes = recipes or {}
+        self.store = store
+        self.rows = rows or {}
+        self.fallback = fallback
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db_queries = 0
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Document], fallback: Callable[[List[str]], Dict[str, Any]] = None) -> "ParentStore":
+        recipes = {}
+        for doc in documents:
+            recipe = ParentRecipe.from_document(doc)
+            recipes[recipe.parent_id] = recipe
+        logger.info(f"父文档存储构建完成: {len(recipes)}个菜谱")
+        return cls(recipes, fallback)
+
+    @classmethod
+    def from_chunk_store(cls, store: ChunkStore, fallback: Callable[[List[str]], Dict[str, Any]] = None) -> "ParentStore":
+        """按行号引用已落盘的父文档,不复制文本"""
+        rows = {parent_id: row for row, parent_id in enumerate(store.columns.get("parent_id", store.ids)) if parent_id}
+        logger.info(f"父文档存储构建完成: {len(rows)}个菜谱(按行号引用父文档存储)")
+        return cls(fallback=fallback, store=store, rows=rows)
+
+    def __len__(self) -> int:
+        return len(self.recipes) + len(self.rows)
+
+    def get(self, parent_id: str) -> Optional[ParentRecipe]:
+        """按ID获取父菜谱,不在存储中时返回None(不回退数据库,不计入统计)"""
+        if parent_id in self.rows:
+            return ParentRecipe.from_row(self.store, self.rows[parent_id])
+        return self.recipes.get(parent_id)
+
+    def get_many(self, parent_ids: List[str]) -> Dict[str, Any]:
+        """批量获取父菜谱,返回 parent_id -> 记录;不存在的ID不出现在结果中"""
+        found = {}
+        for parent_id in parent_ids:
+            if parent_id not in found:
+                recipe = self.get(parent_id)
+                if recipe is not None:
+                    found[parent_id] = recipe
+        missing = [parent_id for parent_id in dict.fromkeys(parent_ids) if parent_id not in found]
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(missing)
+            if missing and self.fallback is not None:
+                self.db_queries += 1
+        if missing and self.fallback is not None:
+            found.update(self.fallback(missing))
+        return found
+
+    def stats(self) -> Dict[str, Any]:
+        """命中统计: db_queries 为回退到数据库的批量查询次数"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "db_queries": self.db_queries,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
@@ -1,74 +1,170 @@
 #RAG引擎模块
 import logging
+from pathlib import Path
 from typing import List, Dict, Any
 from langchain_core.documents import Document
 from .index_construction import RecipeIndexBuilder
 from .retrieval_optimization import RecipeRetrievalOptimizer
+from .bm25_index import BM25Index
+from .ingredient_index import IngredientIndex
+from .tokenizer import load_tokenizer
 from .document_processor import RecipeDocumentProcessor
-from ..config import Settings
+from .memory_report import current_rss_mb
+from ..config import settings
 from ..db.database import DatabaseManager
 
 logger = logging.getLogger(__name__)
 class RecipeRAGEngine:
     """菜谱RAG引擎"""
-    def __init__(self, data_path:str, document_path:str, chunks_path:str, parent_child_map_path:str, index_path:str, embedding_model_name:str, db_manager:DatabaseManager):
-        """初始化菜谱RAG引擎"""
+    def __init__(self, data_path:str, document_path:str, chunks_path:str, parent_child_map_path:str, index_path:str, embedding_model_name:str, db_manager:DatabaseManager,
+                 manifest_path:str=None, incremental:bool=False, generation:int=1, previous:"RecipeRAGEngine"=None):
+        """
+        初始化菜谱RAG引擎
+        Args:
+            generation: 索引代数,每次热加载加一
+            previous: 上一代引擎,新一代复用其已加载的嵌入模型和重排模型
+        """
         self.data_path = data_path
         self.document_path = document_path
         self.chunks_path = chunks_path
         self.parent_child_map_path = parent_child_map_path
         self.index_path = index_path
         self.embedding_model_name = embedding_model_name
+        self.manifest_path = manifest_path
+        self.incremental = incremental
         self.document_processor = None
         self.index_builder = None
         self.retrieval_optimizer = None
         self.db_manager = db_manager
+        self.generation = generation
+        self.previous = previous
+        # 本代引擎启动前后的进程RSS与常驻的文档/子块数
+        self.memory_report: Dict[str, Any] = {}
         
     def setup_rag_service(self) -> None:
         """设置RAG服务"""
         logger.info("设置RAG服务")
+        rss_before = current_rss_mb()
         self.document_processor = RecipeDocumentProcessor(
             data_path=self.data_path,
             document_path=self.document_path,
             chunks_path=self.chunks_path,
             parent_child_map_path=self.parent_child_map_path,
-            db_manager=self.db_manager
+            db_manager=self.db_manager,
+            manifest_path=self.manifest_path
         )
         
         #获取所有菜谱文档
         documents = self.document_processor.load_documents()
         #获取所有子块
         chunks = self.document_processor.markdown_header_spliter()
+        #增量同步: 只重新切分新增、修改、删除的菜谱
+        diff = None
+        if self.incremental:
+            diff = self.document_processor.sync_documents()
+            chunks = self.document_processor.chunks
         #获取数据统计信息
         statistics = self.document_processor.get_statistics()
         logger.info(f"数据统计信息: {statistics}")
         #将元数据导出为JSON文件
         self.document_processor.export_metadata(output_path="E:/algorithm_study/agent_learning/CookRag/backend/temp/metadata.json")
         #加载FAISS索引
-        self.index_builder = RecipeIndexBuilder(embedding_model_name=self.embedding_model_name, index_path=self.index_path)
-        if self.index_builder.load_index():
+        previous = self.previous
+        self.index_builder = RecipeIndexBuilder(
+            embedding_model_name=self.embedding_model_name,
+            index_path=self.index_path,
+            embeddings=previous.index_builder.embeddings if previous and previous.index_builder else None
+        )
+        has_changes = bool(diff and (diff["new_chunks"] or diff["removed_chunk_ids"]))
+        documents_changed = bool(diff and (diff["added"] or diff["changed"] or diff["deleted"]))
+        if self.index_builder.load_index(writable=has_changes):
             logger.info("FAISS索引加载完成")
+            if not has_changes:
+                #子块由入库命令行重新生成时,索引可能落后于子块存储
+                new_chunks, removed_chunk_ids = self.index_builder.stale_chunks(chunks)
+                if new_chunks or removed_chunk_ids:
+                    logger.warning(f"索引与子块存储不一致: 新增{len(new_chunks)}个, 删除{len(removed_chunk_ids)}个子块, 校正索引")
+                    self.index_builder.load_index(writable=True)
+                    diff = {"new_chunks": new_chunks, "removed_chunk_ids": removed_chunk_ids}
+                    has_changes = True
+            if has_changes:
+                #只对变化的子块重新嵌入
+                self.index_builder.apply_diff(diff["new_chunks"], diff["removed_chunk_ids"])
+                self.index_builder.save_index()
+                self.index_builder.prune_embedding_cache(chunks)
         else:
             #构建FAISS索引
             self.index_builder.build_index(chunks)
             #保存FAISS索引
             self.index_builder.save_index()
+        if self.incremental and (documents_changed or has_changes):
+            #索引落盘后再保存文件清单,中途失败时下次启动会重新应用同一份差异;没有变化时不重写存储
+            self.document_processor.persist_state()
+        if settings.SHARED_CHUNK_STORE:
+            #子块改为引用向量索引的子块存储: 子块下标、向量位置和BM25行号是同一个整数ID,进程内只保留这一份子块
+            shared_chunks = self.index_builder.chunk_documents()
+            if shared_chunks is not None and len(shared_chunks) == len(chunks):
+                self.document_processor.chunks = chunks = shared_chunks
+        else:
+            #旧布局: 父文档和子块常驻为 Document 列表,只用于内存对比(python -m backend.modules.memory_report)
+            shared_chunks = None
+            self.document_processor.documents = list(self.document_processor.documents)
+            self.document_processor.chunks = chunks = list(chunks)
+        #由当前父文档构建进程内父菜谱存储,回溯父文档不再逐个查询数据库
+        self.document_processor.build_parent_store(settings.PARENT_STORE_ENABLED)
         vectorstore = self.index_builder.vectorstore
-        self.retrieval_optimizer = RecipeRetrievalOptimizer(vectorstore, chunks)
-        logger.info("RAG服务设置完成")
+        #加载菜谱分词器(启动时即完成初始化,首个请求不再等待词典加载)
+        tokenizer = load_tokenizer(self.document_processor.documents, self.document_processor.recipe_records(), settings.TOKENIZER_CACHE_PATH, settings.TOKENIZER_TRIM_DICT)
+        #加载BM25索引,只对新增或修改的子块重新分词
+        bm25_index = BM25Index.load_or_build(
+            Path(self.index_path) / "bm25",
+            [chunk.page_content for chunk in chunks],
+            RecipeIndexBuilder.get_chunk_ids(chunks),
+            tokenizer.tokenize,
+            k1=settings.BM25_K1,
+            b=settings.BM25_B,
+            signature=tokenizer.signature
+        )
+        logger.info(f"分词器统计: {tokenizer.stats()}")
+        #加载原料倒排索引,菜谱有变化时重建
+        self.ingredient_index = IngredientIndex.load_or_build(Path(self.index_path) / "ingredients", self.document_processor.recipe_records())
+        self.retrieval_optimizer = RecipeRetrievalOptimizer(
+            vectorstore, chunks,
+            index_builder=self.index_builder,
+            bm25_index=bm25_index,
+            tokenizer=tokenizer,
+            reranker=previous.retrieval_optimizer.reranker if previous and previous.retrieval_optimizer else None,
+            rerank_batcher=previous.retrieval_optimizer.rerank_batcher if previous and previous.retrieval_optimizer else None,
+            rerank_cache=previous.retrieval_optimizer.rerank_cache if previous and previous.retrieval_optimizer else None,
+            generation=self.generation
+        )
+        # 不再持有上一代引擎,旧索引在最后一个请求结束后即可被回收
+        self.previous = None
+        rss_after = current_rss_mb()
+        self.memory_report = {
+            "rss_before_mb": rss_before,
+            "rss_after_mb": rss_after,
+            "rss_delta_mb": round(rss_after - rss_before, 1) if rss_before is not None and rss_after is not None else None,
+            "documents": len(self.document_processor.documents),
+            "chunks": len(chunks),
+            "shared_chunk_store": shared_chunks is not None and chunks is shared_chunks,
+        }
+        logger.info(f"内存报告: {self.memory_report}")
+        logger.info(f"RAG服务设置完成, 索引代数: {self.generation}")
 
 if __name__ == "__main__":
     from ..logging_config import setup_logging
 
     setup_logging()
-    settings = Settings()
     rag_engine = RecipeRAGEngine(data_path=settings.DATA_PATH, 
                         document_path=settings.DOCUMENT_PATH, 
                         chunks_path=settings.CHUNKS_PATH, 
                         parent_child_map_path=settings.PARENT_CHILD_MAP_PATH, 
                         index_path=settings.INDEX_PATH, 
                         embedding_model_name=settings.EMBEDDING_MODEL_NAME,
-                        db_url=settings.DB_URL
+                        db_manager=DatabaseManager(settings.DB_URL),
+                        manifest_path=settings.MANIFEST_PATH,
+                        incremental=settings.INCREMENTAL_INDEX
                         )
     rag_engine.setup_rag_service()
     print(rag_engine.retrieval_optimizer.hybrid_search("宫保鸡丁"))
@@ -0,0 +1,212 @@
+#菜谱解析模块
+import json
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+RECORDS_FILE = "records.json"
+
+INGREDIENT_SECTION = "必备原料和工具"
+QUANTITY_SECTION = "计算"
+STEP_SECTION = "操作"
+INGREDIENT_SECTIONS = (INGREDIENT_SECTION, QUANTITY_SECTION)
+DIFFICULTY_BY_STARS = {1: "非常简单", 2: "简单", 3: "中等", 4: "困难", 5: "非常困难"}
+
+DIFFICULTY_LINE = re.compile(r"预估烹饪难度[：:]\s*(★+)")
+IMAGE_REF = re.compile(r"!\[[^\]]*\]\(\s*([^)\s]+)")
+LIST_ITEM = re.compile(r"^(\s*)(?:[*+-]|\d+[.、])\s*(.*)$")
+LEADING_CJK = re.compile(r"[\u4e00-\u9fff、]+")
+INGREDIENT_SEPARATORS = re.compile(r"、|或|和|及|与")
+# 原料名: 1-6个汉字,不以数量词开头;单字原料(葱、姜、米)也保留
+NAME_TERM = re.compile(r"^(?![一二两三四五六七八九十半几每约])[\u4e00-\u9fff]{1,6}$")
+# "辅料：`生姜`、`冰糖`" 这类行,冒号后才是原料
+LABELED_LINE = re.compile(r"^([\u4e00-\u9fff]{1,4})\s*[：:]\s*(.*)$")
+LABELS = {"主料", "辅料", "配料", "调料", "调味料", "炒料", "食材", "原料", "材料", "佐料"}
+ITEM_SEPARATORS = re.compile(r"[、，,；;]")
+# 用量说明的尾巴: "蒜共 15 克"、"凉皮用量为 300 g"
+NAME_SUFFIX = re.compile(r"(共|各|约|用量为|用量)$")
+NON_INGREDIENTS = {"单人", "作为主食", "作为小食", "其他调料", "其他调味料", "其他配料", "其他肉类", "其他绿叶", "注", "可选", "白", "布"}
+
+
+class Ingredient:
+    """原料: 名称、用量(来自 "计算" 一节,可能为空)、是否可选"""
+    __slots__ = ("name", "quantity", "optional")
+
+    def __init__(self, name: str, quantity: str = "", optional: bool = False):
+        self.name = name
+        self.quantity = quantity
+        self.optional = optional
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "quantity": self.quantity, "optional": self.optional}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Ingredient":
+        return cls(data["name"], data.get("quantity", ""), data.get("optional", False))
+
+
+class RecipeRecord:
+    """
+    结构化菜谱记录,入库时由 parse_recipe 一次生成并随父文档落盘
+    检索、过滤和构建提示词直接读取字段,不再重复扫描Markdown原文
+    """
+    __slots__ = ("parent_id", "name", "category", "difficulty", "source", "content_hash",
+                 "description", "ingredients", "steps", "images")
+
+    def __init__(self, parent_id: str, name: str, category: str, difficulty: str, source: str = "", content_hash: str = "",
+                 description: str = "", ingredients: List[Ingredient] = None, steps: List[str] = None, images: List[str] = None):
+        self.parent_id = parent_id
+        self.name = name
+        self.category = category
+        self.difficulty = difficulty
+        self.source = source
+        self.content_hash = content_hash
+        self.description = description
+        self.ingredients = ingredients or []
+        self.steps = steps or []
+        self.images = images or []
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {slot: getattr(self, slot) for slot in self.__slots__}
+        data["ingredients"] = [ingredient.to_dict() for ingredient in self.ingredients]
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RecipeRecord":
+        data = dict(data)
+        data["ingredients"] = [Ingredient.from_dict(item) for item in data.get("ingredients", [])]
+        return cls(**data)
+
+    def to_prompt(self) -> str:
+        """紧凑的提示词文本: 原料与用量、编号步骤"""
+        ingredients = "、".join(
+            f"{item.name}{f'（{item.quantity}）' if item.quantity else ''}{'（可选）' if item.optional else ''}"
+            for item in self.ingredients
+        )
+        steps = "\n".join(f"{i + 1}. {step}" for i, step in enumerate(self.steps))
+        parts = [f"菜名: {self.name}, 分类: {self.category}, 难度: {self.difficulty}"]
+        if self.description:
+            parts.append(f"简介: {self.description}")
+        if ingredients:
+            parts.append(f"原料: {ingredients}")
+        if steps:
+            parts.append(f"步骤:\n{steps}")
+        return "\n".join(parts)
+
+
+def line_ingredients(line: str) -> List[Tuple[str, str, bool]]:
+    """
+    从原料列表行中提取 (原料名, 用量, 是否可选)
+    只取每一项开头的汉字部分作为原料名,其后的文字作为用量;"可选" 按项判断
+    """
+    line = line.strip()
+    if not line.startswith(("*", "-")):
+        return []
+    body = line.lstrip("*- ")
+    labeled = LABELED_LINE.match(body)
+    items = ITEM_SEPARATORS.split(labeled.group(2)) if labeled and labeled.group(1) in LABELS else [body]
+    results = []
+    for item in items:
+        item = item.strip().replace("`", "")
+        match = LEADING_CJK.match(item)
+        if not match:
+            continue
+        quantity = item[match.end():].strip().lstrip("=：:").strip()
+        for part in INGREDIENT_SEPARATORS.split(match.group()):
+            name = NAME_SUFFIX.sub("", part)
+            if NAME_TERM.match(name) and name not in NON_INGREDIENTS and not name.endswith("时间"):
+                results.append((name, quantity, "可选" in item))
+    return results
+
+
+def parse_recipe(content: str, source: str, parent_id: str = "", content_hash: str = "",
+                 categories: Optional[Dict[str, str]] = None) -> RecipeRecord:
+    """
+    单遍扫描菜谱Markdown,生成结构化记录
+    Args:
+        content: Markdown原文
+        source: 文件路径,文件名为菜名,目录名对应分类
+        categories: 目录名 -> 分类名
+    """
+    path = Path(source)
+    category = next((value for key, value in (categories or {}).items() if key in path.parts), "其他")
+    difficulty = "未知"
+    description: List[str] = []
+    ingredients: Dict[str, Ingredient] = {}
+    steps: List[str] = []
+    images: List[str] = []
+    section = None
+    for line in content.splitlines():
+        images.extend(IMAGE_REF.findall(line))
+        if line.startswith("# "):
+            continue
+        if line.startswith("## "):
+            section = line[3:].strip()
+            continue
+        if section is None:
+            stars = DIFFICULTY_LINE.search(line)
+            if stars:
+                difficulty = DIFFICULTY_BY_STARS.get(len(stars.group(1)), "未知")
+            elif line.strip() and not IMAGE_REF.search(line):
+                description.append(line.strip())
+        elif section in INGREDIENT_SECTIONS:
+            for name, quantity, optional in line_ingredients(line):
+                ingredient = ingredients.setdefault(name, Ingredient(name))
+                ingredient.optional = ingredient.optional or optional
+                # 用量以 "计算" 一节为准
+                if quantity and (section == QUANTITY_SECTION or not ingredient.quantity):
+                    ingredient.quantity = quantity
+        elif section == STEP_SECTION:
+            item = LIST_ITEM.match(line)
+            if item and item.group(2):
+                text = IMAGE_REF.sub("", item.group(2)).strip()
+                # 缩进的子项并入上一步
+                if item.group(1) and steps:
+                    steps[-1] = f"{steps[-1]}；{text}" if text else steps[-1]
+                elif text:
+                    steps.append(text)
+    return RecipeRecord(
+        parent_id=parent_id,
+        name=path.stem,
+        category=category,
+        difficulty=difficulty,
+        source=str(source),
+        content_hash=content_hash,
+        description=" ".join(description),
+        ingredients=list(ingredients.values()),
+        steps=steps,
+        images=images,
+    )
+
+
+def save_records(path: Union[str, Path], records: List[RecipeRecord]) -> None:
+    """把菜谱记录写入目录下的 records.json(先写临时文件再替换)"""
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    tmp_path = path / (RECORDS_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"format_version": FORMAT_VERSION, "records": [record.to_dict() for record in records]}, f, ensure_ascii=False)
+    os.replace(tmp_path, path / RECORDS_FILE)
+    logger.info(f"菜谱记录保存完成: {len(records)}个, 路径: {path / RECORDS_FILE}")
+
+
+def load_records(path: Union[str, Path]) -> Dict[str, RecipeRecord]:
+    """加载菜谱记录 parent_id -> 记录;不存在或版本不兼容时返回空字典"""
+    records_path = Path(path) / RECORDS_FILE
+    if not records_path.exists():
+        return {}
+    try:
+        with open(records_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format_version") != FORMAT_VERSION:
+            logger.warning(f"菜谱记录版本不兼容: {data.get('format_version')}, 需要重新解析")
+            return {}
+        return {item["parent_id"]: RecipeRecord.from_dict(item) for item in data["records"]}
+    except Exception as e:
+        logger.error(f"菜谱记录加载失败: {records_path} - {e}")
+        return {}
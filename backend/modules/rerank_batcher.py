@@ -0,0 +1,133 @@
+#重排合批模块
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _RerankRequest:
+    """一次调用提交的 (query, passage) 对及其结果"""
+    __slots__ = ("pairs", "future")
+
+    def __init__(self, pairs: List[Sequence[str]]):
+        self.pairs = pairs
+        self.future: Future = Future()
+
+
+class RerankBatcher:
+    """
+    跨请求合批的重排工作线程
+    并发请求提交的 (query, passage) 对先进入队列,工作线程最多等待 max_wait_ms
+    或凑满 max_batch 对后一次前向计算,再把分数按请求拆分返回
+    """
+    def __init__(self, model: Any, max_batch: int = 32, max_wait_ms: float = 5.0):
+        """
+        Args:
+            model: 提供 predict(pairs, batch_size=...) 的重排模型(CrossEncoder)
+            max_batch: 每次前向计算的最大 pair 数
+            max_wait_ms: 收到第一个请求后等待更多请求的最长时间
+        """
+        self.model = model
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: "queue.Queue[Optional[_RerankRequest]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.pending_pairs = 0
+        self.requests = 0
+        self.batches = 0
+        self.batched_pairs = 0
+        self.max_batch_seen = 0
+        self._worker = threading.Thread(target=self._run, name="rerank-batcher", daemon=True)
+        self._worker.start()
+        logger.info(f"重排合批线程启动: max_batch={self.max_batch}, max_wait={max_wait_ms}ms")
+
+    def predict(self, pairs: List[Sequence[str]], timeout: float = None) -> np.ndarray:
+        """提交 (query, passage) 对并等待分数,与 CrossEncoder.predict 的返回一致"""
+        return self.submit(pairs).result(timeout)
+
+    async def apredict(self, pairs: List[Sequence[str]]) -> np.ndarray:
+        """predict 的异步版本"""
+        return await asyncio.wrap_future(self.submit(pairs))
+
+    def submit(self, pairs: List[Sequence[str]]) -> Future:
+        """提交 (query, passage) 对,返回分数的 Future"""
+        request = _RerankRequest(list(pairs))
+        if not request.pairs:
+            request.future.set_result(np.zeros(0, dtype=np.float32))
+            return request.future
+        with self._lock:
+            self.pending_pairs += len(request.pairs)
+            self.requests += 1
+        self._queue.put(request)
+        return request.future
+
+    def _collect(self, first: _RerankRequest) -> List[_RerankRequest]:
+        """以第一个请求为起点,在等待时间内继续收集请求直到凑满一批"""
+        batch = [first]
+        size = len(first.pairs)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # 关闭信号放回队列,处理完当前批次后退出
+                self._queue.put(None)
+                break
+            batch.append(request)
+            size += len(request.pairs)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            pairs = [pair for request in batch for pair in request.pairs]
+            with self._lock:
+                self.pending_pairs -= len(pairs)
+                self.batches += 1
+                self.batched_pairs += len(pairs)
+                self.max_batch_seen = max(self.max_batch_seen, len(pairs))
+            try:
+                start = time.perf_counter()
+                scores = np.asarray(self.model.predict(pairs, batch_size=self.max_batch), dtype=np.float32)
+                logger.debug(f"重排合批: {len(batch)}个请求, {len(pairs)}对, 耗时{(time.perf_counter() - start) * 1000:.1f}ms")
+            except Exception as e:
+                logger.error(f"重排模型计算失败: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            offset = 0
+            for request in batch:
+                request.future.set_result(scores[offset:offset + len(request.pairs)])
+                offset += len(request.pairs)
+
+    def close(self) -> None:
+        """处理完队列中的请求后停止工作线程"""
+        self._queue.put(None)
+        self._worker.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """队列深度与合批统计"""
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "pending_pairs": self.pending_pairs,
+                "requests": self.requests,
+                "batches": self.batches,
+                "avg_batch_pairs": round(self.batched_pairs / self.batches, 2) if self.batches else 0.0,
+                "max_batch_pairs": self.max_batch_seen,
+            }
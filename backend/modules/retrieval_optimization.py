@@ -1,36 +1,92 @@
 #检索优化模块
+import asyncio
 import logging
-from typing import List, Dict, Any
-import jieba
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, List, Dict, Any, Optional, Sequence, Tuple
+import numpy as np
 from langchain_community.vectorstores import FAISS
-from langchain_community.retrievers import BM25Retriever
 from langchain_core.documents import Document
 from sentence_transformers import CrossEncoder  
+from .document_processor import RecipeDocumentProcessor
+from .bm25_index import BM25Index
+from .chunk_store import StoredDocuments
+from .tokenizer import RecipeTokenizer, get_tokenizer
+from .rerank_batcher import RerankBatcher
+from .cache import LRUCache
+from .fusion import BranchResult, fuse, parse_weights
+from .embedding_engine import normalize_query
+from ..config import settings
 logger = logging.getLogger(__name__)
 
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_retrieval_executor() -> ThreadPoolExecutor:
+    """各检索分支共享的有界线程池(进程内单例,热加载的各代引擎共用)"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, settings.RETRIEVAL_MAX_WORKERS), thread_name_prefix="retrieval")
+        return _executor
+
 def chinese_tokenizer(text: str):
-    """中文分词：使用 jieba，把字符串切成 token 列表"""
-    # 去掉多余空白，再用 jieba.lcut 切词
-    return [t.strip() for t in jieba.lcut(text) if t.strip()]
+    """中文分词：使用共享的菜谱分词器，把字符串切成 token 列表"""
+    return get_tokenizer().tokenize(text)
 
 
 class RecipeRetrievalOptimizer:
     """菜谱检索优化器"""
-    def __init__(self, vectorstore: FAISS, chunks: List[Document]):
+    def __init__(self, vectorstore: FAISS, chunks: Sequence[Document], index_builder=None, reranker: CrossEncoder = None,
+                 bm25_index: BM25Index = None, tokenizer: RecipeTokenizer = None, rerank_batcher: RerankBatcher = None,
+                 rerank_cache: LRUCache = None, generation: int = 1):
         self.vectorstore = vectorstore
         self.chunks = chunks
+        # 与BM25建索引时使用同一个分词器实例
+        self.tokenizer = tokenizer or get_tokenizer()
+        # BM25索引的行号与 chunks 的下标一一对应,未提供时由 chunks 现场构建
+        # chunks 为向量索引的子块存储视图时,行号同时也是向量位置
+        self.bm25_index = bm25_index
+        # 提供分面位图过滤检索的索引构建器,为None时退化为先检索后过滤
+        self.index_builder = index_builder
         self.retriever = None
+        # 检索分支: {分支名: 查询 -> [(文档, 分数)]},hybrid_search 并发执行全部分支后融合
+        self.branches: Dict[str, Callable[[str], BranchResult]] = {}
+        # 融合方法与分支权重
+        self.fusion_method = settings.FUSION_METHOD
+        self.fusion_weights = parse_weights(settings.FUSION_WEIGHTS)
+        self._stats_lock = threading.Lock()
+        self.branch_stats: Dict[str, Dict[str, float]] = {}
+        self.cascade_stats: Dict[str, float] = {
+            "requests": 0, "reranked": 0, "early_stop": 0, "fallback_budget": 0, "fallback_error": 0, "returned": 0,
+        }
         self.setup_retriever()
 
-        try:
-            self.reranker = CrossEncoder("BAAI/bge-reranker-base")
-            logger.info("重排模型 BAAI/bge-reranker-base 加载成功")
-        except Exception as e:
-            logger.error(f"重排模型加载失败: {e}")
-            self.reranker = None
-
-
-    def model_rerank(self, query: str, candidates: List[Document], k: int = 5) -> List[Document]:
+        # 热加载新一代索引时复用已加载的重排模型和合批线程
+        self.reranker = reranker
+        self.rerank_batcher = rerank_batcher
+        if self.reranker is None:
+            try:
+                self.reranker = CrossEncoder("BAAI/bge-reranker-base")
+                logger.info("重排模型 BAAI/bge-reranker-base 加载成功")
+            except Exception as e:
+                logger.error(f"重排模型加载失败: {e}")
+                self.reranker = None
+        if self.rerank_batcher is None and self.reranker is not None and settings.RERANK_BATCHING:
+            self.rerank_batcher = RerankBatcher(self.reranker, settings.RERANK_MAX_BATCH, settings.RERANK_MAX_WAIT_MS)
+        # 重排分数缓存,键为 (索引代数, 规范化查询, 子块ID);新一代索引的子块内容可能已变化,切换时清空旧分数
+        self.generation = generation
+        if rerank_cache is None:
+            rerank_cache = LRUCache(max_size=settings.RERANK_CACHE_SIZE, ttl=settings.RERANK_CACHE_TTL)
+        else:
+            rerank_cache.clear()
+        self.rerank_cache = rerank_cache
+
+
+    def model_rerank(self, query: str, candidates: List[Document], k: int = 5, timeout: float = None) -> List[Document]:
         """
         使用重排模型对候选文档进行重排序
 
@@ -38,6 +94,8 @@ class RecipeRetrievalOptimizer:
             query: 用户查询
             candidates: 候选文档列表（来自向量检索 / 混合检索）
             k: 返回前 k 个结果
+            timeout: 等待模型打分的最长秒数，超时抛出 concurrent.futures.TimeoutError；
+                     超时后模型仍会算完并写入分数缓存
 
         Returns:
             重排后的文档列表
@@ -49,11 +107,41 @@ class RecipeRetrievalOptimizer:
         if not candidates:
             return []
 
-        # CrossEncoder 输入为 [query, document] 对
-        model_inputs = [[query, doc.page_content] for doc in candidates]
-
-        # 得到每个候选的相关性分数（越大越相关）
-        scores = self.reranker.predict(model_inputs)
+        # 先查分数缓存，只有未命中的候选才送入重排模型
+        normalized_query = normalize_query(query)
+        cache_keys = [
+            (self.generation, normalized_query, doc.metadata.get("chunk_id") or hash(doc.page_content))
+            for doc in candidates
+        ]
+        scores = np.zeros(len(candidates), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(cache_keys):
+            cached = self.rerank_cache.get(key)
+            if cached is None:
+                missing.append(i)
+            else:
+                scores[i] = cached
+
+        if missing:
+            # CrossEncoder 输入为 [query, document] 对
+            model_inputs = [[query, candidates[i].page_content] for i in missing]
+
+            # 得到每个候选的相关性分数（越大越相关）；开启合批时与并发请求合并成一次前向计算
+            if self.rerank_batcher is not None:
+                future = self.rerank_batcher.submit(model_inputs)
+            else:
+                future = get_retrieval_executor().submit(self.reranker.predict, model_inputs)
+            missing_keys = [cache_keys[i] for i in missing]
+
+            def fill_cache(done: Future) -> None:
+                if done.cancelled() or done.exception() is not None:
+                    return
+                for key, score in zip(missing_keys, done.result()):
+                    self.rerank_cache.put(key, float(score))
+
+            future.add_done_callback(fill_cache)
+            for i, score in zip(missing, future.result(timeout)):
+                scores[i] = score
 
         # 把分数附加到文档上，然后排序
         doc_with_scores = []
@@ -68,7 +156,7 @@ class RecipeRetrievalOptimizer:
         reranked_docs = [d for d, _ in doc_with_scores[:k]]
 
         logger.info(
-            f"重排模型完成: 候选 {len(candidates)} 条, 返回前 {len(reranked_docs)} 条"
+            f"重排模型完成: 候选 {len(candidates)} 条, 缓存命中 {len(candidates) - len(missing)} 条, 返回前 {len(reranked_docs)} 条"
         )
         return reranked_docs
 
@@ -84,11 +172,122 @@ class RecipeRetrievalOptimizer:
         )
 
         # BM25检索器
-        self.bm25_retriever = BM25Retriever.from_documents(
-            self.chunks,
-            k=5,
-            preprocess_func = chinese_tokenizer
-        )
+        if self.bm25_index is None:
+            self.bm25_index = BM25Index.build(
+                [chunk.page_content for chunk in self.chunks],
+                [chunk.metadata.get("chunk_id", "") for chunk in self.chunks],
+                self.tokenizer.tokenize,
+                signature=self.tokenizer.signature
+            )
+        if len(self.bm25_index) != len(self.chunks):
+            raise ValueError(f"BM25索引文档数({len(self.bm25_index)})与子块数({len(self.chunks)})不一致")
+        self.branches = {
+            "vector": lambda q: self.vector_search_with_score(q, k=10),
+            "bm25": lambda q: self.bm25_search_with_score(q, k=5),
+        }
+
+    def vector_search_with_score(self, query: str, k: int = 10) -> List[Tuple[Document, float]]:
+        """向量检索,分数为L2距离取负(越大越相似),便于与其他分支的分数一起融合"""
+        return [(doc, -distance) for doc, distance in self.vectorstore.similarity_search_with_score(query, k)]
+
+    def bm25_search(self, query: str, k: int = 5, mask: np.ndarray = None) -> List[Document]:
+        """
+        BM25检索
+        Args:
+            query: 查询文本
+            k: 返回数量
+            mask: 可选的子块布尔掩码,只在为True的子块中检索
+        """
+        return [doc for doc, _ in self.bm25_search_with_score(query, k, mask)]
+
+    def bm25_search_with_score(self, query: str, k: int = 5, mask: np.ndarray = None) -> List[Tuple[Document, float]]:
+        """bm25_search 的带分数版本"""
+        rows, scores = self.bm25_index.search(self.tokenizer.tokenize(query), k, mask=mask)
+        return [(self.chunks[row], float(score)) for row, score in zip(rows, scores)]
+
+    def _record_branch(self, name: str, elapsed_ms: float = 0.0, outcome: str = "ok") -> None:
+        """累计分支耗时与超时/异常次数(超时的分支在后台执行完后仍会记录一次耗时)"""
+        with self._stats_lock:
+            stats = self.branch_stats.setdefault(name, {"calls": 0, "timeouts": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            if outcome == "timeout":
+                stats["timeouts"] += 1
+                return
+            stats["calls"] += 1
+            if outcome == "error":
+                stats["errors"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    def _timed_branch(self, name: str, branch: Callable[[str], BranchResult], query: str) -> BranchResult:
+        """在线程池中执行单个分支并记录耗时,异常时返回空结果"""
+        start = time.perf_counter()
+        try:
+            docs = branch(query)
+            outcome = "ok"
+        except Exception as e:
+            logger.error(f"检索分支 {name} 执行失败: {e}", exc_info=True)
+            docs, outcome = [], "error"
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._record_branch(name, elapsed_ms, outcome)
+        logger.debug(f"检索分支 {name}: {len(docs)}个文档, 耗时{elapsed_ms:.1f}ms")
+        return docs
+
+    def _submit_branches(self, query: str, branches: Dict[str, Callable[[str], BranchResult]]) -> Dict[Future, str]:
+        executor = get_retrieval_executor()
+        return {executor.submit(self._timed_branch, name, branch, query): name for name, branch in branches.items()}
+
+    def _collect_branches(self, futures: Dict[Future, str], done: set, start: float) -> Dict[str, BranchResult]:
+        """收集截止时间内完成的分支结果,未完成的分支取消并计为超时"""
+        results = {}
+        for future, name in futures.items():
+            if future in done:
+                results[name] = future.result()
+            else:
+                future.cancel()
+                self._record_branch(name, outcome="timeout")
+                logger.warning(f"检索分支 {name} 超过截止时间,本次不参与融合")
+        logger.info(f"检索分支完成 {list(results)}/{list(futures.values())}, 总耗时{(time.perf_counter() - start) * 1000:.1f}ms")
+        return results
+
+    def run_branches(self, query: str, branches: Dict[str, Callable[[str], BranchResult]] = None,
+                     deadline_ms: int = None) -> Dict[str, BranchResult]:
+        """
+        在共享线程池中并发执行检索分支
+        Args:
+            query: 查询文本
+            branches: 要执行的分支,默认为全部检索分支
+            deadline_ms: 截止时间(毫秒),默认取配置;到期时只返回已完成的分支,
+                         若一个分支都没完成则继续等待最先完成的那个
+        Returns:
+            {分支名: 文档列表}
+        """
+        start = time.perf_counter()
+        deadline_ms = settings.RETRIEVAL_DEADLINE_MS if deadline_ms is None else deadline_ms
+        futures = self._submit_branches(query, branches or self.branches)
+        done, _ = wait(futures, timeout=deadline_ms / 1000 if deadline_ms > 0 else None)
+        if not done:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        return self._collect_branches(futures, done, start)
+
+    async def arun_branches(self, query: str, branches: Dict[str, Callable[[str], BranchResult]] = None,
+                            deadline_ms: int = None) -> Dict[str, BranchResult]:
+        """run_branches 的异步版本,等待期间不阻塞事件循环"""
+        start = time.perf_counter()
+        deadline_ms = settings.RETRIEVAL_DEADLINE_MS if deadline_ms is None else deadline_ms
+        futures = self._submit_branches(query, branches or self.branches)
+        wrapped = {asyncio.wrap_future(future): future for future in futures}
+        done, _ = await asyncio.wait(wrapped, timeout=deadline_ms / 1000 if deadline_ms > 0 else None)
+        if not done:
+            done, _ = await asyncio.wait(wrapped, return_when=asyncio.FIRST_COMPLETED)
+        return self._collect_branches(futures, {wrapped[task] for task in done}, start)
+
+    def get_branch_stats(self) -> Dict[str, Dict[str, float]]:
+        """各检索分支的调用次数、平均/最大耗时和超时次数"""
+        with self._stats_lock:
+            return {
+                name: {**stats, "avg_ms": round(stats["total_ms"] / max(1, stats["calls"]), 3)}
+                for name, stats in self.branch_stats.items()
+            }
 
     def hybrid_search(self, query: str, k: int = 5) -> List[Document]:
         """
@@ -101,69 +300,89 @@ class RecipeRetrievalOptimizer:
         Returns:
             检索到的文档列表
         """
-        vector_docs = self.vector_retriever.invoke(query)
-        bm25_docs = self.bm25_retriever.invoke(query)
-        reranked_docs = self.rrf_rerank(vector_docs, bm25_docs)
-        return reranked_docs[:k]
+        results = self.run_branches(query)
+        return self.fuse_results(results)[:k]
+
+    async def ahybrid_search(self, query: str, k: int = 5) -> List[Document]:
+        """hybrid_search 的异步版本"""
+        results = await self.arun_branches(query)
+        return self.fuse_results(results)[:k]
 
 
-    def rrf_rerank(self, vector_docs: List[Document], bm25_docs: List[Document], k: int = 60) -> List[Document]:
+    def fuse_results(self, results: Dict[str, BranchResult]) -> List[Document]:
         """
-        使用RRF (Reciprocal Rank Fusion) 算法重排文档
+        按子块ID融合任意数量检索分支的结果,融合方法与分支权重见 FUSION_METHOD / FUSION_WEIGHTS
+        未返回结果的分支(超时或失败)不参与融合
 
         Args:
-            vector_docs: 向量检索结果
-            bm25_docs: BM25检索结果
-            k: RRF参数，用于平滑排名
+            results: {分支名: 该分支的排序结果}
 
         Returns:
-            重排后的文档列表
+            融合排序后的文档列表
         """
-        doc_scores = {}
-        doc_objects = {}
-
-        # 计算向量检索结果的RRF分数
-        for rank, doc in enumerate(vector_docs):
-            # 使用文档内容的哈希作为唯一标识
-            doc_id = hash(doc.page_content)
-            doc_objects[doc_id] = doc
-
-            # RRF公式: 1 / (k + rank)
-            rrf_score = 1.0 / (k + rank + 1)
-            doc_scores[doc_id] = doc_scores.get(doc_id, 0) + rrf_score
-
-            logger.debug(f"向量检索 - 文档{rank+1}: RRF分数 = {rrf_score:.4f}")
-
-        # 计算BM25检索结果的RRF分数
-        for rank, doc in enumerate(bm25_docs):
-            doc_id = hash(doc.page_content)
-            doc_objects[doc_id] = doc
-
-            rrf_score = 1.0 / (k + rank + 1)
-            doc_scores[doc_id] = doc_scores.get(doc_id, 0) + rrf_score
-
-            logger.debug(f"BM25检索 - 文档{rank+1}: RRF分数 = {rrf_score:.4f}")
-
-        # 按最终RRF分数排序
-        sorted_docs = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)
-
-        # 构建最终结果
-        reranked_docs = []
-        for doc_id, final_score in sorted_docs:
-            if doc_id in doc_objects:
-                doc = doc_objects[doc_id]
-                # 将RRF分数添加到文档元数据中
-                doc.metadata['rrf_score'] = final_score
-                reranked_docs.append(doc)
-                logger.debug(f"最终排序 - 文档: {doc.page_content[:50]}... 最终RRF分数: {final_score:.4f}")
-
-        logger.info(f"RRF重排完成: 向量检索{len(vector_docs)}个文档, BM25检索{len(bm25_docs)}个文档, 合并后{len(reranked_docs)}个文档")
-
-        return reranked_docs
+        fused = fuse(results, self.fusion_method, self.fusion_weights, settings.FUSION_RRF_K)
+        for doc, score in fused:
+            # 将融合分数添加到文档元数据中，方便调试
+            doc.metadata["fusion_score"] = score
+        counts = ", ".join(f"{name}{len(docs)}个" for name, docs in results.items())
+        logger.info(f"{self.fusion_method}融合完成: {counts}, 合并后{len(fused)}个文档")
+        return [doc for doc, _ in fused]
+
+    @staticmethod
+    def normalize_filters(filters: Dict[str, Any]) -> Dict[str, Any]:
+        """去掉空条件,并把英文分类名(如 meat_dish)映射为元数据中的中文分类"""
+        mapping = RecipeDocumentProcessor.CATEGORY_MAPPING
+        normalized = {}
+        for key, value in (filters or {}).items():
+            if value is None or value == "" or value == []:
+                continue
+            if key == "category":
+                value = [mapping.get(v, v) for v in value] if isinstance(value, list) else mapping.get(value, value)
+            normalized[key] = value
+        return normalized
+
+    @staticmethod
+    def match_filters(metadata: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+        """判断元数据是否满足全部过滤条件(列表表示取值之一即可)"""
+        for key, value in filters.items():
+            if key not in metadata:
+                return False
+            if isinstance(value, list):
+                if metadata[key] not in value:
+                    return False
+            elif metadata[key] != value:
+                return False
+        return True
+
+    def shares_vector_rows(self) -> bool:
+        """子块是否就是向量索引的子块存储(行号即向量位置)"""
+        return (isinstance(self.chunks, StoredDocuments) and self.index_builder is not None
+                and getattr(self.vectorstore.docstore, "store", None) is self.chunks.store)
+
+    def filter_mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """满足过滤条件的子块掩码(按BM25行号),与向量索引共用存储时直接复用分面位图"""
+        if filters and self.shares_vector_rows() and set(filters) <= set(self.index_builder.FACET_KEYS):
+            return self.index_builder.facet_mask(filters)
+        if isinstance(self.chunks, StoredDocuments):
+            mask = np.ones(len(self.chunks), dtype=bool)
+            for key, value in filters.items():
+                allowed = value if isinstance(value, list) else [value]
+                mask &= np.fromiter((item in allowed for item in self.chunks.column(key)), dtype=bool, count=len(self.chunks))
+            return mask
+        return np.array([self.match_filters(chunk.metadata, filters) for chunk in self.chunks], dtype=bool)
+
+    def filtered_bm25_search_with_score(self, query: str, filters: Dict[str, Any], k: int = 5) -> List[Tuple[Document, float]]:
+        """只在满足过滤条件的子块中做BM25检索"""
+        mask = self.filter_mask(filters)
+        if not mask.any():
+            return []
+        return self.bm25_search_with_score(query, k, mask=mask)
 
     def metadata_filtered_search(self, query: str, filters:Dict[str, Any], k: int = 10) -> List[Document]:
         """
         带元数据过滤的检索
+        分类、难度等分面字段在向量索引和BM25内部过滤,小分类下也能取满k条;
+        其余字段对混合检索结果做后过滤
         
         Args:
             query: 查询文本
@@ -173,33 +392,128 @@ class RecipeRetrievalOptimizer:
         Returns:
             过滤后的文档列表
         """
-        # 先进行混合检索，获取更多候选
-        docs = self.hybrid_search(query, k)
+        filters = self.normalize_filters(filters)
+        facet_keys = self.index_builder.FACET_KEYS if self.index_builder is not None else ()
+        facet_filters = {key: value for key, value in filters.items() if key in facet_keys}
+        if facet_filters:
+            results = self.run_branches(query, branches={
+                "vector": lambda q: [
+                    (doc, -distance)
+                    for doc, distance in self.index_builder.filtered_similarity_search_with_score(q, facet_filters, k=max(k, 10))
+                ],
+                "bm25": lambda q: self.filtered_bm25_search_with_score(q, facet_filters, k=max(k, 5)),
+            })
+            docs = self.fuse_results(results)
+        else:
+            # 先进行混合检索，获取更多候选
+            docs = self.hybrid_search(query, k)
 
         filtered_docs = []
         for doc in docs:
-            match = True
-            for key, value in filters.items():
-                if key in doc.metadata:
-                    if isinstance(value, list):
-                        if doc.metadata[key] not in value:
-                            match = False
-                            break
-                    else:
-                        if doc.metadata[key] != value:
-                            match = False
-                            break
-                else:
-                    match = False
-                    break
-            if match:
+            if self.match_filters(doc.metadata, filters):
                 filtered_docs.append(doc)
                 if len(filtered_docs) >= k:
                     break
+        logger.info(f"过滤检索完成: {filters}, 返回{len(filtered_docs)}个文档")
         return filtered_docs
 
+    def recall_branches(self, k: int) -> Dict[str, Callable[[str], BranchResult]]:
+        """级联召回用的检索分支,每个分支取前k条"""
+        return {
+            "vector": lambda q: self.vector_search_with_score(q, k=k),
+            "bm25": lambda q: self.bm25_search_with_score(q, k=k),
+        }
 
+    def cascade_search(self, query: str, filters: Dict[str, Any] = None, k: int = None) -> List[Document]:
+        """
+        召回-重排级联检索
+        1. 混合召回: 各分支取前 CASCADE_RECALL_K 条,RRF融合
+        2. 精排: RRF顺序的前 CASCADE_RERANK_K 条送入重排模型
+        3. 自适应截断: 相邻重排分数差达到 CASCADE_SCORE_GAP 时提前截断
+        召回后剩余的延迟预算不足、重排超时或失败时退回RRF顺序
 
+        Args:
+            query: 查询文本
+            filters: 元数据过滤条件,为空时做混合检索
+            k: 最多返回数量,默认 CASCADE_FINAL_K
 
-
-
+        Returns:
+            检索到的文档列表
+        """
+        start = time.perf_counter()
+        recall_k = max(settings.CASCADE_RECALL_K, settings.CASCADE_RERANK_K)
+        if filters:
+            candidates = self.metadata_filtered_search(query, filters, k=recall_k)
+        else:
+            candidates = self.fuse_results(self.run_branches(query, branches=self.recall_branches(recall_k)))
+        return self._cascade_rerank(query, candidates, k or settings.CASCADE_FINAL_K, start)
+
+    async def acascade_search(self, query: str, filters: Dict[str, Any] = None, k: int = None) -> List[Document]:
+        """cascade_search 的异步版本,重排阶段在线程中等待模型分数"""
+        start = time.perf_counter()
+        recall_k = max(settings.CASCADE_RECALL_K, settings.CASCADE_RERANK_K)
+        if filters:
+            candidates = await asyncio.to_thread(self.metadata_filtered_search, query, filters, recall_k)
+        else:
+            candidates = self.fuse_results(await self.arun_branches(query, branches=self.recall_branches(recall_k)))
+        return await asyncio.to_thread(self._cascade_rerank, query, candidates, k or settings.CASCADE_FINAL_K, start)
+
+    def _cascade_rerank(self, query: str, candidates: List[Document], k: int, start: float) -> List[Document]:
+        """对召回结果做限时精排和自适应截断,start 为本次请求开始检索的时间"""
+        remaining = settings.CASCADE_BUDGET_MS / 1000 - (time.perf_counter() - start) if settings.CASCADE_BUDGET_MS > 0 else None
+        outcome = "reranked"
+        if not candidates or self.reranker is None:
+            docs = candidates[:k]
+            outcome = "fallback_error" if candidates else "empty"
+        elif remaining is not None and remaining <= 0:
+            docs = candidates[:k]
+            outcome = "fallback_budget"
+        else:
+            head = candidates[:settings.CASCADE_RERANK_K]
+            try:
+                reranked = self.model_rerank(query, head, k=len(head), timeout=remaining)
+                docs = self.adaptive_cutoff(reranked, k)
+                if len(docs) < min(k, len(reranked)):
+                    outcome = "early_stop"
+                elif len(docs) < k:
+                    # 没有断崖且精排条数不足k时,用RRF顺序的后续候选补齐
+                    docs += candidates[len(head):len(head) + k - len(docs)]
+            except FutureTimeoutError:
+                docs = candidates[:k]
+                outcome = "fallback_budget"
+            except Exception as e:
+                logger.error(f"级联重排失败,退回RRF顺序: {e}")
+                docs = candidates[:k]
+                outcome = "fallback_error"
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            stats = self.cascade_stats
+            stats["requests"] += 1
+            stats["returned"] += len(docs)
+            if outcome in ("reranked", "early_stop"):
+                stats["reranked"] += 1
+            if outcome in ("early_stop", "fallback_budget", "fallback_error"):
+                stats[outcome] += 1
+        logger.info(f"级联检索完成: 召回{len(candidates)}个, 结果{outcome}, 返回{len(docs)}个, 耗时{elapsed_ms:.1f}ms")
+        return docs
+
+    @staticmethod
+    def adaptive_cutoff(docs: List[Document], k: int) -> List[Document]:
+        """
+        按重排分数自适应截断: 前 CASCADE_MIN_KEEP 条之后,相邻分数差达到 CASCADE_SCORE_GAP 处即停止,
+        后面的文档与前面相关性差距明显,不再送入上下文
+        """
+        docs = docs[:k]
+        for i in range(max(1, settings.CASCADE_MIN_KEEP), len(docs)):
+            gap = docs[i - 1].metadata["rerank_score"] - docs[i].metadata["rerank_score"]
+            if gap >= settings.CASCADE_SCORE_GAP:
+                return docs[:i]
+        return docs
+
+    def get_cascade_stats(self) -> Dict[str, float]:
+        """级联检索的请求数、精排/提前截断/退回RRF的次数和平均返回条数"""
+        with self._stats_lock:
+            stats = dict(self.cascade_stats)
+        stats["avg_returned"] = round(stats["returned"] / stats["requests"], 2) if stats["requests"] else 0.0
+        return stats
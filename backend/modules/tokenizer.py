@@ -0,0 +1,141 @@
+#分词模块
+import hashlib
+import logging
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import jieba
+from langchain_core.documents import Document
+
+from .recipe_parser import RecipeRecord
+
+logger = logging.getLogger(__name__)
+
+# 菜名: 2-12个汉字; 原料名: 2-6个汉字,且不以数量词开头(排除 "一小把"、"一般一个人可以食用" 之类的说明文字)
+CJK_TERM = re.compile(r"^[\u4e00-\u9fff]{2,12}$")
+INGREDIENT_TERM = re.compile(r"^(?![一二两三四五六七八九十半几每约])[\u4e00-\u9fff]{2,6}$")
+
+
+def extract_recipe_terms(records: List[RecipeRecord]) -> List[str]:
+    """从结构化菜谱记录中提取菜名与原料名,作为自定义词典"""
+    terms = set()
+    for record in records:
+        for candidate in (record.name, record.name.replace("的做法", "")):
+            if CJK_TERM.match(candidate):
+                terms.add(candidate)
+        terms.update(ingredient.name for ingredient in record.ingredients if INGREDIENT_TERM.match(ingredient.name))
+    return sorted(terms)
+
+
+def build_dictionary(terms: List[str], corpus: Iterable[str], cache_dir: str, trim: bool = True) -> Path:
+    """
+    生成菜谱词典文件,词表不变时直接复用
+    - 自定义词: 菜名和原料名,词频取 jieba 建议值,保证能被切成一个整词
+    - trim 为True时只保留默认词典中在语料里出现过的词,前缀词典小一个数量级,加载接近瞬时
+    corpus 只在需要生成词典时才遍历,可以传入惰性的可迭代对象
+    Returns:
+        词典文件路径,文件名包含词表哈希,同时作为分词器签名
+    """
+    cache_path = Path(cache_dir)
+    term_hash = hashlib.md5(f"trim={trim}\n{chr(10).join(terms)}".encode("utf-8")).hexdigest()[:12]
+    dict_path = cache_path / f"recipe_dict.{term_hash}.txt"
+    if dict_path.exists():
+        return dict_path
+    start = time.perf_counter()
+    base = jieba.Tokenizer()
+    base.initialize()
+    if trim:
+        used = set()
+        for text in corpus:
+            used.update(base.cut(text, cut_all=True))
+        words = {word: base.FREQ[word] for word in used if base.FREQ.get(word)}
+    else:
+        words = {word: freq for word, freq in base.FREQ.items() if freq}
+    for term in terms:
+        words[term] = max(words.get(term, 0), base.suggest_freq(term, tune=False))
+    cache_path.mkdir(parents=True, exist_ok=True)
+    for old in cache_path.glob("recipe_dict.*"):
+        old.unlink()
+    tmp_path = dict_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for word, freq in words.items():
+            f.write(f"{word} {freq}\n")
+    tmp_path.replace(dict_path)
+    logger.info(f"菜谱词典生成完成: {len(words)}个词(自定义{len(terms)}个), 耗时{time.perf_counter() - start:.2f}s, 路径: {dict_path}")
+    return dict_path
+
+
+class RecipeTokenizer:
+    """
+    菜谱分词器
+    - 使用独立的 jieba.Tokenizer 实例,前缀词典序列化到 cache_dir,再次启动时直接加载
+    - 使用搜索引擎模式切词: 菜名作为整词保留的同时也输出其中的原料词
+    - 统计分词吞吐
+    """
+    def __init__(self, dictionary: Optional[Path] = None):
+        self.signature = dictionary.stem if dictionary else "jieba-default"
+        self.tokenizer = jieba.Tokenizer(str(dictionary) if dictionary else jieba.DEFAULT_DICT)
+        if dictionary:
+            self.tokenizer.cache_file = str(dictionary.with_suffix(".cache").resolve())
+        start = time.perf_counter()
+        self.tokenizer.initialize()
+        self.load_seconds = time.perf_counter() - start
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.chars = 0
+        self.seconds = 0.0
+        logger.info(f"分词器加载完成: {self.signature}, 词典{len(self.tokenizer.FREQ)}个前缀, 耗时{self.load_seconds * 1000:.0f}ms")
+
+    def tokenize(self, text: str) -> List[str]:
+        """把字符串切成 token 列表,去掉空白 token"""
+        start = time.perf_counter()
+        tokens = [t.strip() for t in self.tokenizer.lcut_for_search(text) if t.strip()]
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.calls += 1
+            self.chars += len(text)
+            self.seconds += elapsed
+        return tokens
+
+    def stats(self) -> Dict[str, Any]:
+        """分词吞吐统计"""
+        with self._lock:
+            return {
+                "signature": self.signature,
+                "load_ms": round(self.load_seconds * 1000, 1),
+                "calls": self.calls,
+                "chars": self.chars,
+                "chars_per_sec": round(self.chars / self.seconds) if self.seconds else 0,
+            }
+
+
+_shared: Optional[RecipeTokenizer] = None
+_shared_lock = threading.Lock()
+
+
+def load_tokenizer(documents: List[Document], records: List[RecipeRecord], cache_dir: str, trim: bool = True) -> RecipeTokenizer:
+    """
+    按菜谱文档加载共享分词器;词典签名与当前共享实例一致时直接复用
+    BM25建索引和查询都使用这里返回的同一个实例
+    """
+    global _shared
+    terms = extract_recipe_terms(records)
+    # 词典已缓存时不读取父文档正文
+    dictionary = build_dictionary(terms, (doc.page_content for doc in documents), cache_dir, trim) if terms else None
+    with _shared_lock:
+        signature = dictionary.stem if dictionary else "jieba-default"
+        if _shared is None or _shared.signature != signature:
+            _shared = RecipeTokenizer(dictionary)
+        return _shared
+
+
+def get_tokenizer() -> RecipeTokenizer:
+    """返回共享分词器,尚未按菜谱加载时使用 jieba 默认词典"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = RecipeTokenizer()
+        return _shared